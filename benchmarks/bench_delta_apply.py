@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+# Compares txdelta window application against the previous implementation,
+# which copied overlapping target ranges one byte at a time, on synthetic
+# run-length windows and on windows resembling edits of real files.
+
+import os
+import sys
+import time
+
+from subvertpy.delta import (
+    DELTA_WINDOW_SIZE,
+    TXDELTA_NEW,
+    TXDELTA_SOURCE,
+    TXDELTA_TARGET,
+    txdelta_apply_ops,
+    )
+
+
+def legacy_txdelta_apply_ops(src_ops, ops, new_data, sview):
+    """The txdelta_apply_ops() implementation from subvertpy 0.9.1."""
+    tview = bytearray()
+    for (action, offset, length) in ops:
+        if action == TXDELTA_SOURCE:
+            tview.extend(sview[offset:offset+length])
+        elif action == TXDELTA_TARGET:
+            for i in range(length):
+                tview.append(tview[offset+i])
+        elif action == TXDELTA_NEW:
+            tview.extend(new_data[offset:offset+length])
+        else:
+            raise Exception("Invalid delta instruction code")
+    return tview
+
+
+def run_length_windows():
+    """Windows that repeat a short pattern, as svndiff does for runs."""
+    windows = []
+    for pattern in (b"\0", b"ab", b"0123456789abcdef"):
+        ops = [(TXDELTA_NEW, 0, len(pattern)),
+               (TXDELTA_TARGET, 0, DELTA_WINDOW_SIZE - len(pattern))]
+        windows.append((b"", ops, pattern))
+    return windows
+
+
+def edit_windows():
+    """Windows that rebuild source files with a few lines changed."""
+    windows = []
+    srcdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                          "subvertpy")
+    for name in sorted(os.listdir(srcdir)):
+        if not name.endswith(".c"):
+            continue
+        with open(os.path.join(srcdir, name), "rb") as f:
+            sview = f.read(DELTA_WINDOW_SIZE)
+        ops = []
+        new_data = bytearray()
+        pos = 0
+        while pos < len(sview):
+            length = min(4000, len(sview) - pos)
+            ops.append((TXDELTA_SOURCE, pos, length))
+            line = b"/* changed line %d */\n" % pos
+            ops.append((TXDELTA_NEW, len(new_data), len(line)))
+            new_data += line
+            # A duplicated block, as produced for copied code
+            ops.append((TXDELTA_TARGET, 0, 200))
+            pos += length
+        windows.append((sview, ops, bytes(new_data)))
+    return windows
+
+
+def bench(name, windows, repeat):
+    for fn in (legacy_txdelta_apply_ops, txdelta_apply_ops):
+        start = time.perf_counter()
+        for i in range(repeat):
+            for (sview, ops, new_data) in windows:
+                fn(len(ops), ops, new_data, sview)
+        duration = time.perf_counter() - start
+        nbytes = repeat * sum(sum(op[2] for op in ops)
+                              for (sview, ops, new_data) in windows)
+        print("%-12s %-26s %8.3f s %10.1f MB/s" % (name, fn.__name__,
+            duration, nbytes / duration / (1024 * 1024)))
+
+
+def main(argv):
+    for (sview, ops, new_data) in run_length_windows() + edit_windows():
+        if (legacy_txdelta_apply_ops(0, ops, new_data, sview) !=
+            txdelta_apply_ops(0, ops, new_data, sview)):
+            raise AssertionError("results differ")
+    bench("run-length", run_length_windows(), 5)
+    bench("edits", edit_windows(), 20)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
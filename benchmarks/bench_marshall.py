@@ -0,0 +1,59 @@
+#!/usr/bin/python3
+# Measures the throughput of the svn_ra protocol decoder on large log-style
+# responses, fed in fixed size chunks as they would arrive from a socket.
+# The time per megabyte should stay flat as the response size grows.
+
+import sys
+import time
+
+from subvertpy.marshall import (
+    Unmarshaller,
+    literal,
+    marshall,
+    unmarshall,
+    )
+
+CHUNK_SIZE = 64 * 1024
+
+
+def log_response(nrevs):
+    """Build a single list item resembling a large log response."""
+    entries = []
+    for revnum in range(nrevs):
+        changes = [[("/trunk/src/file%d.c" % i).encode("ascii"),
+                    literal("M"), []] for i in range(3)]
+        entries.append([changes, revnum, [b"jrandom"],
+                        [b"2013-05-06T12:00:00.000000Z"],
+                        [b"Log message for revision %d" % revnum]])
+    return marshall([literal("success"), entries])
+
+
+def decode_chunked(data):
+    decoder = Unmarshaller()
+    items = []
+    for i in range(0, len(data), CHUNK_SIZE):
+        decoder.feed(memoryview(data)[i:i+CHUNK_SIZE])
+        items.extend(decoder)
+    return items
+
+
+def decode_whole(data):
+    return unmarshall(data)[1]
+
+
+def main(argv):
+    print("%10s %10s %14s %14s" % ("revisions", "size (MB)", "chunked s/MB",
+                                   "whole s/MB"))
+    for nrevs in (5000, 10000, 20000, 40000):
+        data = log_response(nrevs)
+        mb = len(data) / (1024.0 * 1024.0)
+        timings = []
+        for fn in (decode_chunked, decode_whole):
+            start = time.perf_counter()
+            fn(data)
+            timings.append((time.perf_counter() - start) / mb)
+        print("%10d %10.2f %14.4f %14.4f" % ((nrevs, mb) + tuple(timings)))
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+# Compares the svn_ra protocol encoder against the previous implementation,
+# which built every item as a separate bytes object, on a stream of commit
+# editor commands.
+
+import sys
+import time
+
+from subvertpy.marshall import (
+    MarshallError,
+    literal,
+    marshall,
+    marshall_command,
+    marshall_into,
+    )
+
+
+def legacy_marshall(x):
+    """The marshall() implementation from subvertpy 0.9.1."""
+    if isinstance(x, int):
+        return ("%d " % x).encode("ascii")
+    elif isinstance(x, (list, tuple)):
+        return b"( " + bytes().join(map(legacy_marshall, x)) + b") "
+    elif isinstance(x, literal):
+        return ("%s " % x).encode("ascii")
+    elif isinstance(x, bytes):
+        return ("%d:" % len(x)).encode("ascii") + x + b" "
+    elif isinstance(x, str):
+        x = x.encode("utf-8")
+        return ("%d:" % len(x)).encode("ascii") + x + b" "
+    raise MarshallError("Unable to marshall type %s" % x)
+
+
+def editor_commands(nfiles):
+    """Generate the commands an editor sends when adding nfiles files."""
+    chunk = b"x" * 200
+    for i in range(nfiles):
+        token = "c%d" % i
+        yield [literal("add-file"), ["trunk/file%d" % i, "d1", token, []]]
+        yield [literal("apply-textdelta"), [token, []]]
+        yield [literal("textdelta-chunk"), [token, chunk]]
+        yield [literal("textdelta-end"), [token]]
+        yield [literal("close-file"), [token, ["0123456789abcdef"]]]
+
+
+def run_legacy(commands):
+    total = 0
+    for cmd in commands:
+        total += len(legacy_marshall(cmd))
+    return total
+
+
+def run_marshall(commands):
+    total = 0
+    for cmd in commands:
+        total += len(marshall(cmd))
+    return total
+
+
+def run_marshall_into(commands):
+    out = bytearray()
+    total = 0
+    for cmd in commands:
+        marshall_into(cmd, out)
+        total += len(out)
+        del out[:]
+    return total
+
+
+def run_marshall_command(commands):
+    out = bytearray()
+    total = 0
+    for (name, args) in commands:
+        marshall_command(name.txt, args, out)
+        total += len(out)
+        del out[:]
+    return total
+
+
+def main(argv):
+    commands = list(editor_commands(20000))
+    expected = run_legacy(commands)
+    for fn in (run_legacy, run_marshall, run_marshall_into,
+               run_marshall_command):
+        start = time.perf_counter()
+        if fn(commands) != expected:
+            raise AssertionError("%s produced different output" % fn.__name__)
+        duration = time.perf_counter() - start
+        print("%-22s %8.3f s  %10.0f commands/s" % (
+            fn.__name__, duration, len(commands) / duration))
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,150 @@
+#!/usr/bin/python3
+# Multi-threaded RemoteAccess throughput: each thread opens its own session
+# and runs a mix of commands against a local repository, while another
+# thread runs pure Python code to show whether the network threads hold
+# on to the GIL. Uses a file:// repository by default, or svnserve with
+# --svnserve, or an existing repository with --url.
+
+import optparse
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from io import BytesIO
+
+from subvertpy import (
+    delta,
+    ra,
+    repos,
+    )
+
+
+def populate(url, revisions, files):
+    conn = ra.RemoteAccess(url, auth=ra.Auth([ra.get_username_provider()]))
+    for revnum in range(revisions):
+        editor = conn.get_commit_editor({"svn:log": "Revision %d" % revnum})
+        root = editor.open_root()
+        if revnum == 0:
+            trunk = root.add_directory("trunk")
+        else:
+            trunk = root.open_directory("trunk", revnum)
+        for i in range(files):
+            path = "trunk/file%d" % i
+            if revnum == 0:
+                f = trunk.add_file(path)
+            else:
+                f = trunk.open_file(path, revnum)
+            txdelta = f.apply_textdelta()
+            delta.send_stream(
+                BytesIO(b"revision %d of file %d\n" % (revnum, i) * 200),
+                txdelta)
+            f.close()
+        trunk.close()
+        root.close()
+        editor.close()
+
+
+def start_svnserve(root):
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    proc = subprocess.Popen(
+        ["svnserve", "-d", "--foreground", "-r", root,
+         "--listen-host", "127.0.0.1", "--listen-port", str(port)])
+    for i in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            break
+        except socket.error:
+            time.sleep(0.05)
+    return proc, "svn://127.0.0.1:%d/repo" % port
+
+
+def run_commands(url, deadline, counts, files):
+    conn = ra.RemoteAccess(url, auth=ra.Auth([ra.get_username_provider()]))
+    count = 0
+    while time.perf_counter() < deadline:
+        revnum = conn.get_latest_revnum()
+        conn.stat("trunk", revnum)
+        conn.get_dir("trunk", revnum)
+        conn.get_file("trunk/file%d" % (count % files), BytesIO(), revnum)
+        conn.get_log(lambda *args: None, ["trunk"], revnum, 0, 10)
+        count += 5
+    counts.append(count)
+
+
+def spin(stop, counts):
+    count = 0
+    while not stop.is_set():
+        count += 1
+    counts.append(count)
+
+
+def bench(url, threads, duration, files):
+    counts = []
+    spins = []
+    stop = threading.Event()
+    spinner = threading.Thread(target=spin, args=(stop, spins))
+    deadline = time.perf_counter() + duration
+    workers = [threading.Thread(target=run_commands,
+                                args=(url, deadline, counts, files))
+               for i in range(threads)]
+    spinner.start()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    stop.set()
+    spinner.join()
+    return (sum(counts) / duration, spins[0] / duration)
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("--url", help="Existing repository to use")
+    parser.add_option("--svnserve", action="store_true",
+                      help="Serve the repository with svnserve")
+    parser.add_option("--revisions", type=int, default=20,
+                      help="Number of revisions to create")
+    parser.add_option("--files", type=int, default=20,
+                      help="Number of files to create")
+    parser.add_option("--duration", type=float, default=3.0,
+                      help="Seconds to run each measurement")
+    parser.add_option("--threads", default="1,2,4,8",
+                      help="Comma-separated numbers of threads")
+    (opts, args) = parser.parse_args()
+
+    tmpdir = None
+    svnserve = None
+    try:
+        if opts.url:
+            url = opts.url
+        else:
+            tmpdir = tempfile.mkdtemp()
+            path = os.path.join(tmpdir, "repo")
+            repos.create(path)
+            url = "file://%s" % path
+            populate(url, opts.revisions, opts.files)
+            if opts.svnserve:
+                (svnserve, url) = start_svnserve(tmpdir)
+
+        (_, idle_spins) = bench(url, 0, opts.duration, opts.files)
+        print("%s, idle spinner %.0f loops/s" % (url, idle_spins))
+        for threads in [int(n) for n in opts.threads.split(",")]:
+            (ops, spins) = bench(url, threads, opts.duration, opts.files)
+            print("%3d threads %10.0f commands/s  spinner %5.1f%%" % (
+                threads, ops, 100.0 * spins / idle_spins))
+    finally:
+        if svnserve is not None:
+            svnserve.terminate()
+            svnserve.wait()
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+# Load test for the svn:// servers: N clients connect simultaneously and
+# each runs a series of commands against an in-memory backend that
+# simulates slow storage. Compares the sequential TCPSVNServer with the
+# threading and asyncio serving modes.
+
+import asyncio
+import optparse
+import threading
+import time
+
+from subvertpy import NODE_DIR
+from subvertpy.ra_svn import (
+    AsyncSVNServer,
+    SVNClient,
+    TCPSVNServer,
+    ThreadingTCPSVNServer,
+    )
+from subvertpy.server import (
+    ServerBackend,
+    ServerRepositoryBackend,
+    )
+
+
+class SlowRepositoryBackend(ServerRepositoryBackend):
+    """In-memory repository where every lookup takes latency seconds."""
+
+    def __init__(self, latency, revnum=100):
+        self.latency = latency
+        self.revnum = revnum
+
+    def get_uuid(self):
+        return "6987ef2d-cd6b-461f-9991-6f1abef3bd59"
+
+    def get_latest_revnum(self):
+        time.sleep(self.latency)
+        return self.revnum
+
+    def check_path(self, path, revnum):
+        time.sleep(self.latency)
+        return NODE_DIR
+
+    def stat(self, path, revnum):
+        time.sleep(self.latency)
+        return {"name": path, "kind": "dir", "size": 0, "has-props": False,
+                "created-rev": self.revnum}
+
+    def log(self, send_revision, target_path, start_rev, end_rev,
+            changed_paths, strict_node, limit):
+        time.sleep(self.latency)
+        for revno in range(start_rev, end_rev + 1):
+            send_revision(revno, b"author", b"2017-01-01T00:00:00.000000Z",
+                          b"Commit %d" % revno)
+
+
+class SlowBackend(ServerBackend):
+
+    def __init__(self, latency):
+        self.repository = SlowRepositoryBackend(latency)
+
+    def open_repository(self, location):
+        return self.repository, ""
+
+
+def run_client(url, commands, errors):
+    try:
+        client = SVNClient(url)
+        try:
+            for i in range(commands):
+                revnum = client.get_latest_revnum()
+                client.stat("")
+                list(client.log([""], revnum - 10, revnum))
+        finally:
+            client.close()
+    except Exception as e:
+        errors.append(e)
+
+
+def run_clients(url, clients, commands):
+    errors = []
+    threads = [threading.Thread(target=run_client,
+                                args=(url, commands, errors))
+               for i in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    if errors:
+        raise errors[0]
+    return elapsed
+
+
+def bench_socketserver(server_cls, backend, opts, **kwargs):
+    server = server_cls(backend, ("127.0.0.1", 0), **kwargs)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        url = "svn://127.0.0.1:%d/" % server.server_address[1]
+        return run_clients(url, opts.clients, opts.commands)
+    finally:
+        server.shutdown()
+        thread.join()
+        server.server_close()
+
+
+def bench_asyncio(backend, opts):
+    result = []
+    started = threading.Event()
+    stop = threading.Event()
+
+    async def main():
+        server = AsyncSVNServer(backend, max_sessions=opts.max_sessions)
+        await server.start("127.0.0.1", 0)
+        result.append(server.server_address[1])
+        started.set()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, stop.wait)
+        await server.shutdown(timeout=5)
+
+    thread = threading.Thread(target=asyncio.run, args=(main(),))
+    thread.start()
+    started.wait()
+    try:
+        url = "svn://127.0.0.1:%d/" % result[0]
+        return run_clients(url, opts.clients, opts.commands)
+    finally:
+        stop.set()
+        thread.join()
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("--clients", type=int, default=50,
+                      help="Number of simultaneous clients")
+    parser.add_option("--commands", type=int, default=10,
+                      help="Number of command rounds per client")
+    parser.add_option("--latency", type=float, default=0.002,
+                      help="Seconds each backend lookup takes")
+    parser.add_option("--max-sessions", type=int, default=32,
+                      help="Concurrency limit for the concurrent servers")
+    (opts, args) = parser.parse_args()
+
+    backend = SlowBackend(opts.latency)
+    requests = opts.clients * opts.commands * 3
+    print("%d clients, %d commands each, %.1f ms backend latency" % (
+        opts.clients, opts.commands * 3, opts.latency * 1000))
+    results = [
+        ("sequential", bench_socketserver(TCPSVNServer, backend, opts)),
+        ("threading", bench_socketserver(ThreadingTCPSVNServer, backend,
+            opts, max_sessions=opts.max_sessions)),
+        ("asyncio", bench_asyncio(backend, opts)),
+        ]
+    for (name, elapsed) in results:
+        print("%-12s %8.3f s %10.0f commands/s" % (
+            name, elapsed, requests / elapsed))
+
+
+if __name__ == "__main__":
+    main()
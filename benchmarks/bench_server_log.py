@@ -0,0 +1,135 @@
+#!/usr/bin/python3
+# Serves a log of 100k revisions from an in-memory backend and compares
+# the buffered socket I/O of TCPSVNServer with the previous request
+# handler, which read the socket one byte at a time through rfile and
+# wrote every message separately, and backends that report revisions
+# through a callback with ones that yield LogEntry records.
+
+import optparse
+import socketserver
+import threading
+import time
+
+from subvertpy.ra_svn import (
+    SVNClient,
+    SVNServer,
+    TCPSVNServer,
+    _run_session,
+    )
+from subvertpy.server import (
+    LogEntry,
+    ServerBackend,
+    ServerRepositoryBackend,
+    )
+
+
+class MemoryRepositoryBackend(ServerRepositoryBackend):
+
+    def __init__(self, revisions):
+        self.revisions = revisions
+
+    def get_uuid(self):
+        return "6987ef2d-cd6b-461f-9991-6f1abef3bd59"
+
+    def get_latest_revnum(self):
+        return len(self.revisions) - 1
+
+    def log(self, send_revision, target_path, start_rev, end_rev,
+            changed_paths, strict_node, limit):
+        for revno in range(start_rev, end_rev + 1):
+            (author, date, message, paths) = self.revisions[revno]
+            send_revision(revno, author, date, message, paths)
+
+
+class GeneratorRepositoryBackend(MemoryRepositoryBackend):
+
+    def iter_log(self, target_path, start_rev, end_rev, changed_paths,
+                 strict_node, limit, revprops=None):
+        for revno in range(start_rev, end_rev + 1):
+            (author, date, message, paths) = self.revisions[revno]
+            yield LogEntry(revno, author, date, message, paths)
+
+
+class MemoryBackend(ServerBackend):
+
+    def __init__(self, repository):
+        self.repository = repository
+
+    def open_repository(self, location):
+        return self.repository, ""
+
+
+class LegacyRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        server = SVNServer(self.server._backend, self.rfile.read,
+                           self.wfile.write, recv_size=1)
+        server.pipelined = False
+        _run_session(server, self.request, self.server._sessions)
+        self.server.stats.append(server)
+
+
+class StatsRequestHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        sock = self.request
+        server = SVNServer(self.server._backend, sock.recv, sock.send,
+                           recv_into_fn=sock.recv_into)
+        _run_session(server, sock, self.server._sessions)
+        self.server.stats.append(server)
+
+
+def make_revisions(count):
+    revisions = []
+    for revno in range(count):
+        paths = {b"/trunk/file%d" % (revno % 100): ("M", None, -1)}
+        revisions.append((b"user%d" % (revno % 10),
+                          b"2017-01-01T00:00:%02d.000000Z" % (revno % 60),
+                          b"Change number %d\n\nSome more text." % revno,
+                          paths))
+    return revisions
+
+
+def bench(handler_cls, backend, revnum):
+    server = TCPSVNServer(backend, ("127.0.0.1", 0))
+    server.RequestHandlerClass = handler_cls
+    server.stats = []
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        client = SVNClient("svn://127.0.0.1:%d/" % server.server_address[1])
+        start = time.perf_counter()
+        count = 0
+        for entry in client.log([""], 0, revnum):
+            count += 1
+        elapsed = time.perf_counter() - start
+        client.close()
+    finally:
+        server.shutdown()
+        thread.join()
+        server.server_close()
+    assert count == revnum + 1
+    return (elapsed, server.stats[0])
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("--revisions", type=int, default=100000,
+                      help="Number of revisions in the log")
+    (opts, args) = parser.parse_args()
+
+    revisions = make_revisions(opts.revisions)
+    revnum = opts.revisions - 1
+    for (name, handler_cls, repository_cls) in [
+            ("legacy", LegacyRequestHandler, MemoryRepositoryBackend),
+            ("buffered", StatsRequestHandler, MemoryRepositoryBackend),
+            ("generator", StatsRequestHandler, GeneratorRepositoryBackend)]:
+        backend = MemoryBackend(repository_cls(revisions))
+        (elapsed, stats) = bench(handler_cls, backend, revnum)
+        print("%-10s %8.3f s %10.0f revisions/s  %8d reads %8d writes" % (
+            name, elapsed, opts.revisions / elapsed, stats.recv_calls,
+            stats.send_calls))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/python3
+# Compares the encoding throughput and compression ratio of the svndiff
+# versions on windows containing source code and random data.
+
+import os
+import sys
+import time
+
+from subvertpy.delta import (
+    DELTA_WINDOW_SIZE,
+    SVNDIFF_VERSIONS,
+    TXDELTA_NEW,
+    pack_svndiff,
+    )
+
+
+def text_windows():
+    """Full-text windows with the C sources of subvertpy."""
+    srcdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                          "subvertpy")
+    data = bytearray()
+    for name in sorted(os.listdir(srcdir)):
+        if name.endswith(".c"):
+            with open(os.path.join(srcdir, name), "rb") as f:
+                data += f.read()
+    return windows_for(bytes(data))
+
+
+def random_windows():
+    """Full-text windows with incompressible data."""
+    return windows_for(os.urandom(1024 * 1024))
+
+
+def windows_for(data):
+    windows = []
+    for i in range(0, len(data), DELTA_WINDOW_SIZE):
+        chunk = data[i:i+DELTA_WINDOW_SIZE]
+        windows.append((0, 0, len(chunk), 0, [(TXDELTA_NEW, 0, len(chunk))],
+                        chunk))
+    return windows
+
+
+def main(argv):
+    configurations = [(0, {})]
+    for level in (1, 5, 9):
+        configurations.append((1, {"compression_level": level}))
+    if 2 in SVNDIFF_VERSIONS:
+        configurations.append((2, {}))
+    print("%-8s %-8s %-8s %10s %8s" % ("data", "version", "level", "MB/s",
+                                      "ratio"))
+    for (name, windows) in (("text", text_windows()),
+                            ("random", random_windows())):
+        size = sum(w[2] for w in windows)
+        for (version, kwargs) in configurations:
+            start = time.perf_counter()
+            packed = pack_svndiff(windows, version, **kwargs)
+            duration = time.perf_counter() - start
+            print("%-8s %-8d %-8s %10.1f %8.3f" % (name, version,
+                kwargs.get("compression_level", "-"),
+                size / duration / (1024 * 1024), float(len(packed)) / size))
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -68,7 +68,12 @@ ERR_FS_PATH_SYNTAX = 160005
 ERR_RA_DAV_FORBIDDEN = 175013
 ERR_WC_SCHEDULE_CONFLICT = 155013
 ERR_RA_DAV_PROPPATCH_FAILED = 175008
+ERR_SVNDIFF_INVALID_HEADER = 185000
 ERR_SVNDIFF_CORRUPT_WINDOW = 185001
+ERR_SVNDIFF_INVALID_OPS = 185003
+ERR_SVNDIFF_UNEXPECTED_END = 185004
+ERR_SVNDIFF_INVALID_COMPRESSED_DATA = 185005
+ERR_CHECKSUM_MISMATCH = 200014
 ERR_FS_CONFLICT = 160024
 ERR_NODE_UNKNOWN_KIND = 145000
 ERR_RA_SERF_SSL_CERT_UNTRUSTED = 230001
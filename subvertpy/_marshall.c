@@ -0,0 +1,640 @@
+/*
+ * Copyright © 2008 Jelmer Vernooij <jelmer@samba.org>
+ * -*- coding: utf-8 -*-
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU Lesser General Public License as published by
+ * the Free Software Foundation; either version 2.1 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU Lesser General Public License for more details.
+ *
+ * You should have received a copy of the GNU Lesser General Public License
+ * along with this program; if not, write to the Free Software
+ * Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301, USA
+ */
+
+/*
+ * C implementation of the svn_ra protocol marshalling functions in
+ * subvertpy.marshall. The semantics match the pure-Python implementation
+ * exactly; subvertpy.marshall uses these functions when available.
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <string.h>
+
+/* Objects looked up from subvertpy.marshall on first use. The Python module
+ * imports this one, so they can not be looked up at import time. */
+static PyObject *literal_type = NULL;
+static PyObject *marshall_error = NULL;
+static PyObject *need_more_data = NULL;
+static PyObject *incomplete = NULL;
+
+static int load_marshall_objects(void)
+{
+	PyObject *mod;
+
+	if (incomplete != NULL)
+		return 0;
+
+	mod = PyImport_ImportModule("subvertpy.marshall");
+	if (mod == NULL)
+		return -1;
+
+	literal_type = PyObject_GetAttrString(mod, "literal");
+	marshall_error = PyObject_GetAttrString(mod, "MarshallError");
+	need_more_data = PyObject_GetAttrString(mod, "NeedMoreData");
+	incomplete = PyObject_GetAttrString(mod, "_INCOMPLETE");
+	Py_DECREF(mod);
+
+	if (literal_type == NULL || marshall_error == NULL ||
+		need_more_data == NULL || incomplete == NULL) {
+		Py_CLEAR(literal_type);
+		Py_CLEAR(marshall_error);
+		Py_CLEAR(need_more_data);
+		Py_CLEAR(incomplete);
+		return -1;
+	}
+	return 0;
+}
+
+/*
+ * Encoding
+ */
+
+struct outbuf {
+	char *data;
+	Py_ssize_t len;
+	Py_ssize_t alloc;
+};
+
+static int outbuf_reserve(struct outbuf *buf, Py_ssize_t extra)
+{
+	char *data;
+	Py_ssize_t alloc;
+
+	if (buf->len + extra <= buf->alloc)
+		return 0;
+
+	alloc = buf->alloc * 2;
+	if (alloc < buf->len + extra)
+		alloc = buf->len + extra;
+	if (alloc < 256)
+		alloc = 256;
+
+	data = PyMem_Realloc(buf->data, alloc);
+	if (data == NULL) {
+		PyErr_NoMemory();
+		return -1;
+	}
+	buf->data = data;
+	buf->alloc = alloc;
+	return 0;
+}
+
+static int outbuf_append(struct outbuf *buf, const char *data, Py_ssize_t len)
+{
+	if (outbuf_reserve(buf, len) < 0)
+		return -1;
+	memcpy(buf->data + buf->len, data, len);
+	buf->len += len;
+	return 0;
+}
+
+static int outbuf_append_string(struct outbuf *buf, const char *data,
+								Py_ssize_t len)
+{
+	char header[32];
+	int n;
+
+	n = snprintf(header, sizeof(header), "%zd:", len);
+	if (outbuf_reserve(buf, n + len + 1) < 0)
+		return -1;
+	memcpy(buf->data + buf->len, header, n);
+	memcpy(buf->data + buf->len + n, data, len);
+	buf->data[buf->len + n + len] = ' ';
+	buf->len += n + len + 1;
+	return 0;
+}
+
+static int marshall_item(struct outbuf *buf, PyObject *x);
+
+static int marshall_int(struct outbuf *buf, PyObject *x)
+{
+	char text[32];
+	int n, overflow;
+	long long value;
+	PyObject *str, *bytes;
+
+	value = PyLong_AsLongLongAndOverflow(x, &overflow);
+	if (value == -1 && PyErr_Occurred())
+		return -1;
+	if (!overflow) {
+		n = snprintf(text, sizeof(text), "%lld ", value);
+		return outbuf_append(buf, text, n);
+	}
+
+	str = PyObject_Str(x);
+	if (str == NULL)
+		return -1;
+	bytes = PyUnicode_AsASCIIString(str);
+	Py_DECREF(str);
+	if (bytes == NULL)
+		return -1;
+	if (outbuf_append(buf, PyBytes_AS_STRING(bytes),
+					  PyBytes_GET_SIZE(bytes)) < 0 ||
+		outbuf_append(buf, " ", 1) < 0) {
+		Py_DECREF(bytes);
+		return -1;
+	}
+	Py_DECREF(bytes);
+	return 0;
+}
+
+static int marshall_literal(struct outbuf *buf, PyObject *x)
+{
+	PyObject *txt;
+	const char *data;
+	Py_ssize_t len;
+
+	txt = PyObject_GetAttrString(x, "txt");
+	if (txt == NULL)
+		return -1;
+	if (!PyUnicode_Check(txt)) {
+		PyErr_Format(PyExc_AttributeError,
+					 "'%s' object has no attribute 'encode'",
+					 Py_TYPE(txt)->tp_name);
+		Py_DECREF(txt);
+		return -1;
+	}
+	data = PyUnicode_AsUTF8AndSize(txt, &len);
+	if (data == NULL) {
+		Py_DECREF(txt);
+		return -1;
+	}
+	if (!PyUnicode_IS_ASCII(txt)) {
+		/* Raise the same UnicodeEncodeError as str.encode("ascii") */
+		PyObject *bytes = PyUnicode_AsASCIIString(txt);
+		Py_XDECREF(bytes);
+		Py_DECREF(txt);
+		return -1;
+	}
+	if (outbuf_reserve(buf, len + 1) < 0) {
+		Py_DECREF(txt);
+		return -1;
+	}
+	memcpy(buf->data + buf->len, data, len);
+	buf->data[buf->len + len] = ' ';
+	buf->len += len + 1;
+	Py_DECREF(txt);
+	return 0;
+}
+
+static int marshall_sequence(struct outbuf *buf, PyObject *x)
+{
+	PyObject *seq;
+	Py_ssize_t i;
+	int ret = 0;
+
+	seq = PySequence_Fast(x, "expected a list or tuple");
+	if (seq == NULL)
+		return -1;
+
+	if (outbuf_append(buf, "( ", 2) < 0) {
+		Py_DECREF(seq);
+		return -1;
+	}
+	for (i = 0; i < PySequence_Fast_GET_SIZE(seq); i++) {
+		ret = marshall_item(buf, PySequence_Fast_GET_ITEM(seq, i));
+		if (ret < 0)
+			break;
+	}
+	Py_DECREF(seq);
+	if (ret < 0)
+		return -1;
+	return outbuf_append(buf, ") ", 2);
+}
+
+static int marshall_item(struct outbuf *buf, PyObject *x)
+{
+	int ret;
+
+	if (PyLong_Check(x))
+		return marshall_int(buf, x);
+
+	if (PyList_Check(x) || PyTuple_Check(x)) {
+		if (Py_EnterRecursiveCall(" while marshalling"))
+			return -1;
+		ret = marshall_sequence(buf, x);
+		Py_LeaveRecursiveCall();
+		return ret;
+	}
+
+	ret = PyObject_IsInstance(x, literal_type);
+	if (ret == -1)
+		return -1;
+	if (ret)
+		return marshall_literal(buf, x);
+
+	if (PyBytes_Check(x))
+		return outbuf_append_string(buf, PyBytes_AS_STRING(x),
+									PyBytes_GET_SIZE(x));
+
+	if (PyByteArray_Check(x))
+		return outbuf_append_string(buf, PyByteArray_AS_STRING(x),
+									PyByteArray_GET_SIZE(x));
+
+	if (PyMemoryView_Check(x)) {
+		Py_buffer view;
+		if (PyObject_GetBuffer(x, &view, PyBUF_SIMPLE) < 0)
+			return -1;
+		ret = outbuf_append_string(buf, view.buf, view.len);
+		PyBuffer_Release(&view);
+		return ret;
+	}
+
+	if (PyUnicode_Check(x)) {
+		const char *data;
+		Py_ssize_t len;
+		data = PyUnicode_AsUTF8AndSize(x, &len);
+		if (data == NULL)
+			return -1;
+		return outbuf_append_string(buf, data, len);
+	}
+
+	PyErr_Format(marshall_error, "Unable to marshall type %S", x);
+	return -1;
+}
+
+static int bytearray_extend(PyObject *out, struct outbuf *buf)
+{
+	Py_ssize_t len;
+
+	if (!PyByteArray_Check(out)) {
+		PyErr_Format(PyExc_TypeError, "expected bytearray, got %s",
+					 Py_TYPE(out)->tp_name);
+		return -1;
+	}
+	len = PyByteArray_GET_SIZE(out);
+	if (PyByteArray_Resize(out, len + buf->len) < 0)
+		return -1;
+	memcpy(PyByteArray_AS_STRING(out) + len, buf->data, buf->len);
+	return 0;
+}
+
+static PyObject *py_marshall(PyObject *self, PyObject *x)
+{
+	struct outbuf buf = { NULL, 0, 0 };
+	PyObject *ret;
+
+	if (load_marshall_objects() < 0)
+		return NULL;
+
+	if (marshall_item(&buf, x) < 0) {
+		PyMem_Free(buf.data);
+		return NULL;
+	}
+	ret = PyBytes_FromStringAndSize(buf.data, buf.len);
+	PyMem_Free(buf.data);
+	return ret;
+}
+
+static PyObject *py_marshall_into(PyObject *self, PyObject *args)
+{
+	struct outbuf buf = { NULL, 0, 0 };
+	PyObject *x, *out;
+
+	if (!PyArg_ParseTuple(args, "OO:marshall_into", &x, &out))
+		return NULL;
+
+	if (load_marshall_objects() < 0)
+		return NULL;
+
+	if (marshall_item(&buf, x) < 0 || bytearray_extend(out, &buf) < 0) {
+		PyMem_Free(buf.data);
+		return NULL;
+	}
+	PyMem_Free(buf.data);
+	Py_RETURN_NONE;
+}
+
+static PyObject *py_marshall_command(PyObject *self, PyObject *args)
+{
+	struct outbuf buf = { NULL, 0, 0 };
+	PyObject *name, *cmdargs, *out, *seq, *name_bytes;
+	Py_ssize_t i;
+
+	if (!PyArg_ParseTuple(args, "UOO:marshall_command", &name, &cmdargs, &out))
+		return NULL;
+
+	if (load_marshall_objects() < 0)
+		return NULL;
+
+	name_bytes = PyUnicode_AsASCIIString(name);
+	if (name_bytes == NULL)
+		return NULL;
+
+	seq = PySequence_Fast(cmdargs, "expected a sequence of arguments");
+	if (seq == NULL) {
+		Py_DECREF(name_bytes);
+		return NULL;
+	}
+
+	if (outbuf_append(&buf, "( ", 2) < 0 ||
+		outbuf_append(&buf, PyBytes_AS_STRING(name_bytes),
+					  PyBytes_GET_SIZE(name_bytes)) < 0 ||
+		outbuf_append(&buf, " ( ", 3) < 0)
+		goto fail;
+
+	for (i = 0; i < PySequence_Fast_GET_SIZE(seq); i++) {
+		if (marshall_item(&buf, PySequence_Fast_GET_ITEM(seq, i)) < 0)
+			goto fail;
+	}
+
+	if (outbuf_append(&buf, ") ) ", 4) < 0 || bytearray_extend(out, &buf) < 0)
+		goto fail;
+
+	Py_DECREF(seq);
+	Py_DECREF(name_bytes);
+	PyMem_Free(buf.data);
+	Py_RETURN_NONE;
+
+fail:
+	Py_DECREF(seq);
+	Py_DECREF(name_bytes);
+	PyMem_Free(buf.data);
+	return NULL;
+}
+
+/*
+ * Decoding
+ */
+
+#define IS_WHITESPACE(c) ((c) == ' ' || (c) == '\n')
+#define IS_DIGIT(c) ((c) >= '0' && (c) <= '9')
+#define IS_ALPHA(c) (((c) >= 'A' && (c) <= 'Z') || ((c) >= 'a' && (c) <= 'z'))
+
+/* Maximum number of digits that are guaranteed to fit in a long long */
+#define MAX_FAST_DIGITS 18
+
+static PyObject *parse_number(const unsigned char *data, Py_ssize_t len)
+{
+	char *text;
+	PyObject *ret;
+	long long value = 0;
+	Py_ssize_t i;
+
+	if (len <= MAX_FAST_DIGITS) {
+		for (i = 0; i < len; i++)
+			value = value * 10 + (data[i] - '0');
+		return PyLong_FromLongLong(value);
+	}
+
+	text = PyMem_Malloc(len + 1);
+	if (text == NULL)
+		return PyErr_NoMemory();
+	memcpy(text, data, len);
+	text[len] = '\0';
+	ret = PyLong_FromString(text, NULL, 10);
+	PyMem_Free(text);
+	return ret;
+}
+
+/*
+ * Parse the next complete item, with the same semantics as
+ * subvertpy.marshall._parse_item. Returns a new reference to the item,
+ * a new reference to the incomplete marker or NULL on error. *ppos is
+ * updated to the offset to continue parsing at.
+ */
+static PyObject *parse_item(const unsigned char *buf, Py_ssize_t *ppos,
+							Py_ssize_t end, PyObject *stack)
+{
+	Py_ssize_t pos = *ppos;
+	PyObject *item;
+	unsigned char c;
+
+	while (1) {
+		while (pos < end && IS_WHITESPACE(buf[pos]))
+			pos++;
+		if (pos >= end)
+			goto incomplete;
+		c = buf[pos];
+		if (c == '(') {
+			PyObject *list;
+			if (pos + 1 >= end)
+				goto incomplete;
+			if (!IS_WHITESPACE(buf[pos+1])) {
+				PyErr_SetString(marshall_error,
+								"missing whitespace after list start");
+				goto fail;
+			}
+			list = PyList_New(0);
+			if (list == NULL)
+				goto fail;
+			if (PyList_Append(stack, list) < 0) {
+				Py_DECREF(list);
+				goto fail;
+			}
+			Py_DECREF(list);
+			pos += 2;
+			continue;
+		} else if (c == ')') {
+			Py_ssize_t depth = PyList_GET_SIZE(stack);
+			if (depth == 0) {
+				PyErr_SetString(marshall_error, "Unexpected character ')'");
+				goto fail;
+			}
+			if (pos + 1 >= end)
+				goto incomplete;
+			if (!IS_WHITESPACE(buf[pos+1])) {
+				PyErr_Format(marshall_error, "Expected space, got '%c'",
+							 (int)buf[pos+1]);
+				goto fail;
+			}
+			pos += 2;
+			item = PyList_GET_ITEM(stack, depth - 1);
+			Py_INCREF(item);
+			if (PyList_SetSlice(stack, depth - 1, depth, NULL) < 0) {
+				Py_DECREF(item);
+				goto fail;
+			}
+		} else if (IS_DIGIT(c)) {
+			Py_ssize_t digits_end = pos;
+			while (digits_end < end && IS_DIGIT(buf[digits_end]))
+				digits_end++;
+			if (digits_end >= end)
+				goto incomplete;
+			c = buf[digits_end];
+			if (IS_WHITESPACE(c)) {
+				item = parse_number(buf + pos, digits_end - pos);
+				if (item == NULL)
+					goto fail;
+				pos = digits_end + 1;
+			} else if (c == ':') {
+				Py_ssize_t i, num = 0;
+				if (digits_end - pos > MAX_FAST_DIGITS)
+					goto incomplete; /* Can not possibly be buffered */
+				for (i = pos; i < digits_end; i++)
+					num = num * 10 + (buf[i] - '0');
+				if (num > end - (digits_end + 1))
+					goto incomplete;
+				pos = digits_end + 1 + num;
+				item = PyBytes_FromStringAndSize((const char *)buf + digits_end + 1,
+												 num);
+				if (item == NULL)
+					goto fail;
+				if (pos < end && IS_WHITESPACE(buf[pos]))
+					pos++;
+			} else {
+				PyErr_Format(marshall_error,
+							 "Expected whitespace or ':', got '%c'", (int)c);
+				goto fail;
+			}
+		} else if (IS_ALPHA(c)) {
+			Py_ssize_t word_end = pos + 1;
+			while (word_end < end && (IS_ALPHA(buf[word_end]) ||
+					IS_DIGIT(buf[word_end]) || buf[word_end] == '-'))
+				word_end++;
+			if (word_end >= end)
+				goto incomplete;
+			if (!IS_WHITESPACE(buf[word_end])) {
+				PyErr_Format(marshall_error, "Expected whitespace, got '%c'",
+							 (int)buf[word_end]);
+				goto fail;
+			}
+			item = PyUnicode_DecodeASCII((const char *)buf + pos,
+										 word_end - pos, NULL);
+			if (item == NULL)
+				goto fail;
+			pos = word_end + 1;
+		} else {
+			PyErr_Format(marshall_error, "Unexpected character '%c'", (int)c);
+			goto fail;
+		}
+
+		if (PyList_GET_SIZE(stack) == 0) {
+			*ppos = pos;
+			return item;
+		}
+		if (PyList_Append(PyList_GET_ITEM(stack, PyList_GET_SIZE(stack) - 1),
+						  item) < 0) {
+			Py_DECREF(item);
+			goto fail;
+		}
+		Py_DECREF(item);
+	}
+
+incomplete:
+	*ppos = pos;
+	Py_INCREF(incomplete);
+	return incomplete;
+
+fail:
+	return NULL;
+}
+
+static PyObject *py_parse_item(PyObject *self, PyObject *args)
+{
+	PyObject *bufobj, *stack, *item;
+	Py_ssize_t pos, end;
+	Py_buffer view;
+
+	if (!PyArg_ParseTuple(args, "OnnO!:_parse_item", &bufobj, &pos, &end,
+						  &PyList_Type, &stack))
+		return NULL;
+
+	if (load_marshall_objects() < 0)
+		return NULL;
+
+	if (PyObject_GetBuffer(bufobj, &view, PyBUF_SIMPLE) < 0)
+		return NULL;
+
+	if (pos < 0 || end > view.len || pos > end) {
+		PyBuffer_Release(&view);
+		PyErr_SetString(PyExc_ValueError, "invalid buffer offsets");
+		return NULL;
+	}
+
+	item = parse_item(view.buf, &pos, end, stack);
+	PyBuffer_Release(&view);
+	if (item == NULL)
+		return NULL;
+	return Py_BuildValue("(nN)", pos, item);
+}
+
+static PyObject *py_unmarshall(PyObject *self, PyObject *x)
+{
+	PyObject *stack, *item, *rest;
+	Py_ssize_t pos = 0;
+	Py_buffer view;
+
+	if (load_marshall_objects() < 0)
+		return NULL;
+
+	if (PyObject_GetBuffer(x, &view, PyBUF_SIMPLE) < 0)
+		return NULL;
+
+	stack = PyList_New(0);
+	if (stack == NULL) {
+		PyBuffer_Release(&view);
+		return NULL;
+	}
+
+	item = parse_item(view.buf, &pos, view.len, stack);
+	PyBuffer_Release(&view);
+	if (item == NULL) {
+		Py_DECREF(stack);
+		return NULL;
+	}
+	if (item == incomplete) {
+		if (PyList_GET_SIZE(stack) > 0)
+			PyErr_SetString(need_more_data, "List not terminated");
+		else
+			PyErr_SetString(need_more_data, "Not enough data");
+		Py_DECREF(item);
+		Py_DECREF(stack);
+		return NULL;
+	}
+	Py_DECREF(stack);
+
+	rest = PySequence_GetSlice(x, pos, PY_SSIZE_T_MAX);
+	if (rest == NULL) {
+		Py_DECREF(item);
+		return NULL;
+	}
+	return Py_BuildValue("(NN)", rest, item);
+}
+
+static PyMethodDef marshall_module_methods[] = {
+	{ "marshall", (PyCFunction)py_marshall, METH_O,
+		"marshall(x) -> bytes\n\n"
+		"Marshall a Python data item." },
+	{ "marshall_into", (PyCFunction)py_marshall_into, METH_VARARGS,
+		"marshall_into(x, out)\n\n"
+		"Marshall a Python data item, appending the result to a bytearray." },
+	{ "marshall_command", (PyCFunction)py_marshall_command, METH_VARARGS,
+		"marshall_command(name, args, out)\n\n"
+		"Marshall a command, appending the result to a bytearray." },
+	{ "unmarshall", (PyCFunction)py_unmarshall, METH_O,
+		"unmarshall(x) -> (remaining, item)\n\n"
+		"Unmarshall the next item from a buffer." },
+	{ "_parse_item", (PyCFunction)py_parse_item, METH_VARARGS,
+		"_parse_item(buf, pos, end, stack) -> (pos, item)\n\n"
+		"Parse the next complete item from a buffer." },
+	{ NULL, }
+};
+
+static struct PyModuleDef marshall_module = {
+	PyModuleDef_HEAD_INIT, "_marshall",
+	"C implementation of the svn_ra protocol marshalling functions", -1,
+	marshall_module_methods,
+};
+
+PyMODINIT_FUNC PyInit__marshall(void)
+{
+	return PyModule_Create(&marshall_module);
+}
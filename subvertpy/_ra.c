@@ -25,6 +25,8 @@
 #include <svn_props.h>
 #include <apr_file_io.h>
 #include <apr_portable.h>
+#include <apr_atomic.h>
+#include <apr_time.h>
 
 #include <structmember.h>
 
@@ -119,6 +121,11 @@ typedef struct {
 	PyObject *progress_func;
 	AuthObject *auth;
 	bool busy;
+	/* Set from another thread to abort the running operation */
+	volatile apr_uint32_t cancel_requested;
+	/* Set when a callback that can not return an error raised an
+	 * exception */
+	volatile apr_uint32_t callback_failed;
 	PyObject *client_string_func;
 	PyObject *open_tmp_file_func;
 	char *root;
@@ -460,9 +467,28 @@ static bool ra_check_busy(RemoteAccessObject *raobj)
 		return true;
 	}
 	raobj->busy = true;
+	apr_atomic_set32(&raobj->callback_failed, 0);
 	return false;
 }
 
+/* Called very frequently while data is transferred, so it avoids taking
+ * the GIL. Callbacks that report errors themselves don't need to be
+ * checked for here. */
+static svn_error_t *ra_cancel_check(void *baton)
+{
+	RemoteAccessObject *ra = (RemoteAccessObject *)baton;
+
+	if (apr_atomic_read32(&ra->cancel_requested))
+		return svn_error_create(SVN_ERR_CANCELLED, NULL,
+			"Operation cancelled");
+
+	if (apr_atomic_read32(&ra->callback_failed))
+		return svn_error_create(SVN_ERR_CANCELLED, py_svn_error(),
+			"Python exception raised");
+
+	return NULL;
+}
+
 #if ONLY_SINCE_SVN(1, 5)
 static svn_error_t *py_get_client_string(void *baton, const char **name, apr_pool_t *pool)
 {
@@ -555,13 +581,27 @@ fail:
 
 static void py_progress_func(apr_off_t progress, apr_off_t total, void *baton, apr_pool_t *pool)
 {
-	PyGILState_STATE state = PyGILState_Ensure();
 	RemoteAccessObject *ra = (RemoteAccessObject *)baton;
-	PyObject *fn = (PyObject *)ra->progress_func, *ret;
-	if (fn != Py_None) {
-		ret = PyObject_CallFunction(fn, "LL", progress, total);
-		Py_XDECREF(ret);
+	PyGILState_STATE state;
+	PyObject *ret;
+
+	/* Don't take the GIL for every chunk of data if nobody is
+	 * listening. */
+	if (ra->progress_func == Py_None)
+		return;
+
+	state = PyGILState_Ensure();
+	if (ra->progress_func == Py_None) {
+		/* Unset while we were waiting for the GIL */
+		PyGILState_Release(state);
+		return;
 	}
+	ret = PyObject_CallFunction(ra->progress_func, "LL", progress, total);
+	if (ret == NULL) {
+		/* Abort the operation at the next cancellation check */
+		apr_atomic_set32(&ra->callback_failed, 1);
+	}
+	Py_XDECREF(ret);
 	PyGILState_Release(state);
 }
 
@@ -592,6 +632,8 @@ static PyObject *ra_new(PyTypeObject *type, PyObject *args, PyObject *kwargs)
 		return NULL;
 
 	ret->root = NULL;
+	apr_atomic_set32(&ret->cancel_requested, 0);
+	apr_atomic_set32(&ret->callback_failed, 0);
 	ret->pool = Pool(NULL);
 	if (ret->pool == NULL) {
 		Py_DECREF(ret);
@@ -631,7 +673,7 @@ static PyObject *ra_new(PyTypeObject *type, PyObject *args, PyObject *kwargs)
 	callbacks2->progress_func = py_progress_func;
 	callbacks2->auth_baton = auth_baton;
 	callbacks2->open_tmp_file = py_open_tmp_file;
-	callbacks2->cancel_func = py_cancel_check;
+	callbacks2->cancel_func = ra_cancel_check;
 	Py_INCREF(progress_cb);
 	ret->progress_func = progress_cb;
 	callbacks2->progress_baton = (void *)ret;
@@ -643,17 +685,19 @@ static PyObject *ra_new(PyTypeObject *type, PyObject *args, PyObject *kwargs)
 		Py_DECREF(ret);
 		return NULL;
 	}
-	Py_BEGIN_ALLOW_THREADS
-#if ONLY_SINCE_SVN(1, 5)
-	err = svn_ra_open3(&ret->ra, ret->url, uuid,
-			   callbacks2, ret, config_hash, ret->pool);
-#else
+#if ONLY_BEFORE_SVN(1, 5)
 	if (uuid != NULL) {
 		PyErr_SetString(PyExc_TypeError, 
 			"uuid argument not supported with svn 1.4");
 		Py_DECREF(ret);
 		return NULL;
 	}
+#endif
+	Py_BEGIN_ALLOW_THREADS
+#if ONLY_SINCE_SVN(1, 5)
+	err = svn_ra_open3(&ret->ra, ret->url, uuid,
+			   callbacks2, ret, config_hash, ret->pool);
+#else
 	err = svn_ra_open2(&ret->ra, ret->url,
 			   callbacks2, ret, config_hash, ret->pool);
 #endif
@@ -738,6 +782,8 @@ static PyObject *ra_get_latest_revnum(PyObject *self)
 }
 
 
+#include "_ra_log_entry.c"
+
 static bool ra_get_log_prepare(RemoteAccessObject *ra, PyObject *paths,
 bool include_merged_revisions, PyObject *revprops, apr_pool_t **pool,
 apr_array_header_t **apr_paths, apr_array_header_t **apr_revprops)
@@ -808,7 +854,8 @@ fail_busy:
 static PyObject *ra_get_log(PyObject *self, PyObject *args, PyObject *kwargs)
 {
 	char *kwnames[] = { "callback", "paths", "start", "end", "limit",
-		"discover_changed_paths", "strict_node_history", "include_merged_revisions", "revprops", NULL };
+		"discover_changed_paths", "strict_node_history", "include_merged_revisions", "revprops",
+		"entry_type", NULL };
 	PyObject *callback, *paths;
 	svn_revnum_t start = 0, end = 0;
 	int limit = 0; 
@@ -816,14 +863,20 @@ static PyObject *ra_get_log(PyObject *self, PyObject *args, PyObject *kwargs)
 	bool include_merged_revisions = false;
 	RemoteAccessObject *ra = (RemoteAccessObject *)self;
 	PyObject *revprops = Py_None;
+	PyObject *entry_type = Py_None;
+	int compact;
 	apr_pool_t *temp_pool;
 	apr_array_header_t *apr_paths;
 	apr_array_header_t *apr_revprops;
 
-	if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OOll|ibbbO:get_log", kwnames, 
+	if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OOll|ibbbOO:get_log", kwnames, 
 						 &callback, &paths, &start, &end, &limit,
 						 &discover_changed_paths, &strict_node_history,
-						 &include_merged_revisions, &revprops))
+						 &include_merged_revisions, &revprops, &entry_type))
+		return NULL;
+
+	compact = log_entry_type_check(entry_type);
+	if (compact == -1)
 		return NULL;
 
 	if (!ra_get_log_prepare(ra, paths, include_merged_revisions,
@@ -837,7 +890,7 @@ static PyObject *ra_get_log(PyObject *self, PyObject *args, PyObject *kwargs)
 			discover_changed_paths, strict_node_history, 
 			include_merged_revisions,
 			apr_revprops,
-			py_svn_log_entry_receiver, 
+			compact?py_svn_log_entry_object_receiver:py_svn_log_entry_receiver, 
 			callback, temp_pool));
 #else
 	RUN_RA_WITH_POOL(temp_pool, ra, svn_ra_get_log(ra->ra, 
@@ -1142,12 +1195,15 @@ static svn_error_t *py_revstart_cb(svn_revnum_t revision, void *replay_baton,
    const svn_delta_editor_t **editor, void **edit_baton, apr_hash_t *rev_props, apr_pool_t *pool)
 {
 	PyObject *cbs = (PyObject *)replay_baton;
-	PyObject *py_start_fn = PyTuple_GetItem(cbs, 0);
-	PyObject *py_revprops = prop_hash_to_dict(rev_props);
-	PyObject *ret;
+	PyObject *py_start_fn, *py_revprops, *ret;
 	PyGILState_STATE state = PyGILState_Ensure();
 
+	py_start_fn = PyTuple_GetItem(cbs, 0);
+	py_revprops = prop_hash_to_dict(rev_props);
+	CB_CHECK_PYRETVAL(py_revprops);
+
 	ret = PyObject_CallFunction(py_start_fn, "lO", revision, py_revprops);
+	Py_DECREF(py_revprops);
 	CB_CHECK_PYRETVAL(ret);
 
 	*editor = &py_editor;
@@ -1162,12 +1218,15 @@ static svn_error_t *py_revfinish_cb(svn_revnum_t revision, void *replay_baton,
 									apr_hash_t *rev_props, apr_pool_t *pool)
 {
 	PyObject *cbs = (PyObject *)replay_baton;
-	PyObject *py_finish_fn = PyTuple_GetItem(cbs, 1);
-	PyObject *py_revprops = prop_hash_to_dict(rev_props);
-	PyObject *ret;
+	PyObject *py_finish_fn, *py_revprops, *ret;
 	PyGILState_STATE state = PyGILState_Ensure();
 
+	py_finish_fn = PyTuple_GetItem(cbs, 1);
+	py_revprops = prop_hash_to_dict(rev_props);
+	CB_CHECK_PYRETVAL(py_revprops);
+
 	ret = PyObject_CallFunction(py_finish_fn, "lOO", revision, py_revprops, edit_baton);
+	Py_DECREF(py_revprops);
 	CB_CHECK_PYRETVAL(ret);
 
 	Py_DECREF((PyObject *)edit_baton);
@@ -1379,17 +1438,64 @@ static PyObject *ra_change_rev_prop(PyObject *self, PyObject *args)
 }
 
 
+static PyObject *dirents_to_dict(apr_hash_t *dirents,
+								 unsigned int dirent_fields, apr_pool_t *pool)
+{
+	apr_hash_index_t *idx;
+	const char *key;
+	svn_dirent_t *dirent;
+	apr_ssize_t klen;
+	PyObject *py_dirents;
+
+	if (dirents == NULL) {
+		Py_RETURN_NONE;
+	}
+
+	py_dirents = PyDict_New();
+	if (py_dirents == NULL) {
+		return NULL;
+	}
+	idx = apr_hash_first(pool, dirents);
+	while (idx != NULL) {
+		PyObject *item, *pykey;
+		apr_hash_this(idx, (const void **)&key, &klen, (void **)&dirent);
+		item = py_dirent(dirent, dirent_fields);
+		if (item == NULL) {
+			goto fail_dirents;
+		}
+		if (key == NULL) {
+			pykey = Py_None;
+			Py_INCREF(pykey);
+		} else {
+			pykey = PyUnicode_FromString((char *)key);
+			if (pykey == NULL) {
+				Py_DECREF(item);
+				goto fail_dirents;
+			}
+		}
+		if (PyDict_SetItem(py_dirents, pykey, item) != 0) {
+			Py_DECREF(item);
+			Py_DECREF(pykey);
+			goto fail_dirents;
+		}
+		Py_DECREF(pykey);
+		Py_DECREF(item);
+		idx = apr_hash_next(idx);
+	}
+	return py_dirents;
+
+fail_dirents:
+	Py_DECREF(py_dirents);
+	return NULL;
+}
+
 static PyObject *ra_get_dir(PyObject *self, PyObject *args, PyObject *kwargs)
 {
 	apr_pool_t *temp_pool;
 	apr_hash_t *dirents;
-	apr_hash_index_t *idx;
 	apr_hash_t *props;
 	svn_revnum_t fetch_rev;
-	const char *key;
 	RemoteAccessObject *ra = (RemoteAccessObject *)self;
-	svn_dirent_t *dirent;
-	apr_ssize_t klen;
 	char *path;
 	svn_revnum_t revision = -1;
 	unsigned int dirent_fields = 0;
@@ -1416,41 +1522,9 @@ static PyObject *ra_get_dir(PyObject *self, PyObject *args, PyObject *kwargs)
 	RUN_RA_WITH_POOL(temp_pool, ra, svn_ra_get_dir2(ra->ra, &dirents, &fetch_rev, &props,
 					 svn_path_canonicalize(path, temp_pool), revision, dirent_fields, temp_pool));
 
-	if (dirents == NULL) {
-		py_dirents = Py_None;
-		Py_INCREF(py_dirents);
-	} else {
-		py_dirents = PyDict_New();
-		if (py_dirents == NULL) {
-			goto fail;
-		}
-		idx = apr_hash_first(temp_pool, dirents);
-		while (idx != NULL) {
-			PyObject *item, *pykey;
-			apr_hash_this(idx, (const void **)&key, &klen, (void **)&dirent);
-			item = py_dirent(dirent, dirent_fields);
-			if (item == NULL) {
-				goto fail_dirents;
-			}
-			if (key == NULL) {
-				pykey = Py_None;
-				Py_INCREF(pykey);
-			} else {
-				pykey = PyUnicode_FromString((char *)key);
-				if (pykey == NULL) {
-					Py_DECREF(item);
-					goto fail_dirents;
-				}
-			}
-			if (PyDict_SetItem(py_dirents, pykey, item) != 0) {
-				Py_DECREF(item);
-				Py_DECREF(pykey);
-				goto fail_dirents;
-			}
-			Py_DECREF(pykey);
-			Py_DECREF(item);
-			idx = apr_hash_next(idx);
-		}
+	py_dirents = dirents_to_dict(dirents, dirent_fields, temp_pool);
+	if (py_dirents == NULL) {
+		goto fail;
 	}
 
 	py_props = prop_hash_to_dict(props);
@@ -1467,25 +1541,142 @@ fail:
 	return NULL;
 }
 
-static PyObject *ra_get_file(PyObject *self, PyObject *args)
+/* Number of bytes between calls of the get_file progress callback */
+#define GET_FILE_PROGRESS_INTERVAL (1024 * 1024)
+
+/* Destination for get_file. Data is written to target, or copied into
+ * buf if target is NULL. */
+struct file_sink {
+	svn_stream_t *target;
+	char *buf;
+	apr_size_t buf_len;
+	apr_size_t written;
+	PyObject *progress_cb;
+	apr_time_t start;
+	apr_size_t next_report;
+};
+
+/* Called with the GIL held. */
+static bool file_sink_report(struct file_sink *sink)
+{
+	PyObject *ret;
+	double elapsed, rate;
+
+	elapsed = (double)(apr_time_now() - sink->start) / APR_USEC_PER_SEC;
+	rate = elapsed > 0?sink->written / elapsed:0.0;
+	ret = PyObject_CallFunction(sink->progress_cb, "nd",
+								(Py_ssize_t)sink->written, rate);
+	if (ret == NULL)
+		return false;
+	Py_DECREF(ret);
+	sink->next_report = sink->written + GET_FILE_PROGRESS_INTERVAL;
+	return true;
+}
+
+/* Called without the GIL. */
+static svn_error_t *file_sink_write(void *baton, const char *data,
+									apr_size_t *len)
+{
+	struct file_sink *sink = (struct file_sink *)baton;
+
+	if (sink->target != NULL) {
+		SVN_ERR(svn_stream_write(sink->target, data, len));
+	} else {
+		if (*len > sink->buf_len - sink->written)
+			return svn_error_create(APR_ENOSPC, NULL,
+				"Destination buffer is too small");
+		memcpy(sink->buf + sink->written, data, *len);
+	}
+	sink->written += *len;
+
+	if (sink->progress_cb != Py_None && sink->written >= sink->next_report) {
+		PyGILState_STATE state = PyGILState_Ensure();
+		if (!file_sink_report(sink)) {
+			PyGILState_Release(state);
+			return py_svn_error();
+		}
+		PyGILState_Release(state);
+	}
+
+	return NULL;
+}
+
+/**
+ * Fetch a file into a writable buffer if into_buffer is set, or into a
+ * file descriptor, path or file-like object otherwise.
+ *
+ * Returns (fetched_rev, props), plus the number of bytes written when
+ * fetching into a buffer.
+ */
+static PyObject *ra_fetch_file(RemoteAccessObject *ra, char *path,
+							   svn_revnum_t revision, PyObject *py_stream,
+							   PyObject *progress_cb, bool into_buffer)
 {
-	char *path;
-	svn_revnum_t revision = -1;
-	RemoteAccessObject *ra = (RemoteAccessObject *)self;
 	apr_hash_t *props;
 	svn_revnum_t fetch_rev;
-	PyObject *py_stream, *py_props;
+	PyObject *py_props, *py_path = NULL;
 	apr_pool_t *temp_pool;
+	apr_file_t *file = NULL;
+	apr_status_t status;
+	Py_buffer view;
+	bool have_view = false;
+	struct file_sink sink;
+	svn_stream_t *stream;
+	svn_error_t *err;
 
-	if (!PyArg_ParseTuple(args, "sO|l:get_file", &path, &py_stream, &revision))
-		return NULL;
-
+	/* Check before opening the destination, which may truncate a file */
 	if (ra_check_busy(ra))
 		return NULL;
 
 	temp_pool = Pool(NULL);
-	if (temp_pool == NULL)
+	if (temp_pool == NULL) {
+		ra->busy = false;
 		return NULL;
+	}
+
+	memset(&sink, 0, sizeof(sink));
+	sink.progress_cb = progress_cb;
+
+	if (into_buffer) {
+		if (PyObject_GetBuffer(py_stream, &view, PyBUF_WRITABLE) != 0)
+			goto fail;
+		have_view = true;
+		sink.buf = view.buf;
+		sink.buf_len = view.len;
+	} else if (PyLong_Check(py_stream) && !PyBool_Check(py_stream)) {
+		/* File descriptor; the caller keeps ownership */
+		file = apr_file_from_object(py_stream, temp_pool);
+		if (file == NULL)
+			goto fail;
+		sink.target = svn_stream_from_aprfile2(file, TRUE, temp_pool);
+		file = NULL;
+	} else if (PyUnicode_Check(py_stream) || PyBytes_Check(py_stream) ||
+			   PyObject_HasAttrString(py_stream, "__fspath__")) {
+		if (!PyUnicode_FSConverter(py_stream, &py_path))
+			goto fail;
+		status = apr_file_open(&file, PyBytes_AS_STRING(py_path),
+			APR_FOPEN_CREATE | APR_FOPEN_WRITE | APR_FOPEN_TRUNCATE |
+			APR_FOPEN_BINARY | APR_FOPEN_BUFFERED,
+			APR_OS_DEFAULT, temp_pool);
+		Py_DECREF(py_path);
+		if (status != APR_SUCCESS) {
+			PyErr_SetAprStatus(status);
+			goto fail;
+		}
+		sink.target = svn_stream_from_aprfile2(file, TRUE, temp_pool);
+	} else if (PyObject_HasAttrString(py_stream, "write")) {
+		sink.target = new_py_stream(temp_pool, py_stream);
+		if (sink.target == NULL)
+			goto fail;
+	} else {
+		PyErr_Format(PyExc_TypeError,
+			"Expected file object, path or file descriptor, got %s",
+			py_stream->ob_type->tp_name);
+		goto fail;
+	}
+
+	stream = svn_stream_create(&sink, temp_pool);
+	svn_stream_set_write(stream, file_sink_write);
 
 	if (revision != SVN_INVALID_REVNUM)
 		fetch_rev = revision;
@@ -1493,19 +1684,83 @@ static PyObject *ra_get_file(PyObject *self, PyObject *args)
 	/* Yuck. Subversion doesn't like leading slashes.. */
 	while (*path == '/') path++;
 
-	RUN_RA_WITH_POOL(temp_pool, ra, svn_ra_get_file(ra->ra, svn_path_canonicalize(path, temp_pool), revision, 
-													new_py_stream(temp_pool, py_stream), 
-													&fetch_rev, &props, temp_pool));
+	Py_BEGIN_ALLOW_THREADS
+	sink.start = apr_time_now();
+	sink.next_report = GET_FILE_PROGRESS_INTERVAL;
+	err = svn_ra_get_file(ra->ra, svn_path_canonicalize(path, temp_pool),
+						  revision, stream, &fetch_rev, &props, temp_pool);
+	if (err == NULL && file != NULL) {
+		/* Flush and report any errors writing to the file */
+		status = apr_file_close(file);
+		if (status != APR_SUCCESS)
+			err = svn_error_wrap_apr(status, "Unable to write file");
+	}
+	Py_END_ALLOW_THREADS
+	ra->busy = false;
 
-	py_props = prop_hash_to_dict(props);
-	if (py_props == NULL) {
-		apr_pool_destroy(temp_pool);
-		return NULL;
+	/* Report the final size */
+	if (err == NULL && progress_cb != Py_None && !file_sink_report(&sink))
+		goto fail;
+
+	if (have_view) {
+		PyBuffer_Release(&view);
+		have_view = false;
 	}
 
+	if (err != NULL) {
+		handle_svn_error(err);
+		svn_error_clear(err);
+		goto fail;
+	}
+
+	py_props = prop_hash_to_dict(props);
+	if (py_props == NULL)
+		goto fail;
+
 	apr_pool_destroy(temp_pool);
 
+	if (into_buffer)
+		return Py_BuildValue("(lNn)", fetch_rev, py_props,
+							 (Py_ssize_t)sink.written);
 	return Py_BuildValue("(lN)", fetch_rev, py_props);
+
+fail:
+	if (have_view)
+		PyBuffer_Release(&view);
+	apr_pool_destroy(temp_pool);
+	ra->busy = false;
+	return NULL;
+}
+
+static PyObject *ra_get_file(PyObject *self, PyObject *args, PyObject *kwargs)
+{
+	char *path;
+	svn_revnum_t revision = -1;
+	PyObject *py_stream, *progress_cb = Py_None;
+	char *kwnames[] = { "path", "stream", "revnum", "progress_cb", NULL };
+
+	if (!PyArg_ParseTupleAndKeywords(args, kwargs, "sO|lO:get_file", kwnames,
+			&path, &py_stream, &revision, &progress_cb))
+		return NULL;
+
+	return ra_fetch_file((RemoteAccessObject *)self, path, revision,
+						 py_stream, progress_cb, false);
+}
+
+static PyObject *ra_get_file_into(PyObject *self, PyObject *args,
+								  PyObject *kwargs)
+{
+	char *path;
+	svn_revnum_t revision = -1;
+	PyObject *buffer, *progress_cb = Py_None;
+	char *kwnames[] = { "path", "buffer", "revnum", "progress_cb", NULL };
+
+	if (!PyArg_ParseTupleAndKeywords(args, kwargs, "sO|lO:get_file_into",
+			kwnames, &path, &buffer, &revision, &progress_cb))
+		return NULL;
+
+	return ra_fetch_file((RemoteAccessObject *)self, path, revision,
+						 buffer, progress_cb, true);
 }
 
 static PyObject *ra_get_lock(PyObject *self, PyObject *args)
@@ -1584,6 +1839,246 @@ static PyObject *ra_stat(PyObject *self, PyObject *args)
 	return ret;
 }
 
+/* Create a SubversionException for an error that is returned to the
+ * caller rather than raised. */
+static PyObject *ra_error_object(svn_error_t *error)
+{
+	PyObject *cls, *args, *ret;
+
+	args = PyErr_NewSubversionException(error);
+	if (args == NULL)
+		return NULL;
+	cls = (PyObject *)PyErr_GetSubversionExceptionTypeObject();
+	ret = PyObject_CallObject(cls, args);
+	Py_DECREF(cls);
+	Py_DECREF(args);
+	return ret;
+}
+
+static void clear_errors(svn_error_t **errors, int start, int count)
+{
+	int i;
+
+	for (i = start; i < count; i++) {
+		if (errors[i] != NULL)
+			svn_error_clear(errors[i]);
+	}
+}
+
+/* Convert a list of paths for one of the batch operations. Leading
+ * slashes are either stripped, like get_dir does, or rejected, like stat
+ * does. Returns NULL with an exception set if any path is invalid. */
+static apr_array_header_t *ra_batch_paths(PyObject *paths,
+										  bool strip_slashes, apr_pool_t *pool)
+{
+	apr_array_header_t *apr_paths;
+	int i;
+
+	if (!PyList_Check(paths)) {
+		PyErr_SetString(PyExc_TypeError, "paths should be a list of strings");
+		return NULL;
+	}
+	if (!path_list_to_apr_array(pool, paths, &apr_paths))
+		return NULL;
+	for (i = 0; i < apr_paths->nelts; i++) {
+		char *path = APR_ARRAY_IDX(apr_paths, i, char *);
+		if (strip_slashes) {
+			while (*path == '/') path++;
+			APR_ARRAY_IDX(apr_paths, i, char *) = path;
+		} else if (ra_check_svn_path(path)) {
+			return NULL;
+		}
+	}
+	return apr_paths;
+}
+
+/* If the batch was cancelled, raise the error for the whole call. */
+static bool ra_batch_cancelled(svn_error_t **errors, int count)
+{
+	int i;
+
+	for (i = 0; i < count; i++) {
+		if (errors[i] != NULL && errors[i]->apr_err == SVN_ERR_CANCELLED) {
+			handle_svn_error(errors[i]);
+			clear_errors(errors, 0, count);
+			return true;
+		}
+	}
+	return false;
+}
+
+static PyObject *ra_stat_many(PyObject *self, PyObject *args)
+{
+	PyObject *paths, *ret, *item;
+	RemoteAccessObject *ra = (RemoteAccessObject *)self;
+	svn_revnum_t revision;
+	apr_array_header_t *apr_paths;
+	svn_dirent_t **dirents;
+	svn_error_t **errors;
+	apr_pool_t *temp_pool;
+	int i, count;
+
+	if (!PyArg_ParseTuple(args, "Ol:stat_many", &paths, &revision))
+		return NULL;
+
+	temp_pool = Pool(NULL);
+	if (temp_pool == NULL)
+		return NULL;
+
+	apr_paths = ra_batch_paths(paths, false, temp_pool);
+	if (apr_paths == NULL) {
+		apr_pool_destroy(temp_pool);
+		return NULL;
+	}
+
+	if (ra_check_busy(ra)) {
+		apr_pool_destroy(temp_pool);
+		return NULL;
+	}
+
+	count = apr_paths->nelts;
+	dirents = apr_pcalloc(temp_pool, count * sizeof(svn_dirent_t *));
+	errors = apr_pcalloc(temp_pool, count * sizeof(svn_error_t *));
+
+	Py_BEGIN_ALLOW_THREADS
+	for (i = 0; i < count; i++) {
+		errors[i] = svn_ra_stat(ra->ra, APR_ARRAY_IDX(apr_paths, i, const char *),
+								revision, &dirents[i], temp_pool);
+		if (errors[i] != NULL && errors[i]->apr_err == SVN_ERR_CANCELLED)
+			break;
+	}
+	Py_END_ALLOW_THREADS
+	ra->busy = false;
+
+	if (ra_batch_cancelled(errors, count)) {
+		apr_pool_destroy(temp_pool);
+		return NULL;
+	}
+
+	ret = PyList_New(count);
+	if (ret == NULL) {
+		clear_errors(errors, 0, count);
+		apr_pool_destroy(temp_pool);
+		return NULL;
+	}
+
+	for (i = 0; i < count; i++) {
+		if (errors[i] != NULL) {
+			item = ra_error_object(errors[i]);
+			svn_error_clear(errors[i]);
+		} else if (dirents[i] == NULL) {
+			item = Py_None;
+			Py_INCREF(item);
+		} else {
+			item = py_dirent(dirents[i], SVN_DIRENT_ALL);
+		}
+		if (item == NULL) {
+			clear_errors(errors, i + 1, count);
+			Py_DECREF(ret);
+			apr_pool_destroy(temp_pool);
+			return NULL;
+		}
+		PyList_SET_ITEM(ret, i, item);
+	}
+
+	apr_pool_destroy(temp_pool);
+	return ret;
+}
+
+static PyObject *ra_get_dirs(PyObject *self, PyObject *args, PyObject *kwargs)
+{
+	PyObject *paths, *ret, *item, *py_dirents, *py_props;
+	RemoteAccessObject *ra = (RemoteAccessObject *)self;
+	svn_revnum_t revision = -1;
+	unsigned int dirent_fields = 0;
+	apr_array_header_t *apr_paths;
+	apr_hash_t **dirents, **props;
+	svn_revnum_t *fetch_revs;
+	svn_error_t **errors;
+	apr_pool_t *temp_pool;
+	int i, count;
+	char *kwnames[] = { "paths", "revision", "fields", NULL };
+
+	if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|lI:get_dirs", kwnames,
+									 &paths, &revision, &dirent_fields))
+		return NULL;
+
+	temp_pool = Pool(NULL);
+	if (temp_pool == NULL)
+		return NULL;
+
+	apr_paths = ra_batch_paths(paths, true, temp_pool);
+	if (apr_paths == NULL) {
+		apr_pool_destroy(temp_pool);
+		return NULL;
+	}
+
+	if (ra_check_busy(ra)) {
+		apr_pool_destroy(temp_pool);
+		return NULL;
+	}
+
+	count = apr_paths->nelts;
+	dirents = apr_pcalloc(temp_pool, count * sizeof(apr_hash_t *));
+	props = apr_pcalloc(temp_pool, count * sizeof(apr_hash_t *));
+	fetch_revs = apr_pcalloc(temp_pool, count * sizeof(svn_revnum_t));
+	errors = apr_pcalloc(temp_pool, count * sizeof(svn_error_t *));
+
+	Py_BEGIN_ALLOW_THREADS
+	for (i = 0; i < count; i++) {
+		fetch_revs[i] = revision;
+		errors[i] = svn_ra_get_dir2(ra->ra, &dirents[i], &fetch_revs[i],
+									&props[i],
+									APR_ARRAY_IDX(apr_paths, i, const char *),
+									revision, dirent_fields, temp_pool);
+		if (errors[i] != NULL && errors[i]->apr_err == SVN_ERR_CANCELLED)
+			break;
+	}
+	Py_END_ALLOW_THREADS
+	ra->busy = false;
+
+	if (ra_batch_cancelled(errors, count)) {
+		apr_pool_destroy(temp_pool);
+		return NULL;
+	}
+
+	ret = PyList_New(count);
+	if (ret == NULL) {
+		clear_errors(errors, 0, count);
+		apr_pool_destroy(temp_pool);
+		return NULL;
+	}
+
+	for (i = 0; i < count; i++) {
+		if (errors[i] != NULL) {
+			item = ra_error_object(errors[i]);
+			svn_error_clear(errors[i]);
+		} else {
+			item = NULL;
+			py_dirents = dirents_to_dict(dirents[i], dirent_fields, temp_pool);
+			if (py_dirents != NULL) {
+				py_props = prop_hash_to_dict(props[i]);
+				if (py_props == NULL) {
+					Py_DECREF(py_dirents);
+				} else {
+					item = Py_BuildValue("(NlN)", py_dirents, fetch_revs[i],
+										 py_props);
+				}
+			}
+		}
+		if (item == NULL) {
+			clear_errors(errors, i + 1, count);
+			Py_DECREF(ret);
+			apr_pool_destroy(temp_pool);
+			return NULL;
+		}
+		PyList_SET_ITEM(ret, i, item);
+	}
+
+	apr_pool_destroy(temp_pool);
+	return ret;
+}
+
 static PyObject *ra_has_capability(PyObject *self, PyObject *args)
 {
 #if ONLY_SINCE_SVN(1, 5)
@@ -2113,9 +2608,31 @@ static PyMethodDef ra_methods[] = {
 	{ "get_dir", (PyCFunction)ra_get_dir, METH_VARARGS|METH_KEYWORDS, 
 		"S.get_dir(path, revision, dirent_fields=-1) -> (dirents, fetched_rev, properties)\n"
 		"Get the contents of a directory. "},
-	{ "get_file", ra_get_file, METH_VARARGS, 
-		"S.get_file(path, stream, revnum=-1) -> (fetched_rev, properties)\n"
-		"Fetch a file. The contents will be written to stream." },
+	{ "stat_many", ra_stat_many, METH_VARARGS,
+		"S.stat_many(paths, revnum) -> list\n"
+		"Stat several paths with a single call. Returns a list with, for\n"
+		"each path in order, the dirent, None if the path does not exist or\n"
+		"the SubversionException that occurred for that path." },
+	{ "get_dirs", (PyCFunction)ra_get_dirs, METH_VARARGS|METH_KEYWORDS,
+		"S.get_dirs(paths, revision=-1, fields=0) -> list\n"
+		"Get the contents of several directories with a single call.\n"
+		"Returns a list with, for each path in order, a (dirents,\n"
+		"fetched_rev, properties) tuple or the SubversionException that\n"
+		"occurred for that path." },
+	{ "get_file", (PyCFunction)ra_get_file, METH_VARARGS|METH_KEYWORDS, 
+		"S.get_file(path, stream, revnum=-1, progress_cb=None) -> (fetched_rev, properties)\n"
+		"Fetch a file. The contents will be written to stream.\n"
+		"Instead of a file-like object, stream may also be a file descriptor\n"
+		"or a path to (over)write. The data is then written without calling\n"
+		"back into Python.\n"
+		"progress_cb(bytes_written, bytes_per_second) is called for every\n"
+		"megabyte written and once the file is complete." },
+	{ "get_file_into", (PyCFunction)ra_get_file_into, METH_VARARGS|METH_KEYWORDS, 
+		"S.get_file_into(path, buffer, revnum=-1, progress_cb=None) -> (fetched_rev, properties, nbytes)\n"
+		"Fetch a file into a writable buffer, without calling back into Python.\n"
+		"nbytes is the number of bytes written to the start of the buffer.\n"
+		"OSError is raised if the buffer is too small.\n"
+		"progress_cb is called as for get_file()." },
 	{ "change_rev_prop", ra_change_rev_prop, METH_VARARGS, 
 		"S.change_rev_prop(revnum, name, value)\n"
 		"Change a revision property" },
@@ -2151,26 +2668,37 @@ static PyMethodDef ra_methods[] = {
 	{ "get_log", (PyCFunction)ra_get_log, METH_VARARGS|METH_KEYWORDS, 
 		"S.get_log(callback, paths, start, end, limit=0, "
 		"discover_changed_paths=False, strict_node_history=True, "
-		"include_merged_revisions=False, revprops=None)\n"
+		"include_merged_revisions=False, revprops=None, entry_type=None)\n"
 		"The callback is passed three or four arguments:\n"
 		"callback(changed_paths, revision, revprops[, has_children])\n"
 		"The changed_paths argument may be None, or a dictionary mapping each\n"
 		"path to a tuple:\n"
 		"(action, from_path, from_rev)\n"
+		"If entry_type is LogEntry, the callback is passed a single LogEntry\n"
+		"object instead, which only converts the changed paths and revision\n"
+		"properties to Python objects when they are accessed.\n"
 	},
 	{ "iter_log", (PyCFunction)ra_iter_log, METH_VARARGS|METH_KEYWORDS, 
 		"S.iter_log(paths, start, end, limit=0, "
 		"discover_changed_paths=False, strict_node_history=True, "
-		"include_merged_revisions=False, revprops=None)\n"
+		"include_merged_revisions=False, revprops=None, max_queue_size=1024, "
+		"entry_type=None)\n"
 		"Yields tuples of three or four elements:\n"
 		"(changed_paths, revision, revprops[, has_children])\n"
 		"The changed_paths element may be None, or a dictionary mapping each\n"
 		"path to a tuple:\n"
 		"(action, from_path, from_rev, node_kind)\n"
+		"If entry_type is LogEntry, LogEntry objects are yielded instead.\n"
 		"This method collects the log entries in another thread. Before calling\n"
 		"any further methods, make sure the thread has completed by running the\n"
 		"iterator to exhaustion (i.e. until StopIteration is raised, the \"for\"\n"
 		"loop finishes, etc).\n"
+		"Alternatively, call close() on the iterator or use it as a context\n"
+		"manager to cancel the thread and release the session early.\n"
+		"At most max_queue_size entries are fetched ahead of the consumer;\n"
+		"0 means no limit. The iterator's queue_size, producer_stall_time\n"
+		"and consumer_stall_time attributes show how often either side had\n"
+		"to wait.\n"
 	},
 	{ "get_latest_revnum", (PyCFunction)ra_get_latest_revnum, METH_NOARGS, 
 		"S.get_latest_revnum() -> int\n"
@@ -3377,6 +3905,9 @@ PyMODINIT_FUNC PyInit__ra(void)
 	if (PyType_Ready(&LogIterator_Type) < 0)
 		return mod;
 
+	if (PyType_Ready(&LogEntry_Type) < 0)
+		return mod;
+
 	apr_initialize();
 	pool = Pool(NULL);
 	if (pool == NULL)
@@ -3397,6 +3928,9 @@ PyMODINIT_FUNC PyInit__ra(void)
 	PyModule_AddObject(mod, "Editor", (PyObject *)&Editor_Type);
 	Py_INCREF(&Editor_Type);
 
+	PyModule_AddObject(mod, "LogEntry", (PyObject *)&LogEntry_Type);
+	Py_INCREF(&LogEntry_Type);
+
 	busy_exc = PyErr_NewException("_ra.BusyException", NULL, NULL);
 	PyModule_AddObject(mod, "BusyException", busy_exc);
 
@@ -17,6 +17,13 @@
  * Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301, USA
  */
 #include <pythread.h>
+#include <apr_thread_mutex.h>
+#include <apr_thread_cond.h>
+#include <apr_time.h>
+
+/* Number of log entries the producer thread may queue before it waits
+ * for the consumer to catch up, unless overridden by the caller. */
+#define DEFAULT_LOG_QUEUE_SIZE 1024
 
 struct log_entry {
 	PyObject *tuple;
@@ -30,28 +37,69 @@ typedef struct {
 	svn_boolean_t strict_node_history;
 	svn_boolean_t include_merged_revisions;
 	int limit;
+	/* Whether to queue LogEntry objects rather than tuples */
+	int compact;
 	apr_pool_t *pool;
 	apr_array_header_t *apr_paths;
 	apr_array_header_t *apr_revprops;
 	RemoteAccessObject *ra;
 	svn_boolean_t done;
+	svn_boolean_t cancelled;
 	PyObject *exc_type;
 	PyObject *exc_val;
 	int queue_size;
+	int max_queue_size;
 	struct log_entry *head;
 	struct log_entry *tail;
+	/* Protects the queue, done, cancelled and the statistics below.
+	 * Never acquire the GIL while holding it. */
+	apr_thread_mutex_t *lock;
+	apr_thread_cond_t *not_empty;
+	apr_thread_cond_t *not_full;
+	int producer_stalls;
+	int consumer_stalls;
+	apr_time_t producer_stall_time;
+	apr_time_t consumer_stall_time;
 } LogIteratorObject;
 
-static void log_iter_dealloc(PyObject *self)
+static void log_iter_clear_queue(LogIteratorObject *iter)
 {
-	LogIteratorObject *iter = (LogIteratorObject *)self;
-
 	while (iter->head) {
 		struct log_entry *e = iter->head;
 		Py_DECREF(e->tuple);
 		iter->head = e->next;
 		free(e);
 	}
+	iter->tail = NULL;
+	iter->queue_size = 0;
+}
+
+/* Ask the producer thread to stop and wait until it has finished with
+ * the session. Called with the GIL held. */
+static void log_iter_cancel(LogIteratorObject *iter)
+{
+	Py_BEGIN_ALLOW_THREADS
+	apr_thread_mutex_lock(iter->lock);
+	if (!iter->done) {
+		iter->cancelled = TRUE;
+		apr_atomic_set32(&iter->ra->cancel_requested, 1);
+		apr_thread_cond_broadcast(iter->not_full);
+		while (!iter->done)
+			apr_thread_cond_wait(iter->not_empty, iter->lock);
+	}
+	apr_thread_mutex_unlock(iter->lock);
+	Py_END_ALLOW_THREADS
+}
+
+static void log_iter_dealloc(PyObject *self)
+{
+	LogIteratorObject *iter = (LogIteratorObject *)self;
+
+	/* The producer thread does not own a reference, so make sure it
+	 * is gone before freeing the state it uses. */
+	if (iter->lock != NULL)
+		log_iter_cancel(iter);
+	log_iter_clear_queue(iter);
 	Py_XDECREF(iter->exc_type);
 	Py_XDECREF(iter->exc_val);
 	apr_pool_destroy(iter->pool);
@@ -63,56 +111,167 @@ static PyObject *log_iter_next(LogIteratorObject *iter)
 {
 	struct log_entry *first;
 	PyObject *ret;
-	Py_INCREF(iter);
+	apr_time_t start;
+
+	Py_BEGIN_ALLOW_THREADS
+	apr_thread_mutex_lock(iter->lock);
+	if (iter->head == NULL && !iter->done) {
+		iter->consumer_stalls++;
+		start = apr_time_now();
+		while (iter->head == NULL && !iter->done)
+			apr_thread_cond_wait(iter->not_empty, iter->lock);
+		iter->consumer_stall_time += apr_time_now() - start;
+	}
+	first = iter->head;
+	if (first != NULL) {
+		iter->head = first->next;
+		if (first == iter->tail)
+			iter->tail = NULL;
+		iter->queue_size--;
+		apr_thread_cond_signal(iter->not_full);
+	}
+	apr_thread_mutex_unlock(iter->lock);
+	Py_END_ALLOW_THREADS
 
-	while (iter->head == NULL) {
+	if (first == NULL) {
 		/* Done, raise exception */
-		if (iter->exc_type != NULL) {
-			PyErr_SetObject(iter->exc_type, iter->exc_val);
-			Py_DECREF(iter);
-			return NULL;
-		} else {
-			Py_BEGIN_ALLOW_THREADS
-			/* FIXME: Don't waste cycles */
-			Py_END_ALLOW_THREADS
-		}
+		PyErr_SetObject(iter->exc_type, iter->exc_val);
+		return NULL;
 	}
-	first = iter->head;
-	ret = iter->head->tuple;
-	iter->head = first->next;
-	if (first == iter->tail)
-		iter->tail = NULL;
+	ret = first->tuple;
 	free(first);
-	iter->queue_size--;
-	Py_DECREF(iter);
 	return ret;
 }
 
-static PyObject *py_iter_append(LogIteratorObject *iter, PyObject *tuple)
+/* Called by the producer thread with the GIL held. Blocks while the queue
+ * is full, with the GIL released. Steals the reference to tuple. */
+static svn_error_t *py_iter_append(LogIteratorObject *iter, PyObject *tuple)
 {
 	struct log_entry *entry;
+	svn_boolean_t cancelled;
+	apr_time_t start;
 
 	entry = calloc(sizeof(struct log_entry), 1);
 	if (entry == NULL) {
+		Py_DECREF(tuple);
 		PyErr_NoMemory();
-		return NULL;
+		return py_svn_error();
 	}
 
 	entry->tuple = tuple;
-	if (iter->tail == NULL) {
-		iter->tail = entry;
-	} else {
-		iter->tail->next = entry;
-		iter->tail = entry;
+
+	Py_BEGIN_ALLOW_THREADS
+	apr_thread_mutex_lock(iter->lock);
+	if (iter->max_queue_size > 0 && !iter->cancelled &&
+		iter->queue_size >= iter->max_queue_size) {
+		iter->producer_stalls++;
+		start = apr_time_now();
+		while (iter->queue_size >= iter->max_queue_size && !iter->cancelled)
+			apr_thread_cond_wait(iter->not_full, iter->lock);
+		iter->producer_stall_time += apr_time_now() - start;
 	}
-	if (iter->head == NULL)
-		iter->head = entry;
+	cancelled = iter->cancelled;
+	if (!cancelled) {
+		if (iter->tail == NULL) {
+			iter->tail = entry;
+		} else {
+			iter->tail->next = entry;
+			iter->tail = entry;
+		}
+		if (iter->head == NULL)
+			iter->head = entry;
 
-	iter->queue_size++;
+		iter->queue_size++;
+		apr_thread_cond_signal(iter->not_empty);
+	}
+	apr_thread_mutex_unlock(iter->lock);
+	Py_END_ALLOW_THREADS
+
+	if (cancelled) {
+		Py_DECREF(tuple);
+		free(entry);
+		return svn_error_create(SVN_ERR_CANCELLED, NULL,
+			"Log iterator closed");
+	}
+
+	return NULL;
+}
+
+static PyObject *log_iter_close(PyObject *self)
+{
+	LogIteratorObject *iter = (LogIteratorObject *)self;
+
+	log_iter_cancel(iter);
+	log_iter_clear_queue(iter);
 
 	Py_RETURN_NONE;
 }
 
+static PyObject *log_iter_enter(PyObject *self)
+{
+	Py_INCREF(self);
+	return self;
+}
+
+static PyObject *log_iter_exit(PyObject *self, PyObject *args)
+{
+	PyObject *ret;
+
+	ret = log_iter_close(self);
+	if (ret == NULL)
+		return NULL;
+	Py_DECREF(ret);
+
+	Py_RETURN_FALSE;
+}
+
+static PyMethodDef log_iter_methods[] = {
+	{ "close", (PyCFunction)log_iter_close, METH_NOARGS,
+		"S.close()\n"
+		"Stop retrieving log entries and release the session. Any entries\n"
+		"that have not been consumed yet are discarded." },
+	{ "__enter__", (PyCFunction)log_iter_enter, METH_NOARGS, NULL },
+	{ "__exit__", (PyCFunction)log_iter_exit, METH_VARARGS, NULL },
+	{ NULL, }
+};
+
+static PyObject *log_iter_get_stall_time(PyObject *self, void *closure)
+{
+	LogIteratorObject *iter = (LogIteratorObject *)self;
+	apr_time_t stall_time;
+
+	apr_thread_mutex_lock(iter->lock);
+	if (closure == NULL)
+		stall_time = iter->producer_stall_time;
+	else
+		stall_time = iter->consumer_stall_time;
+	apr_thread_mutex_unlock(iter->lock);
+
+	return PyFloat_FromDouble((double)stall_time / APR_USEC_PER_SEC);
+}
+
+static PyGetSetDef log_iter_getsetters[] = {
+	{ "producer_stall_time", log_iter_get_stall_time, NULL,
+		"Seconds the background thread spent waiting for room in the queue",
+		NULL },
+	{ "consumer_stall_time", log_iter_get_stall_time, NULL,
+		"Seconds spent waiting for the background thread to queue entries",
+		(void *)1 },
+	{ NULL }
+};
+
+static PyMemberDef log_iter_members[] = {
+	{ "queue_size", T_INT, offsetof(LogIteratorObject, queue_size), READONLY,
+		"Number of log entries currently queued" },
+	{ "max_queue_size", T_INT, offsetof(LogIteratorObject, max_queue_size),
+		READONLY, "Maximum number of queued log entries, 0 for no limit" },
+	{ "producer_stalls", T_INT, offsetof(LogIteratorObject, producer_stalls),
+		READONLY, "Number of times the background thread found the queue full" },
+	{ "consumer_stalls", T_INT, offsetof(LogIteratorObject, consumer_stalls),
+		READONLY, "Number of times the queue was empty when an entry was requested" },
+	{ NULL, }
+};
+
 PyTypeObject LogIterator_Type = {
 	PyVarObject_HEAD_INIT(NULL, 0)
 	"_ra.LogIterator", /*	const char *tp_name;  For printing, in format "<module>.<name>" */
@@ -168,18 +327,32 @@ PyTypeObject LogIterator_Type = {
 	/* Iterators */
 	PyObject_SelfIter, /*	getiterfunc tp_iter;	*/
 	(iternextfunc)log_iter_next, /*	iternextfunc tp_iternext;	*/
+	log_iter_methods, /*	struct PyMethodDef *tp_methods;	*/
+	log_iter_members, /*	struct PyMemberDef *tp_members;	*/
+	log_iter_getsetters, /*	struct PyGetSetDef *tp_getset;	*/
 };
 
 #if ONLY_SINCE_SVN(1, 5)
 static svn_error_t *py_iter_log_entry_cb(void *baton, svn_log_entry_t *log_entry, apr_pool_t *pool)
 {
-	PyObject *revprops, *py_changed_paths, *ret, *tuple;
+	PyObject *revprops, *py_changed_paths, *tuple;
 	LogIteratorObject *iter = (LogIteratorObject *)baton;
-
+	svn_error_t *error;
 	PyGILState_STATE state;
 
 	state = PyGILState_Ensure();
 
+	if (iter->compact) {
+		tuple = log_entry_from_svn(log_entry, pool);
+		if (tuple == NULL) {
+			PyGILState_Release(state);
+			return py_svn_error();
+		}
+		error = py_iter_append(iter, tuple);
+		PyGILState_Release(state);
+		return error;
+	}
+
 #if ONLY_SINCE_SVN(1, 6)
 	py_changed_paths = pyify_changed_paths2(log_entry->changed_paths2, pool);
 #else
@@ -206,25 +379,18 @@ static svn_error_t *py_iter_log_entry_cb(void *baton, svn_log_entry_t *log_entry
 		return py_svn_error();
 	}
 
-	ret = py_iter_append(iter, tuple);
-	if (ret == NULL) {
-		Py_DECREF(tuple);
-		PyGILState_Release(state);
-		return py_svn_error();
-	}
-
-	Py_DECREF(ret);
+	error = py_iter_append(iter, tuple);
 
 	PyGILState_Release(state);
 
-	return NULL;
+	return error;
 }
 #else
 static svn_error_t *py_iter_log_cb(void *baton, apr_hash_t *changed_paths, svn_revnum_t revision, const char *author, const char *date, const char *message, apr_pool_t *pool)
 {
-	PyObject *revprops, *py_changed_paths, *ret, *tuple;
+	PyObject *revprops, *py_changed_paths, *tuple;
 	LogIteratorObject *iter = (LogIteratorObject *)baton;
-
+	svn_error_t *error;
 	PyGILState_STATE state;
 
 	state = PyGILState_Ensure();
@@ -238,19 +404,12 @@ static svn_error_t *py_iter_log_cb(void *baton, apr_hash_t *changed_paths, svn_r
 		goto fail_tuple;
 	}
 
-	ret = py_iter_append(iter, tuple);
-
-	if (ret == NULL) {
-		Py_DECREF(tuple);
-		goto fail;
-	}
-
-	Py_DECREF(ret);
+	error = py_iter_append(iter, tuple);
 
 	PyGILState_Release(state);
 
-	return NULL;
-	
+	return error;
+
 fail_tuple:
 	Py_DECREF(revprops);
 	Py_DECREF(py_changed_paths);
@@ -265,6 +424,7 @@ static void py_iter_log(void *baton)
 {
 	LogIteratorObject *iter = (LogIteratorObject *)baton;
 	svn_error_t *error;
+	svn_boolean_t cancelled;
 	PyGILState_STATE state;
 
 #if ONLY_SINCE_SVN(1, 5)
@@ -279,51 +439,84 @@ static void py_iter_log(void *baton)
 			iter->discover_changed_paths, iter->strict_node_history, py_iter_log_cb, 
 			iter, iter->pool);
 #endif
+	apr_thread_mutex_lock(iter->lock);
+	cancelled = iter->cancelled;
+	apr_thread_mutex_unlock(iter->lock);
+
 	state = PyGILState_Ensure();
-	if (error != NULL) {
+	if (error != NULL && !cancelled) {
 		iter->exc_type = (PyObject *)PyErr_GetSubversionExceptionTypeObject();
 		iter->exc_val  = PyErr_NewSubversionException(error);
 		svn_error_clear(error);
 	} else {
+		/* Errors caused by closing the iterator are not reported */
+		svn_error_clear(error);
 		iter->exc_type = PyExc_StopIteration;
 		Py_INCREF(iter->exc_type);
 		iter->exc_val = Py_None;
 		Py_INCREF(iter->exc_val);
 	}
-	iter->done = TRUE;
 	iter->ra->busy = false;
 
-	Py_DECREF(iter);
+	/* The iterator may be freed as soon as done is set and the lock is
+	 * released. */
+	apr_thread_mutex_lock(iter->lock);
+	iter->done = TRUE;
+	apr_atomic_set32(&iter->ra->cancel_requested, 0);
+	apr_thread_cond_broadcast(iter->not_empty);
+	apr_thread_mutex_unlock(iter->lock);
+
 	PyGILState_Release(state);
 }
 
 PyObject *ra_iter_log(PyObject *self, PyObject *args, PyObject *kwargs)
 {
 	char *kwnames[] = { "paths", "start", "end", "limit",
-		"discover_changed_paths", "strict_node_history", "include_merged_revisions", "revprops", NULL };
+		"discover_changed_paths", "strict_node_history", "include_merged_revisions", "revprops",
+		"max_queue_size", "entry_type", NULL };
 	PyObject *paths;
 	svn_revnum_t start = 0, end = 0;
 	int limit=0; 
 	bool discover_changed_paths=false, strict_node_history=true, include_merged_revisions=false;
 	RemoteAccessObject *ra = (RemoteAccessObject *)self;
 	PyObject *revprops = Py_None;
+	int max_queue_size = DEFAULT_LOG_QUEUE_SIZE;
+	PyObject *entry_type = Py_None;
+	int compact;
 	LogIteratorObject *ret;
 	apr_pool_t *pool;
 	apr_array_header_t *apr_paths;
 	apr_array_header_t *apr_revprops;
+	apr_status_t status;
 
-	if (!PyArg_ParseTupleAndKeywords(args, kwargs, "Oll|ibbbO:iter_log", kwnames, 
+	if (!PyArg_ParseTupleAndKeywords(args, kwargs, "Oll|ibbbOiO:iter_log", kwnames, 
 						 &paths, &start, &end, &limit,
 						 &discover_changed_paths, &strict_node_history,
-						 &include_merged_revisions, &revprops))
+						 &include_merged_revisions, &revprops,
+						 &max_queue_size, &entry_type))
 		return NULL;
 
+	compact = log_entry_type_check(entry_type);
+	if (compact == -1)
+		return NULL;
+
+	if (max_queue_size < 0) {
+		PyErr_SetString(PyExc_ValueError,
+			"max_queue_size should not be negative");
+		return NULL;
+	}
+
 	if (!ra_get_log_prepare(ra, paths, include_merged_revisions,
 			revprops, &pool, &apr_paths, &apr_revprops)) {
 		return NULL;
 	}
 
 	ret = PyObject_New(LogIteratorObject, &LogIterator_Type);
+	if (ret == NULL) {
+		apr_pool_destroy(pool);
+		ra->busy = false;
+		return NULL;
+	}
 	ret->ra = ra;
 	Py_INCREF(ret->ra);
 	ret->start = start;
@@ -332,20 +525,50 @@ PyObject *ra_iter_log(PyObject *self, PyObject *args, PyObject *kwargs)
 	ret->discover_changed_paths = discover_changed_paths;
 	ret->end = end;
 	ret->limit = limit;
+	ret->compact = compact;
 	ret->apr_paths = apr_paths;
 	ret->pool = pool;
 	ret->include_merged_revisions = include_merged_revisions;
 	ret->strict_node_history = strict_node_history;
 	ret->apr_revprops = apr_revprops;
-	ret->done = FALSE;
+	ret->done = TRUE;
+	ret->cancelled = FALSE;
+	ret->lock = NULL;
 	ret->queue_size = 0;
+	ret->max_queue_size = max_queue_size;
 	ret->head = NULL;
 	ret->tail = NULL;
+	ret->producer_stalls = 0;
+	ret->consumer_stalls = 0;
+	ret->producer_stall_time = 0;
+	ret->consumer_stall_time = 0;
+
+	/* The lock and conditions are created before the thread starts, so
+	 * the pool is not used concurrently. */
+	status = apr_thread_mutex_create(&ret->lock, APR_THREAD_MUTEX_DEFAULT,
+									 pool);
+	if (status == APR_SUCCESS)
+		status = apr_thread_cond_create(&ret->not_empty, pool);
+	if (status == APR_SUCCESS)
+		status = apr_thread_cond_create(&ret->not_full, pool);
+	if (status != APR_SUCCESS) {
+		PyErr_SetAprStatus(status);
+		ra->busy = false;
+		Py_DECREF(ret);
+		return NULL;
+	}
 
-	Py_INCREF(ret);
-	PyThread_start_new_thread(py_iter_log, ret);
+	/* The thread does not hold a reference; the iterator waits for it to
+	 * finish when it is closed or freed. */
+	ret->done = FALSE;
+	if (PyThread_start_new_thread(py_iter_log, ret) == (unsigned long)-1) {
+		PyErr_SetString(PyExc_RuntimeError,
+			"Unable to start log thread");
+		ret->done = TRUE;
+		ra->busy = false;
+		Py_DECREF(ret);
+		return NULL;
+	}
 
 	return (PyObject *)ret;
 }
-
-
@@ -0,0 +1,499 @@
+/*
+ * Copyright © 2010 Jelmer Vernooij <jelmer@samba.org>
+ * -*- coding: utf-8 -*-
+ *
+ * This program is free software; you can redistribute it and/or modify
+ * it under the terms of the GNU Lesser General Public License as published by
+ * the Free Software Foundation; either version 2.1 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU Lesser General Public License for more details.
+ *
+ * You should have received a copy of the GNU Lesser General Public License
+ * along with this program; if not, write to the Free Software
+ * Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301, USA
+ */
+
+/* Compact log entries, returned by get_log and iter_log when
+ * entry_type=LogEntry is specified. The changed paths and revision
+ * properties are copied into a single block of memory and only converted
+ * to Python objects when they are accessed. */
+
+struct log_entry_path {
+	const char *path;
+	const char *copyfrom_path;
+	svn_revnum_t copyfrom_rev;
+	svn_node_kind_t node_kind;
+	char action;
+};
+
+struct log_entry_prop {
+	const char *name;
+	const char *value; /* NULL if the property was deleted */
+	apr_size_t len;
+};
+
+typedef struct {
+	PyObject_HEAD
+	svn_revnum_t revnum;
+	svn_boolean_t has_children;
+	int num_paths; /* -1 if changed paths were not requested */
+	int num_props;
+	struct log_entry_path *paths;
+	struct log_entry_prop *props;
+	/* Single allocation holding the arrays above and their strings */
+	char *data;
+	/* Materialized on first access */
+	PyObject *changed_paths;
+	PyObject *revprops;
+} LogEntryObject;
+
+static PyTypeObject LogEntry_Type;
+
+/* Interned action codes, indexed by log_entry_action_index() */
+static PyObject *log_entry_actions[4];
+
+static int log_entry_action_index(char action)
+{
+	switch (action) {
+		case 'A': return 0;
+		case 'D': return 1;
+		case 'M': return 2;
+		case 'R': return 3;
+		default: return -1;
+	}
+}
+
+static PyObject *log_entry_action(char action)
+{
+	int i = log_entry_action_index(action);
+
+	if (i == -1)
+		return PyUnicode_FromStringAndSize(&action, 1);
+
+	if (log_entry_actions[i] == NULL) {
+		log_entry_actions[i] = PyUnicode_FromStringAndSize(&action, 1);
+		if (log_entry_actions[i] == NULL)
+			return NULL;
+		PyUnicode_InternInPlace(&log_entry_actions[i]);
+	}
+	Py_INCREF(log_entry_actions[i]);
+	return log_entry_actions[i];
+}
+
+static void log_entry_dealloc(PyObject *self)
+{
+	LogEntryObject *entry = (LogEntryObject *)self;
+
+	Py_XDECREF(entry->changed_paths);
+	Py_XDECREF(entry->revprops);
+	PyMem_Free(entry->data);
+	PyObject_Del(self);
+}
+
+static PyObject *log_entry_get_changed_paths(PyObject *self, void *closure)
+{
+	LogEntryObject *entry = (LogEntryObject *)self;
+	PyObject *py_changed_paths, *pyval, *action;
+	int i;
+
+	if (entry->changed_paths != NULL) {
+		Py_INCREF(entry->changed_paths);
+		return entry->changed_paths;
+	}
+
+	if (entry->num_paths == -1) {
+		Py_RETURN_NONE;
+	}
+
+	py_changed_paths = PyDict_New();
+	if (py_changed_paths == NULL)
+		return NULL;
+
+	for (i = 0; i < entry->num_paths; i++) {
+		struct log_entry_path *p = &entry->paths[i];
+		action = log_entry_action(p->action);
+		if (action == NULL) {
+			Py_DECREF(py_changed_paths);
+			return NULL;
+		}
+		pyval = Py_BuildValue("(Nzli)", action, p->copyfrom_path,
+							  p->copyfrom_rev, p->node_kind);
+		if (pyval == NULL) {
+			Py_DECREF(py_changed_paths);
+			return NULL;
+		}
+		if (PyDict_SetItemString(py_changed_paths, p->path, pyval) != 0) {
+			Py_DECREF(pyval);
+			Py_DECREF(py_changed_paths);
+			return NULL;
+		}
+		Py_DECREF(pyval);
+	}
+
+	entry->changed_paths = py_changed_paths;
+	Py_INCREF(entry->changed_paths);
+	return entry->changed_paths;
+}
+
+static PyObject *log_entry_prop_value(struct log_entry_prop *prop)
+{
+	if (prop->value == NULL) {
+		Py_RETURN_NONE;
+	}
+	return PyUnicode_DecodeUTF8(prop->value, prop->len, NULL);
+}
+
+static PyObject *log_entry_get_revprops(PyObject *self, void *closure)
+{
+	LogEntryObject *entry = (LogEntryObject *)self;
+	PyObject *py_props, *py_val;
+	int i;
+
+	if (entry->revprops != NULL) {
+		Py_INCREF(entry->revprops);
+		return entry->revprops;
+	}
+
+	py_props = PyDict_New();
+	if (py_props == NULL)
+		return NULL;
+
+	for (i = 0; i < entry->num_props; i++) {
+		py_val = log_entry_prop_value(&entry->props[i]);
+		if (py_val == NULL) {
+			Py_DECREF(py_props);
+			return NULL;
+		}
+		if (PyDict_SetItemString(py_props, entry->props[i].name, py_val) != 0) {
+			Py_DECREF(py_val);
+			Py_DECREF(py_props);
+			return NULL;
+		}
+		Py_DECREF(py_val);
+	}
+
+	entry->revprops = py_props;
+	Py_INCREF(entry->revprops);
+	return entry->revprops;
+}
+
+/* Look up a single revision property without building the revprops
+ * dictionary. */
+static PyObject *log_entry_get_revprop(PyObject *self, void *closure)
+{
+	LogEntryObject *entry = (LogEntryObject *)self;
+	const char *name = (const char *)closure;
+	int i;
+
+	for (i = 0; i < entry->num_props; i++) {
+		if (!strcmp(entry->props[i].name, name))
+			return log_entry_prop_value(&entry->props[i]);
+	}
+
+	Py_RETURN_NONE;
+}
+
+static PyObject *log_entry_get_has_children(PyObject *self, void *closure)
+{
+	LogEntryObject *entry = (LogEntryObject *)self;
+
+	return PyBool_FromLong(entry->has_children);
+}
+
+static PyGetSetDef log_entry_getsetters[] = {
+	{ "changed_paths", log_entry_get_changed_paths, NULL,
+		"Dictionary mapping changed paths to (action, from_path, from_rev, "
+		"node_kind) tuples, or None if changed paths were not requested",
+		NULL },
+	{ "revprops", log_entry_get_revprops, NULL,
+		"Dictionary with the requested revision properties", NULL },
+	{ "author", log_entry_get_revprop, NULL,
+		"Author of the revision, or None",
+		(void *)SVN_PROP_REVISION_AUTHOR },
+	{ "date", log_entry_get_revprop, NULL,
+		"Date of the revision, or None",
+		(void *)SVN_PROP_REVISION_DATE },
+	{ "message", log_entry_get_revprop, NULL,
+		"Log message of the revision, or None",
+		(void *)SVN_PROP_REVISION_LOG },
+	{ "has_children", log_entry_get_has_children, NULL,
+		"Whether merged revisions follow this entry", NULL },
+	{ NULL }
+};
+
+static PyMemberDef log_entry_members[] = {
+	{ "revnum", T_LONG, offsetof(LogEntryObject, revnum), READONLY,
+		"Revision number" },
+	{ NULL, }
+};
+
+static Py_ssize_t log_entry_len(PyObject *self)
+{
+	return 4;
+}
+
+/* Entries can be unpacked like the tuples that are returned by default:
+ * (changed_paths, revnum, revprops, has_children) */
+static PyObject *log_entry_item(PyObject *self, Py_ssize_t i)
+{
+	LogEntryObject *entry = (LogEntryObject *)self;
+
+	switch (i) {
+		case 0:
+			return log_entry_get_changed_paths(self, NULL);
+		case 1:
+			return PyLong_FromLong(entry->revnum);
+		case 2:
+			return log_entry_get_revprops(self, NULL);
+		case 3:
+			return log_entry_get_has_children(self, NULL);
+		default:
+			PyErr_SetString(PyExc_IndexError, "index out of range");
+			return NULL;
+	}
+}
+
+static PySequenceMethods log_entry_as_sequence = {
+	log_entry_len, /* lenfunc sq_length; */
+	NULL, /* binaryfunc sq_concat; */
+	NULL, /* ssizeargfunc sq_repeat; */
+	log_entry_item, /* ssizeargfunc sq_item; */
+};
+
+static PyObject *log_entry_repr(PyObject *self)
+{
+	LogEntryObject *entry = (LogEntryObject *)self;
+
+	return PyUnicode_FromFormat("LogEntry(revnum=%ld)", entry->revnum);
+}
+
+static PyTypeObject LogEntry_Type = {
+	PyVarObject_HEAD_INIT(NULL, 0)
+	"_ra.LogEntry", /*	const char *tp_name;  For printing, in format "<module>.<name>" */
+	sizeof(LogEntryObject),
+	0,/*	Py_ssize_t tp_basicsize, tp_itemsize;  For allocation */
+
+	/* Methods to implement standard operations */
+
+	(destructor)log_entry_dealloc, /*	destructor tp_dealloc;	*/
+	NULL, /*	printfunc tp_print;	*/
+	NULL, /*	getattrfunc tp_getattr;	*/
+	NULL, /*	setattrfunc tp_setattr;	*/
+	NULL, /*	cmpfunc tp_compare;	*/
+	log_entry_repr, /*	reprfunc tp_repr;	*/
+
+	/* Method suites for standard classes */
+
+	NULL, /*	PyNumberMethods *tp_as_number;	*/
+	&log_entry_as_sequence, /*	PySequenceMethods *tp_as_sequence;	*/
+	NULL, /*	PyMappingMethods *tp_as_mapping;	*/
+
+	/* More standard operations (here for binary compatibility) */
+
+	NULL, /*	hashfunc tp_hash;	*/
+	NULL, /*	ternaryfunc tp_call;	*/
+	NULL, /*	reprfunc tp_str;	*/
+	NULL, /*	getattrofunc tp_getattro;	*/
+	NULL, /*	setattrofunc tp_setattro;	*/
+
+	/* Functions to access object as input/output buffer */
+	NULL, /*	PyBufferProcs *tp_as_buffer;	*/
+
+	/* Flags to define presence of optional/expanded features */
+	0, /*	long tp_flags;	*/
+
+	"Log entry for a single revision.\n"
+	"Can be unpacked as (changed_paths, revnum, revprops, has_children).",
+	/*	const char *tp_doc;  Documentation string */
+
+	/* Assigned meaning in release 2.0 */
+	/* call function for all accessible objects */
+	NULL, /*	traverseproc tp_traverse;	*/
+
+	/* delete references to contained objects */
+	NULL, /*	inquiry tp_clear;	*/
+
+	/* Assigned meaning in release 2.1 */
+	/* rich comparisons */
+	NULL, /*	richcmpfunc tp_richcompare;	*/
+
+	/* weak reference enabler */
+	0, /*	Py_ssize_t tp_weaklistoffset;	*/
+
+	/* Added in release 2.2 */
+	/* Iterators */
+	NULL, /*	getiterfunc tp_iter;	*/
+	NULL, /*	iternextfunc tp_iternext;	*/
+	NULL, /*	struct PyMethodDef *tp_methods;	*/
+	log_entry_members, /*	struct PyMemberDef *tp_members;	*/
+	log_entry_getsetters, /*	struct PyGetSetDef *tp_getset;	*/
+};
+
+/* Check the entry_type argument of get_log and iter_log. Returns -1 on
+ * error, otherwise whether compact entries should be used. */
+static int log_entry_type_check(PyObject *entry_type)
+{
+	if (entry_type == Py_None)
+		return 0;
+	if (entry_type == (PyObject *)&LogEntry_Type) {
+#if ONLY_BEFORE_SVN(1, 5)
+		PyErr_SetString(PyExc_NotImplementedError,
+			"entry_type not supported with svn < 1.5");
+		return -1;
+#else
+		return 1;
+#endif
+	}
+	PyErr_SetString(PyExc_TypeError, "entry_type should be None or LogEntry");
+	return -1;
+}
+
+#if ONLY_SINCE_SVN(1, 5)
+/* Copy a log entry into a new LogEntry object. Called with the GIL held. */
+static PyObject *log_entry_from_svn(svn_log_entry_t *log_entry,
+									apr_pool_t *pool)
+{
+	LogEntryObject *ret;
+	apr_hash_t *changed_paths;
+	apr_hash_index_t *idx;
+	const char *key;
+	apr_ssize_t klen;
+	svn_string_t *propval;
+	apr_size_t size = 0, len;
+	char *strings;
+	int i;
+
+#if ONLY_SINCE_SVN(1, 6)
+	svn_log_changed_path2_t *val;
+	changed_paths = log_entry->changed_paths2;
+#else
+	svn_log_changed_path_t *val;
+	changed_paths = log_entry->changed_paths;
+#endif
+
+	ret = PyObject_New(LogEntryObject, &LogEntry_Type);
+	if (ret == NULL)
+		return NULL;
+
+	ret->revnum = log_entry->revision;
+	ret->has_children = log_entry->has_children;
+	ret->num_paths = -1;
+	ret->num_props = 0;
+	ret->paths = NULL;
+	ret->props = NULL;
+	ret->data = NULL;
+	ret->changed_paths = NULL;
+	ret->revprops = NULL;
+
+	/* Work out how much space is needed */
+	if (changed_paths != NULL) {
+		ret->num_paths = apr_hash_count(changed_paths);
+		size += ret->num_paths * sizeof(struct log_entry_path);
+		for (idx = apr_hash_first(pool, changed_paths); idx != NULL;
+			 idx = apr_hash_next(idx)) {
+			apr_hash_this(idx, (const void **)&key, &klen, (void **)&val);
+			size += strlen(key) + 1;
+			if (val->copyfrom_path != NULL)
+				size += strlen(val->copyfrom_path) + 1;
+		}
+	}
+	if (log_entry->revprops != NULL) {
+		ret->num_props = apr_hash_count(log_entry->revprops);
+		size += ret->num_props * sizeof(struct log_entry_prop);
+		for (idx = apr_hash_first(pool, log_entry->revprops); idx != NULL;
+			 idx = apr_hash_next(idx)) {
+			apr_hash_this(idx, (const void **)&key, &klen, (void **)&propval);
+			size += strlen(key) + 1;
+			if (propval != NULL && propval->data != NULL)
+				size += propval->len + 1;
+		}
+	}
+
+	if (size == 0)
+		return (PyObject *)ret;
+
+	ret->data = PyMem_Malloc(size);
+	if (ret->data == NULL) {
+		Py_DECREF(ret);
+		return PyErr_NoMemory();
+	}
+
+	ret->paths = (struct log_entry_path *)ret->data;
+	ret->props = (struct log_entry_prop *)(ret->paths +
+		(ret->num_paths > 0?ret->num_paths:0));
+	strings = (char *)(ret->props + ret->num_props);
+
+	if (changed_paths != NULL) {
+		for (idx = apr_hash_first(pool, changed_paths), i = 0; idx != NULL;
+			 idx = apr_hash_next(idx), i++) {
+			struct log_entry_path *p = &ret->paths[i];
+			apr_hash_this(idx, (const void **)&key, &klen, (void **)&val);
+			len = strlen(key) + 1;
+			memcpy(strings, key, len);
+			p->path = strings;
+			strings += len;
+			if (val->copyfrom_path != NULL) {
+				len = strlen(val->copyfrom_path) + 1;
+				memcpy(strings, val->copyfrom_path, len);
+				p->copyfrom_path = strings;
+				strings += len;
+			} else {
+				p->copyfrom_path = NULL;
+			}
+			p->copyfrom_rev = val->copyfrom_rev;
+#if ONLY_SINCE_SVN(1, 6)
+			p->node_kind = val->node_kind;
+#else
+			p->node_kind = svn_node_unknown;
+#endif
+			p->action = val->action;
+		}
+	}
+
+	if (log_entry->revprops != NULL) {
+		for (idx = apr_hash_first(pool, log_entry->revprops), i = 0;
+			 idx != NULL; idx = apr_hash_next(idx), i++) {
+			struct log_entry_prop *prop = &ret->props[i];
+			apr_hash_this(idx, (const void **)&key, &klen, (void **)&propval);
+			len = strlen(key) + 1;
+			memcpy(strings, key, len);
+			prop->name = strings;
+			strings += len;
+			if (propval != NULL && propval->data != NULL) {
+				memcpy(strings, propval->data, propval->len);
+				strings[propval->len] = '\0';
+				prop->value = strings;
+				prop->len = propval->len;
+				strings += propval->len + 1;
+			} else {
+				prop->value = NULL;
+				prop->len = 0;
+			}
+		}
+	}
+
+	return (PyObject *)ret;
+}
+
+static svn_error_t *py_svn_log_entry_object_receiver(void *baton,
+	svn_log_entry_t *log_entry, apr_pool_t *pool)
+{
+	PyObject *entry, *ret;
+	PyGILState_STATE state = PyGILState_Ensure();
+
+	entry = log_entry_from_svn(log_entry, pool);
+	CB_CHECK_PYRETVAL(entry);
+
+	ret = PyObject_CallFunctionObjArgs((PyObject *)baton, entry, NULL);
+	Py_DECREF(entry);
+	CB_CHECK_PYRETVAL(ret);
+	Py_DECREF(ret);
+
+	PyGILState_Release(state);
+	return NULL;
+}
+#endif
@@ -18,12 +18,29 @@
 __author__ = "Jelmer Vernooij <jelmer@samba.org>"
 __docformat__ = "restructuredText"
 
+from collections import deque
 import sys
+import zlib
 
 from hashlib import (
     md5,
     )
 
+from subvertpy import (
+    ERR_SVNDIFF_CORRUPT_WINDOW,
+    ERR_SVNDIFF_INVALID_COMPRESSED_DATA,
+    ERR_SVNDIFF_INVALID_HEADER,
+    ERR_SVNDIFF_INVALID_OPS,
+    ERR_SVNDIFF_UNEXPECTED_END,
+    ERR_UNSUPPORTED_FEATURE,
+    SubversionException,
+    )
+
+try:
+    import lz4.block
+except ImportError:
+    lz4 = None
+
 
 TXDELTA_SOURCE = 0
 TXDELTA_TARGET = 1
@@ -34,6 +51,10 @@ MAX_ENCODED_INT_LEN = 10
 
 DELTA_WINDOW_SIZE = 102400
 
+# Size of the blocks of the source view that are indexed when looking for
+# matches, as in Subversion's xdelta implementation.
+MATCH_BLOCKSIZE = 64
+
 def apply_txdelta_window(sbuf, window):
     """Apply a txdelta window to a buffer.
 
@@ -48,8 +69,9 @@ def apply_txdelta_window(sbuf, window):
     :return: Target buffer
     """
     (sview_offset, sview_len, tview_len, src_ops, ops, new_data) = window
-    sview = sbuf[sview_offset:sview_offset+sview_len]
-    tview = txdelta_apply_ops(src_ops, ops, new_data, sview)
+    with memoryview(sbuf) as sview:
+        tview = txdelta_apply_ops(src_ops, ops, new_data,
+            sview[sview_offset:sview_offset+sview_len], tview_len)
     if len(tview) != tview_len:
         raise AssertionError("%d != %d" % (len(tview), tview_len))
     return tview
@@ -82,27 +104,53 @@ def apply_txdelta_handler(sbuf, target_stream):
     return apply_window
 
 
-def txdelta_apply_ops(src_ops, ops, new_data, sview):
+def txdelta_apply_ops(src_ops, ops, new_data, sview, tview_len=None):
     """Apply txdelta operations to a source view.
 
     :param src_ops: Source operations, ignored.
     :param ops: List of operations (action, offset, length).
     :param new_data: Buffer to fetch fragments with new data from
     :param sview: Source data
+    :param tview_len: Length of the target view, if known
     :return: Result data
     """
-    tview = bytearray()
-    for (action, offset, length) in ops:
-        if action == TXDELTA_SOURCE:
-            # Copy from source area.
-            tview.extend(sview[offset:offset+length])
-        elif action == TXDELTA_TARGET:
-            for i in range(length):
-                tview.append(tview[offset+i])
-        elif action == TXDELTA_NEW:
-            tview.extend(new_data[offset:offset+length])
-        else:
-            raise Exception("Invalid delta instruction code")
+    if tview_len is None:
+        tview_len = sum(op[2] for op in ops)
+    tview = bytearray(tview_len)
+    pos = 0
+    with memoryview(tview) as target:
+        try:
+            for (action, offset, length) in ops:
+                end = pos + length
+                if action == TXDELTA_SOURCE:
+                    # Copy from source area.
+                    target[pos:end] = sview[offset:offset+length]
+                elif action == TXDELTA_TARGET:
+                    if offset >= pos:
+                        raise SubversionException(
+                            "Delta copies from beyond the target view",
+                            ERR_SVNDIFF_INVALID_OPS)
+                    # The copied range may overlap with the range being
+                    # written, in which case the data between offset and
+                    # pos repeats. Copy as much as is available at once,
+                    # doubling the amount each round.
+                    while pos < end:
+                        n = min(end - pos, pos - offset)
+                        target[pos:pos+n] = target[offset:offset+n]
+                        pos += n
+                elif action == TXDELTA_NEW:
+                    target[pos:end] = new_data[offset:offset+length]
+                else:
+                    raise Exception("Invalid delta instruction code")
+                pos = end
+        except ValueError:
+            # Memoryview slice assignments raise ValueError if the source
+            # range is too short or the target range is out of bounds.
+            raise SubversionException(
+                "Delta instruction exceeds its source or target view",
+                ERR_SVNDIFF_INVALID_OPS)
+    if pos < tview_len:
+        del tview[pos:]
     return tview
 
 
@@ -126,6 +174,151 @@ def send_stream(stream, handler, block_size=DELTA_WINDOW_SIZE):
     return hash.digest()
 
 
+def _match_length(a, apos, b, bpos):
+    """Determine the length of the common prefix of a[apos:] and b[bpos:].
+
+    :param a: memoryview
+    :param b: memoryview
+    """
+    limit = min(len(a) - apos, len(b) - bpos)
+    n = 0
+    step = MATCH_BLOCKSIZE
+    while n < limit:
+        step = min(step, limit - n)
+        if a[apos+n:apos+n+step] == b[bpos+n:bpos+n+step]:
+            n += step
+            step *= 2
+        elif step > 1:
+            step //= 2
+        else:
+            break
+    return n
+
+
+def _block_checksum(data, pos):
+    """Compute the rolling checksum of a block of MATCH_BLOCKSIZE bytes.
+
+    :return: tuple with the sum of the bytes and the sum of the bytes
+        weighted by their distance from the end of the block, both
+        modulo 2**16
+    """
+    a = b = 0
+    for c in data[pos:pos+MATCH_BLOCKSIZE]:
+        a += c
+        b += a
+    return (a & 0xffff, b & 0xffff)
+
+
+def compute_delta_ops(sview, tview):
+    """Compute the instructions to create a target view from a source view.
+
+    Blocks of MATCH_BLOCKSIZE bytes in the source view are indexed by an
+    Adler-32 style rolling checksum, as in Subversion's xdelta
+    implementation. The checksum is then rolled over the target view one
+    byte at a time, so that every offset is looked up at constant cost.
+    Checksum hits are verified, extended in both directions and become
+    TXDELTA_SOURCE instructions; everything else is sent as new data.
+
+    :param sview: Source view (bytes)
+    :param tview: Target view (bytes)
+    :return: tuple with list of operations and new data
+    """
+    ops = []
+    new_data = bytearray()
+    n = MATCH_BLOCKSIZE
+    blocks = {}
+    for spos in range(0, len(sview) - n + 1, n):
+        (a, b) = _block_checksum(sview, spos)
+        blocks.setdefault(a | (b << 16), spos)
+    smem = memoryview(sview)
+    tmem = memoryview(tview)
+
+    def add_new(start, end):
+        if start < end:
+            ops.append((TXDELTA_NEW, len(new_data), end - start))
+            new_data.extend(tmem[start:end])
+
+    pending = 0 # Start of the data that has not been matched yet
+    tpos = 0
+    last = len(tview) - n
+    lookup = blocks.get
+    while blocks and tpos <= last:
+        (a, b) = _block_checksum(tview, tpos)
+        spos = lookup(a | (b << 16))
+        while spos is None or smem[spos:spos+n] != tmem[tpos:tpos+n]:
+            if tpos == last:
+                spos = None
+                break
+            # Roll the checksum one byte forward
+            out = tview[tpos]
+            a = (a - out + tview[tpos+n]) & 0xffff
+            b = (b - n * out + a) & 0xffff
+            tpos += 1
+            spos = lookup(a | (b << 16))
+        if spos is None:
+            break
+        back = 0
+        while (back < tpos - pending and back < spos and
+               sview[spos-back-1] == tview[tpos-back-1]):
+            back += 1
+        length = n + _match_length(smem, spos + n, tmem, tpos + n)
+        add_new(pending, tpos - back)
+        ops.append((TXDELTA_SOURCE, spos - back, length + back))
+        tpos += length
+        pending = tpos
+    add_new(pending, len(tview))
+    return ops, bytes(new_data)
+
+
+def send_delta(source_stream, target_stream, handler,
+               block_size=DELTA_WINDOW_SIZE):
+    """Send txdelta windows that turn one stream into another to handler.
+
+    Both streams are read block_size bytes at a time. Each target window
+    is expressed in terms of a source view that spans the source block at
+    the same offset and the blocks before and after it, so that data that
+    moved by less than a block because of insertions or deletions is still
+    found. No more than three blocks of the source and one block of the
+    target are kept in memory.
+
+    :param source_stream: file-like object to read the base text from, or
+        None to send the full text
+    :param target_stream: file-like object to read the new text from
+    :param handler: txdelta window handler function
+    :return: MD5 hash over the target stream
+    """
+    hash = md5()
+    # Source blocks before, at and after the current target window
+    if source_stream is not None:
+        source_blocks = [b"", source_stream.read(block_size),
+                         source_stream.read(block_size)]
+    else:
+        source_blocks = [b"", b"", b""]
+    sview_offset = 0
+    while True:
+        tview = target_stream.read(block_size)
+        if not isinstance(tview, bytes):
+            raise TypeError("The stream should read out bytes")
+        if not tview:
+            break
+        hash.update(tview)
+        sview = b"".join(source_blocks)
+        (ops, new_data) = compute_delta_ops(sview, tview)
+        src_ops = len([op for op in ops if op[0] == TXDELTA_SOURCE])
+        if src_ops == 0:
+            window = (0, 0, len(tview), 0, ops, new_data)
+        else:
+            window = (sview_offset, len(sview), len(tview), src_ops, ops,
+                      new_data)
+        handler(window)
+        sview_offset += len(source_blocks[0])
+        if source_stream is not None:
+            source_blocks = source_blocks[1:] + [
+                source_stream.read(block_size)]
+    handler(None)
+    return hash.digest()
+
+
 def encode_length(len):
     """Encode a length variable.
 
@@ -212,11 +405,64 @@ def unpack_svndiff_instruction(text):
 
 
 SVNDIFF0_HEADER = b"SVN\0"
+SVNDIFF1_HEADER = b"SVN\1"
+SVNDIFF2_HEADER = b"SVN\2"
 
-def pack_svndiff0_window(window):
-    """Pack an individual window using svndiff0.
+SVNDIFF_HEADERS = {
+    0: SVNDIFF0_HEADER,
+    1: SVNDIFF1_HEADER,
+    2: SVNDIFF2_HEADER,
+    }
+
+# Versions of svndiff that can be encoded and decoded
+if lz4 is not None:
+    SVNDIFF_VERSIONS = (0, 1, 2)
+else:
+    SVNDIFF_VERSIONS = (0, 1)
+
+# Sections smaller than this are not worth compressing; the same threshold
+# is used by Subversion.
+MIN_COMPRESS_SIZE = 512
+
+# zlib compression level used for svndiff1 by default, as in Subversion
+SVNDIFF1_COMPRESSION_LEVEL = 5
+
+
+def _compress_zlib(data, level):
+    return zlib.compress(data, level)
+
+
+def _compress_lz4(data, level):
+    return lz4.block.compress(data, store_size=False)
+
+
+def _encode_section(data, compress, level, min_compress_size):
+    """Encode a svndiff1 or svndiff2 window section.
+
+    The section is stored uncompressed if it is smaller than
+    min_compress_size or if compression does not make it smaller.
+    """
+    ret = encode_length(len(data))
+    if len(data) >= min_compress_size:
+        compressed = compress(data, level)
+        if len(compressed) < len(data):
+            ret.extend(compressed)
+            return ret
+    ret.extend(data)
+    return ret
+
+
+def pack_svndiff_window(window, version=0,
+                        compression_level=SVNDIFF1_COMPRESSION_LEVEL,
+                        min_compress_size=MIN_COMPRESS_SIZE):
+    """Pack an individual window.
 
     :param window: Window to pack
+    :param version: svndiff version to use: 0 (uncompressed), 1 (zlib) or
+        2 (lz4)
+    :param compression_level: zlib compression level for svndiff1
+    :param min_compress_size: Minimum size of a section before
+        compression is attempted
     :return: Packed diff (as bytestring)
     """
     (sview_offset, sview_len, tview_len, src_ops, ops, new_data) = window
@@ -228,6 +474,25 @@ def pack_svndiff0_window(window):
     for op in ops:
         instrdata += pack_svndiff_instruction(op)
 
+    if version == 1:
+        compress = _compress_zlib
+    elif version == 2:
+        if lz4 is None:
+            raise SubversionException(
+                "svndiff version 2 requires the lz4 module",
+                ERR_UNSUPPORTED_FEATURE)
+        compress = _compress_lz4
+    elif version == 0:
+        compress = None
+    else:
+        raise ValueError("Unsupported svndiff version %r" % version)
+
+    if compress is not None:
+        instrdata = _encode_section(instrdata, compress, compression_level,
+                                    min_compress_size)
+        new_data = _encode_section(new_data, compress, compression_level,
+                                   min_compress_size)
+
     ret.extend(encode_length(len(instrdata)))
     ret.extend(encode_length(len(new_data)))
     ret.extend(instrdata)
@@ -235,44 +500,305 @@ def pack_svndiff0_window(window):
     return ret
 
 
-def pack_svndiff0(windows):
+def pack_svndiff0_window(window):
+    """Pack an individual window using svndiff0.
+
+    :param window: Window to pack
+    :return: Packed diff (as bytestring)
+    """
+    return pack_svndiff_window(window, 0)
+
+
+def pack_svndiff(windows, version=0, **kwargs):
     """Pack a SVN diff file.
 
     :param windows: Iterator over diff windows
+    :param version: svndiff version to use
     :return: text
     """
-    ret = SVNDIFF0_HEADER
+    ret = bytearray(SVNDIFF_HEADERS[version])
     for window in windows:
-        ret += pack_svndiff0_window(window)
-    return ret
+        ret += pack_svndiff_window(window, version, **kwargs)
+    return bytes(ret)
+
+
+def pack_svndiff0(windows):
+    """Pack a SVN diff file.
+
+    :param windows: Iterator over diff windows
+    :return: text
+    """
+    return pack_svndiff(windows, 0)
+
+
+def _decode_length_at(buf, pos, end):
+    """Decode a length variable at an offset in a buffer.
+
+    :param buf: Buffer to decode from
+    :param pos: Offset of the encoded length
+    :param end: End of the valid data in buf
+    :return: tuple with length and offset of the next byte, or None if
+        the buffer ends before the encoded length does
+    """
+    ret = 0
+    while pos < end:
+        c = buf[pos]
+        pos += 1
+        ret = (ret << 7) | (c & 0x7f)
+        if not c & 0x80:
+            return (ret, pos)
+    return None
+
+
+def _unpack_instructions(buf, pos, end):
+    """Unpack the instructions in a buffer.
+
+    The offset of TXDELTA_NEW instructions is not encoded; it is the
+    position in the new data, which is consumed in order.
+
+    :return: list of (action, offset, length) tuples
+    """
+    ops = []
+    npos = 0
+    while pos < end:
+        c = buf[pos]
+        pos += 1
+        action = c >> 6
+        length = c & 0x3f
+        if action == TXDELTA_INVALID:
+            raise SubversionException("Invalid delta instruction code",
+                                      ERR_SVNDIFF_CORRUPT_WINDOW)
+        if length == 0:
+            decoded = _decode_length_at(buf, pos, end)
+            if decoded is None:
+                raise SubversionException("Truncated delta instruction",
+                                          ERR_SVNDIFF_CORRUPT_WINDOW)
+            (length, pos) = decoded
+        if action != TXDELTA_NEW:
+            decoded = _decode_length_at(buf, pos, end)
+            if decoded is None:
+                raise SubversionException("Truncated delta instruction",
+                                          ERR_SVNDIFF_CORRUPT_WINDOW)
+            (offset, pos) = decoded
+        else:
+            offset = npos
+            npos += length
+        ops.append((action, offset, length))
+    return ops
+
+
+def _decompress_zlib(data, size):
+    try:
+        return zlib.decompress(data)
+    except zlib.error as e:
+        raise SubversionException("Invalid compressed svndiff data: %s" % e,
+                                  ERR_SVNDIFF_INVALID_COMPRESSED_DATA)
+
+
+def _decompress_lz4(data, size):
+    try:
+        return lz4.block.decompress(data, uncompressed_size=size)
+    except lz4.block.LZ4BlockError as e:
+        raise SubversionException("Invalid compressed svndiff data: %s" % e,
+                                  ERR_SVNDIFF_INVALID_COMPRESSED_DATA)
+
+
+def _decode_section(view, decompress):
+    """Decode a possibly compressed svndiff1 or svndiff2 window section.
+
+    :param view: memoryview of the encoded section
+    :param decompress: Function to decompress the section with
+    :return: Buffer with the original data
+    """
+    decoded = _decode_length_at(view, 0, len(view))
+    if decoded is None:
+        raise SubversionException("Truncated svndiff section",
+                                  ERR_SVNDIFF_CORRUPT_WINDOW)
+    (size, pos) = decoded
+    if len(view) - pos == size:
+        # Stored without compression
+        return view[pos:]
+    data = decompress(view[pos:], size)
+    if len(data) != size:
+        raise SubversionException("Svndiff section has wrong size",
+                                  ERR_SVNDIFF_INVALID_COMPRESSED_DATA)
+    return memoryview(data)
+
+
+class SvndiffDecoder(object):
+    """Incremental svndiff decoder.
+
+    Supports svndiff version 0, version 1 (zlib) and, if the lz4 module is
+    available, version 2 (lz4).
+
+    Data is added in arbitrarily sized chunks using feed(); windows are
+    decoded as soon as all of their data has been fed and can be retrieved
+    by iterating over the decoder. Only the data of the window that is
+    currently being received is buffered.
+
+    The new data of decoded windows is a memoryview; for uncompressed
+    windows it refers directly to the data that was fed rather than to
+    a copy.
+    """
+
+    __slots__ = ('_pending', '_windows', '_decompress')
+
+    def __init__(self):
+        self._pending = bytearray()
+        self._windows = deque()
+        self._decompress = None
+
+    def feed(self, data):
+        """Add svndiff data.
+
+        Complete windows are decoded immediately. The data may be
+        referenced by the decoded windows, so it should not be modified
+        afterwards.
+
+        :param data: Bytes, bytearray or memoryview with svndiff data
+        """
+        if self._pending:
+            # Parse the accumulated data in place and only drop what has
+            # been consumed, so that a window that arrives in many small
+            # chunks is not copied again for every chunk.
+            self._pending += data
+            with memoryview(self._pending) as view:
+                pos = self._read_windows(view, True)
+            if pos is not None:
+                del self._pending[:pos]
+            return
+        if not isinstance(data, bytes):
+            # Decoded windows may refer to the buffer, so make sure it
+            # is immutable.
+            data = bytes(data)
+        with memoryview(data) as view:
+            pos = self._read_windows(view, False)
+            if pos is None:
+                self._pending += view
+            else:
+                self._pending += view[pos:]
+
+    def _read_windows(self, view, copy):
+        """Decode all complete windows in a buffer.
+
+        :param view: memoryview of the buffer
+        :param copy: Whether the new data of the windows has to be copied
+            out of the buffer, because it will be modified later
+        :return: Offset of the first byte that was not consumed, or None
+            if the header is not complete yet
+        """
+        pos = 0
+        if self._decompress is None:
+            pos = self._read_header(view)
+            if pos is None:
+                return None
+        while True:
+            window_end = self._read_window(view, pos, copy)
+            if window_end is None:
+                return pos
+            pos = window_end
+
+    def _read_header(self, view):
+        if len(view) < 4:
+            return None
+        header = view[:4].tobytes()
+        if header == SVNDIFF0_HEADER:
+            self._decompress = False
+        elif header == SVNDIFF1_HEADER:
+            self._decompress = _decompress_zlib
+        elif header == SVNDIFF2_HEADER:
+            if lz4 is None:
+                raise SubversionException(
+                    "svndiff version 2 requires the lz4 module",
+                    ERR_UNSUPPORTED_FEATURE)
+            self._decompress = _decompress_lz4
+        else:
+            raise SubversionException("Svndiff has invalid header",
+                                      ERR_SVNDIFF_INVALID_HEADER)
+        return 4
+
+    def _read_window(self, view, pos, copy=False):
+        end = len(view)
+        header = []
+        for i in range(5):
+            decoded = _decode_length_at(view, pos, end)
+            if decoded is None:
+                return None
+            (value, pos) = decoded
+            header.append(value)
+        (sview_offset, sview_len, tview_len, instr_len, newdata_len) = header
+        if end - pos < instr_len + newdata_len:
+            return None
+        instrdata = view[pos:pos+instr_len]
+        pos += instr_len
+        newdata = view[pos:pos+newdata_len]
+        pos += newdata_len
+        if self._decompress:
+            instrdata = _decode_section(instrdata, self._decompress)
+            newdata = _decode_section(newdata, self._decompress)
+        ops = _unpack_instructions(instrdata, 0, len(instrdata))
+        del instrdata
+        if copy and newdata.obj is view.obj:
+            newdata = memoryview(newdata.tobytes())
+        src_ops = sum(1 for op in ops if op[0] == TXDELTA_SOURCE)
+        self._windows.append(
+            (sview_offset, sview_len, tview_len, src_ops, ops, newdata))
+        return pos
+
+    def read_window(self):
+        """Return the next decoded window.
+
+        :return: tuple with sview_offset, sview_len, tview_len, src_ops,
+            ops, newdata or None if no complete window has been fed yet
+        """
+        if not self._windows:
+            return None
+        return self._windows.popleft()
+
+    def __iter__(self):
+        """Iterate over the windows that have been decoded so far."""
+        while self._windows:
+            yield self._windows.popleft()
+
+    def close(self):
+        """Check that the data fed so far ended with a complete window.
+
+        :raise SubversionException: if there is trailing data
+        """
+        if self._decompress is None or self._pending:
+            raise SubversionException("Unexpected end of svndiff input",
+                                      ERR_SVNDIFF_UNEXPECTED_END)
+
+
+def unpack_svndiff(text):
+    """Unpack a svndiff text of any supported version.
+
+    :param text: Text to unpack.
+    :return: yields tuples with sview_offset, sview_len, tview_len, src_ops,
+        ops, newdata
+    """
+    decoder = SvndiffDecoder()
+    decoder.feed(text)
+    for window in decoder:
+        yield window
+    decoder.close()
 
 
 def unpack_svndiff0(text):
     """Unpack a version 0 svndiff text.
     
+    New code should use unpack_svndiff(), which also supports the other
+    svndiff versions and avoids copying the new data.
+
     :param text: Text to unpack.
     :return: yields tuples with sview_offset, sview_len, tview_len, ops_len, 
         ops, newdata
     """
     assert text.startswith(SVNDIFF0_HEADER)
-    text = text[4:]
-
-    while text:
-        sview_offset, text = decode_length(text)
-        sview_len, text = decode_length(text)
-        tview_len, text = decode_length(text)
-        instr_len, text = decode_length(text)
-        newdata_len, text = decode_length(text)
-
-        instrdata = text[:instr_len]
-        text = text[instr_len:]
-
-        ops = []
-        while instrdata:
-            op, instrdata = unpack_svndiff_instruction(instrdata)
-            ops.append(op)
-
-        newdata = text[:newdata_len]
-        text = text[newdata_len:]
-        yield (sview_offset, sview_len, tview_len, len(ops), ops, newdata)
-
+    decoder = SvndiffDecoder()
+    decoder.feed(text)
+    for (sview_offset, sview_len, tview_len, src_ops, ops,
+         newdata) in decoder:
+        yield (sview_offset, sview_len, tview_len, len(ops), ops,
+               newdata.tobytes())
+    decoder.close()
@@ -101,6 +101,7 @@ static PyObject *txdelta_call(PyObject *self, PyObject *args, PyObject *kwargs)
 	PyObject *py_window, *py_ops, *py_new_data;
 	int i;
 	svn_string_t new_data;
+	Py_buffer new_data_view;
 	svn_error_t *error;
 	svn_txdelta_op_t *ops;
 
@@ -117,22 +118,26 @@ static PyObject *txdelta_call(PyObject *self, PyObject *args, PyObject *kwargs)
 		&window.src_ops, &py_ops, &py_new_data))
 		return NULL;
 
+	if (!PyList_Check(py_ops)) {
+		PyErr_SetString(PyExc_TypeError, "ops not a list");
+		return NULL;
+	}
+
+	/* Accept any object supporting the buffer protocol, so that windows
+	 * with memoryview slices of svndiff data can be passed on without
+	 * copying. */
 	if (py_new_data == Py_None) {
 		window.new_data = NULL;
+		new_data_view.obj = NULL;
 	} else {
-		Py_ssize_t sz;
-		if (PyBytes_AsStringAndSize(py_new_data, (char**)&new_data.data, (Py_ssize_t *)&sz) < 0) {
+		if (PyObject_GetBuffer(py_new_data, &new_data_view, PyBUF_SIMPLE) < 0) {
 			return NULL;
 		}
-		new_data.len = sz;
+		new_data.data = new_data_view.buf;
+		new_data.len = new_data_view.len;
 		window.new_data = &new_data;
 	}
 
-	if (!PyList_Check(py_ops)) {
-		PyErr_SetString(PyExc_TypeError, "ops not a list");
-		return NULL;
-	}
-
 	window.num_ops = PyList_Size(py_ops);
 
 	window.ops = ops = malloc(sizeof(svn_txdelta_op_t) * window.num_ops);
@@ -142,6 +147,8 @@ static PyObject *txdelta_call(PyObject *self, PyObject *args, PyObject *kwargs)
 		if (!PyArg_ParseTuple(windowitem, "ikk", &ops[i].action_code, 
 							  &ops[i].offset, &ops[i].length)) {
 			free(ops);
+			if (new_data_view.obj != NULL)
+				PyBuffer_Release(&new_data_view);
 			return NULL;
 		}
 	}
@@ -149,15 +156,15 @@ static PyObject *txdelta_call(PyObject *self, PyObject *args, PyObject *kwargs)
 	Py_BEGIN_ALLOW_THREADS
 	error = obj->txdelta_handler(&window, obj->txdelta_baton);
 	Py_END_ALLOW_THREADS
+	free(ops);
+	if (new_data_view.obj != NULL)
+		PyBuffer_Release(&new_data_view);
 	if (error != NULL) {
 		handle_svn_error(error);
 		svn_error_clear(error);
-		free(ops);
 		return NULL;
 	}
 
-	free(ops);
-
 	Py_RETURN_NONE;
 }
 
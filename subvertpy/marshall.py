@@ -16,6 +16,8 @@
 
 """Marshalling for the svn_ra protocol."""
 
+import re
+
 class literal:
     """A protocol literal."""
 
@@ -51,29 +53,206 @@ class NeedMoreData(MarshallError):
     """More data needed."""
 
 
+def _marshall_int(x, out):
+    out += b"%d " % x
+
+
+def _marshall_list(x, out):
+    if (len(x) == 2 and type(x[0]) is literal and
+        type(x[1]) in (list, tuple)):
+        _marshall_command(x[0].txt, x[1], out)
+        return
+    out += b"( "
+    for item in x:
+        _marshall_item(item, out)
+    out += b") "
+
+
+def _marshall_literal(x, out):
+    out += x.txt.encode("ascii")
+    out += b" "
+
+
+def _marshall_bytes(x, out):
+    out += b"%d:" % len(x)
+    out += x
+    out += b" "
+
+
+def _marshall_buffer(x, out):
+    out += b"%d:" % x.nbytes
+    out += x
+    out += b" "
+
+
+def _marshall_str(x, out):
+    _marshall_bytes(x.encode("utf-8"), out)
+
+
+_marshallers = {
+    int: _marshall_int,
+    list: _marshall_list,
+    tuple: _marshall_list,
+    literal: _marshall_literal,
+    bytes: _marshall_bytes,
+    bytearray: _marshall_bytes,
+    memoryview: _marshall_buffer,
+    str: _marshall_str,
+    }
+
+
+def _marshall_item(x, out):
+    try:
+        fn = _marshallers[type(x)]
+    except KeyError:
+        # Subclasses of the supported types; note that bool is encoded
+        # as a number.
+        if isinstance(x, int):
+            fn = _marshall_int
+        elif isinstance(x, (list, tuple)):
+            fn = _marshall_list
+        elif isinstance(x, literal):
+            fn = _marshall_literal
+        elif isinstance(x, (bytes, bytearray)):
+            fn = _marshall_bytes
+        elif isinstance(x, str):
+            fn = _marshall_str
+        else:
+            raise MarshallError("Unable to marshall type %s" % x)
+    fn(x, out)
+
+
+def _marshall_command(name, args, out):
+    out += b"( "
+    out += name.encode("ascii")
+    out += b" ( "
+    for arg in args:
+        _marshall_item(arg, out)
+    out += b") ) "
+
+
+def marshall_into(x, out):
+    """Marshall a Python data item, appending the result to a buffer.
+
+    :param x: Data item
+    :param out: bytearray to append the encoded item to; it is left
+        unchanged if the item can not be marshalled
+    """
+    start = len(out)
+    try:
+        _marshall_item(x, out)
+    except:
+        del out[start:]
+        raise
+
+
+def marshall_command(name, args, out):
+    """Marshall a command, appending the result to a buffer.
+
+    This is equivalent to marshall_into([literal(name), args], out) but
+    avoids creating the intermediate objects.
+
+    :param name: Command name
+    :param args: List of command arguments
+    :param out: bytearray to append the encoded command to; it is left
+        unchanged if the command can not be marshalled
+    """
+    start = len(out)
+    try:
+        _marshall_command(name, args, out)
+    except:
+        del out[start:]
+        raise
+
+
 def marshall(x):
     """Marshall a Python data item.
     
     :param x: Data item
     :return: encoded byte string
     """
-    if isinstance(x, int):
-        return ("%d " % x).encode("ascii")
-    elif isinstance(x, (list, tuple)):
-        return b"( " + bytes().join(map(marshall, x)) + b") "
-    elif isinstance(x, literal):
-        return ("%s " % x).encode("ascii")
-    elif isinstance(x, bytes):
-        return ("%d:" % len(x)).encode("ascii") + x + b" "
-    elif isinstance(x, str):
-        x = x.encode("utf-8")
-        return ("%d:" % len(x)).encode("ascii") + x + b" "
-    elif isinstance(x, bool):
-        if x == True:
-            return b"true "
-        elif x == False:
-            return b"false "
-    raise MarshallError("Unable to marshall type %s" % x)
+    out = bytearray()
+    _marshall_item(x, out)
+    return bytes(out)
+
+
+_WHITESPACE = frozenset(b"\n ")
+_DIGITS = re.compile(b"[0-9]+")
+_WORD = re.compile(b"[A-Za-z][A-Za-z0-9-]*")
+
+# Sentinel returned by _parse_item when the buffer ends mid-item.
+_INCOMPLETE = object()
+
+
+def _parse_item(buf, pos, end, stack):
+    """Parse the next complete item from a buffer.
+
+    Lists that have been opened but not yet closed are kept on ``stack``, so
+    that parsing can resume from the returned offset once more data is
+    available, without revisiting the items that have already been parsed.
+
+    :param buf: Buffer to parse (bytes or bytearray)
+    :param pos: Offset to start parsing at
+    :param end: Offset of the end of the valid data in buf
+    :param stack: List of partially parsed lists
+    :return: tuple with new offset and parsed item, or _INCOMPLETE if
+        the buffer ends before the item does
+    """
+    while True:
+        while pos < end and buf[pos] in _WHITESPACE:
+            pos += 1
+        if pos >= end:
+            return (pos, _INCOMPLETE)
+        c = buf[pos]
+        if c == 0x28: # "(", list follows
+            if pos + 1 >= end:
+                return (pos, _INCOMPLETE)
+            if not buf[pos+1] in _WHITESPACE:
+                raise MarshallError("missing whitespace after list start")
+            stack.append([])
+            pos += 2
+            continue
+        elif c == 0x29: # ")", end of list
+            if not stack:
+                raise MarshallError("Unexpected character ')'")
+            if pos + 1 >= end:
+                return (pos, _INCOMPLETE)
+            if not buf[pos+1] in _WHITESPACE:
+                raise MarshallError("Expected space, got '%c'" % buf[pos+1])
+            pos += 2
+            item = stack.pop()
+        elif 0x30 <= c <= 0x39: # number or string
+            digits_end = _DIGITS.match(buf, pos, end).end()
+            if digits_end >= end:
+                return (pos, _INCOMPLETE)
+            num = int(buf[pos:digits_end])
+            c = buf[digits_end]
+            if c in _WHITESPACE:
+                item = num
+                pos = digits_end + 1
+            elif c == 0x3a: # ":", string follows
+                if digits_end + 1 + num > end:
+                    return (pos, _INCOMPLETE)
+                pos = digits_end + 1 + num
+                item = bytes(buf[digits_end+1:pos])
+                if pos < end and buf[pos] in _WHITESPACE:
+                    pos += 1
+            else:
+                raise MarshallError("Expected whitespace or ':', got '%c'" % c)
+        elif (0x41 <= c <= 0x5a) or (0x61 <= c <= 0x7a): # word
+            word_end = _WORD.match(buf, pos, end).end()
+            if word_end >= end:
+                return (pos, _INCOMPLETE)
+            if not buf[word_end] in _WHITESPACE:
+                raise MarshallError("Expected whitespace, got '%c'" %
+                                    buf[word_end])
+            item = buf[pos:word_end].decode("ascii")
+            pos = word_end + 1
+        else:
+            raise MarshallError("Unexpected character '%c'" % c)
+        if not stack:
+            return (pos, item)
+        stack[-1].append(item)
 
 
 def unmarshall(x):
@@ -82,60 +261,80 @@ def unmarshall(x):
     :param x: Bytes to parse
     :return: tuple with unpacked item and remaining bytes
     """
-    whitespace = frozenset(b'\n ')
-    if len(x) == 0:
-        raise NeedMoreData("Not enough data")
-    if x[0] == ord(b"("): # list follows
-        if len(x) <= 1:
-            raise NeedMoreData("Missing whitespace")
-        if x[1] != ord(b" "):
-            raise MarshallError("missing whitespace after list start")
-        x = x[2:]
-        ret = []
-        try:
-            while x[0] != ord(b")"):
-                (x, n) = unmarshall(x)
-                ret.append(n)
-        except IndexError:
+    stack = []
+    (pos, ret) = _parse_item(x, 0, len(x), stack)
+    if ret is _INCOMPLETE:
+        if stack:
             raise NeedMoreData("List not terminated")
+        raise NeedMoreData("Not enough data")
+    return (x[pos:], ret)
+
+
+class Unmarshaller(object):
+    """Incremental decoder for the svn_ra protocol.
+
+    Data is added in arbitrarily sized chunks using feed(); complete items
+    can then be retrieved with read_item() or by iterating. Parsing keeps an
+    offset into the buffered data and resumes where it previously stopped,
+    so decoding is linear in the size of the input regardless of how it
+    was split up.
+    """
+
+    __slots__ = ('_buffer', '_offset', '_stack')
+
+    def __init__(self, data=b""):
+        self._buffer = bytearray(data)
+        self._offset = 0
+        self._stack = []
+
+    def feed(self, data):
+        """Add data to the buffer.
+
+        :param data: Bytes, bytearray or memoryview with data to add
+        """
+        if self._offset:
+            # Deleting from the start of a bytearray does not move the
+            # remaining data, it just advances the start of the buffer.
+            del self._buffer[:self._offset]
+            self._offset = 0
+        self._buffer += data
+
+    def read_item(self):
+        """Read the next complete item.
+
+        :return: Unpacked item
+        :raise NeedMoreData: if the buffer does not contain a complete item
+        """
+        (self._offset, ret) = _parse_item(self._buffer, self._offset,
+            len(self._buffer), self._stack)
+        if ret is _INCOMPLETE:
+            raise NeedMoreData("Not enough data")
+        return ret
+
+    def __iter__(self):
+        """Iterate over the complete items that are currently buffered."""
+        while True:
+            try:
+                yield self.read_item()
+            except NeedMoreData:
+                return
+
+    def unconsumed(self):
+        """Return the data that has been fed but not yet parsed.
+
+        Data belonging to lists that are only partially parsed is not
+        included.
+        """
+        return bytes(self._buffer[self._offset:])
 
-        if len(x) <= 1:
-            raise NeedMoreData("Missing whitespace")
-        
-        if not x[1] in whitespace:
-            raise MarshallError("Expected space, got '%c'" % x[1])
-
-        return (x[2:], ret)
-    elif x[:1].isdigit():
-        num = bytearray()
-        # Check if this is a string or a number
-        while x[:1].isdigit():
-            num.append(x[0])
-            x = x[1:]
-        num = int(num)
-
-        if x[0] in whitespace:
-            return (x[1:], num)
-        elif x[0] == ord(b":"):
-            if len(x) < num:
-                raise NeedMoreData("Expected string of length %r" % num)
-            return (x[num+2:], x[1:num+1])
-        else:
-            raise MarshallError("Expected whitespace or ':', got '%c'" % x[0])
-    elif x[:1].isalpha():
-        ret = bytearray()
-        # Parse literal
-        try:
-            while x[:1].isalpha() or x[:1].isdigit() or x[0] == ord(b'-'):
-                ret.append(x[0])
-                x = x[1:]
-        except IndexError:
-            raise NeedMoreData("Expected literal")
-
-        if not x[0] in whitespace:
-            raise MarshallError("Expected whitespace, got '%c'" % x[0])
-
-        return (x[1:], ret.decode("ascii"))
-    else:
-        raise MarshallError("Unexpected character '%c'" % x[0])
 
+try:
+    from subvertpy._marshall import (
+        _parse_item,
+        marshall,
+        marshall_command,
+        marshall_into,
+        unmarshall,
+        )
+except ImportError:
+    pass
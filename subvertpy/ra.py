@@ -23,6 +23,8 @@ from subvertpy import _ra
 from subvertpy._ra import *
 from subvertpy import ra_svn
 
+import functools
+import threading
 import urllib.parse
 
 url_handlers = {
@@ -47,3 +49,209 @@ def RemoteAccess(url, *args, **kwargs):
     if not type in url_handlers:
         raise SubversionException("Unknown URL type '%s'" % type, ERR_BAD_URL)
     return url_handlers[type](url, *args, **kwargs)
+
+
+# Methods on recorded editors that return a new editor object.
+_EDITOR_OPENERS = frozenset([
+    "open_root", "add_directory", "open_directory", "add_file",
+    "open_file", "apply_textdelta"])
+
+
+class _RecordedEditor(object):
+    """Stand-in for an editor, directory, file or window handler object
+    that records the calls made on it."""
+
+    def __init__(self, recorder, node_id):
+        self._recorder = recorder
+        self._id = node_id
+
+    def __getattr__(self, name):
+        return functools.partial(self._recorder.record, self._id, name)
+
+    def __call__(self, *args):
+        # Text delta window
+        self._recorder.record(self._id, None, *args)
+
+
+class EditorRecorder(object):
+    """Records an editor drive so that it can be replayed later."""
+
+    def __init__(self):
+        self.ops = []
+        self._next_id = 1
+
+    def editor(self):
+        """Return the editor object to drive."""
+        return _RecordedEditor(self, 0)
+
+    def record(self, node_id, name, *args):
+        if name not in _EDITOR_OPENERS:
+            self.ops.append((node_id, name, args, None))
+            return None
+        new_id = self._next_id
+        self._next_id += 1
+        self.ops.append((node_id, name, args, new_id))
+        return _RecordedEditor(self, new_id)
+
+    def replay(self, editor):
+        """Replay the recorded calls onto an editor.
+
+        :param editor: Editor to drive
+        """
+        nodes = {0: editor}
+        for (node_id, name, args, new_id) in self.ops:
+            obj = nodes[node_id]
+            if name is None:
+                ret = obj(*args)
+            else:
+                ret = getattr(obj, name)(*args)
+            if new_id is not None:
+                nodes[new_id] = ret
+
+
+class _ReplayAborted(Exception):
+    """Raised in worker threads to stop a parallel replay."""
+
+
+class _ParallelReplay(object):
+
+    def __init__(self, start_rev, end_rev, low_water_mark, send_deltas,
+                 window, chunk_size):
+        self.end_rev = end_rev
+        self.low_water_mark = low_water_mark
+        self.send_deltas = send_deltas
+        self.window = window
+        self.chunk_size = chunk_size
+        self._cond = threading.Condition()
+        # Next revision to be assigned to a worker
+        self._next_chunk = start_rev
+        # Next revision to be delivered to the caller
+        self._next_rev = start_rev
+        self._results = {}
+        self._errors = {}
+        self._aborted = False
+        # Recorder for the revision each worker thread is replaying
+        self._recorders = {}
+
+    def _take_chunk(self):
+        with self._cond:
+            if self._aborted or self._next_chunk > self.end_rev:
+                return None
+            start = self._next_chunk
+            end = min(start + self.chunk_size - 1, self.end_rev)
+            self._next_chunk = end + 1
+            return (start, end)
+
+    def _start_rev(self, revnum, revprops):
+        with self._cond:
+            while (not self._aborted and
+                   revnum >= self._next_rev + self.window):
+                self._cond.wait()
+            if self._aborted:
+                raise _ReplayAborted()
+        recorder = EditorRecorder()
+        self._recorders[threading.get_ident()] = recorder
+        return recorder.editor()
+
+    def _finish_rev(self, revnum, revprops, editor):
+        recorder = self._recorders.pop(threading.get_ident())
+        with self._cond:
+            self._results[revnum] = (revprops, recorder)
+            self._cond.notify_all()
+
+    def work(self, session):
+        while True:
+            chunk = self._take_chunk()
+            if chunk is None:
+                return
+            (start, end) = chunk
+            try:
+                session.replay_range(
+                    start, end, self.low_water_mark,
+                    (self._start_rev, self._finish_rev), self.send_deltas)
+            except _ReplayAborted:
+                return
+            except BaseException as e:
+                self._recorders.pop(threading.get_ident(), None)
+                with self._cond:
+                    # Report the error at the first revision of the chunk
+                    # that did not complete.
+                    failed = max(start, self._next_rev)
+                    while failed in self._results:
+                        failed += 1
+                    if failed <= end:
+                        self._errors[failed] = e
+                        self._cond.notify_all()
+                return
+
+    def next_result(self):
+        """Wait for the next revision in order.
+
+        :return: Tuple with revision number, revision properties and
+            recorder
+        """
+        with self._cond:
+            revnum = self._next_rev
+            while (revnum not in self._results and
+                   revnum not in self._errors):
+                self._cond.wait()
+            if revnum not in self._results:
+                raise self._errors[revnum]
+            (revprops, recorder) = self._results.pop(revnum)
+            self._next_rev += 1
+            self._cond.notify_all()
+        return (revnum, revprops, recorder)
+
+    def abort(self):
+        with self._cond:
+            self._aborted = True
+            self._cond.notify_all()
+
+
+def replay_range_parallel(sessions, start_rev, end_rev, low_water_mark, cbs,
+                          send_deltas=True, window=None, chunk_size=10):
+    """Replay a range of revisions using several sessions at once.
+
+    The range is split into chunks of revisions that are replayed
+    concurrently, one thread per session. Editor drives are recorded and
+    delivered to the callbacks in the calling thread, in strict revision
+    order, so the callbacks behave as with RemoteAccess.replay_range().
+
+    :param sessions: List of RemoteAccess objects for the same repository;
+        none of them should be in use by anything else
+    :param start_rev: First revision to replay
+    :param end_rev: Last revision to replay
+    :param low_water_mark: Low water mark, as for replay_range()
+    :param cbs: Tuple with start_rev_cb(revision, revprops) -> editor and
+        finish_rev_cb(revision, revprops, editor)
+    :param send_deltas: Whether to send text deltas
+    :param window: Maximum number of revisions that may be fetched ahead of
+        the revision that is being delivered, which limits memory use.
+        Defaults to twice the number of revisions in flight.
+    :param chunk_size: Number of revisions to replay per request
+    """
+    (start_rev_cb, finish_rev_cb) = cbs
+    if not sessions:
+        raise ValueError("at least one session is required")
+    if chunk_size < 1:
+        raise ValueError("chunk_size should be at least 1")
+    if window is None:
+        window = 2 * chunk_size * len(sessions)
+    elif window < 1:
+        raise ValueError("window should be at least 1")
+    replay = _ParallelReplay(start_rev, end_rev, low_water_mark, send_deltas,
+                             window, chunk_size)
+    threads = [threading.Thread(target=replay.work, args=(session,))
+               for session in sessions]
+    for t in threads:
+        t.start()
+    try:
+        for i in range(start_rev, end_rev + 1):
+            (revnum, revprops, recorder) = replay.next_result()
+            editor = start_rev_cb(revnum, revprops)
+            recorder.replay(editor)
+            finish_rev_cb(revnum, revprops, editor)
+    finally:
+        replay.abort()
+        for t in threads:
+            t.join()
@@ -17,15 +17,26 @@
 
 __author__ = "Jelmer Vernooij <jelmer@samba.org>"
 
+import asyncio
+import concurrent.futures
+import contextlib
 import socketserver
 import base64
 import os
+import select
+import shutil
 import socket
 import subprocess
-from errno import EPIPE
+import tempfile
+import threading
+import time
+from errno import ECONNRESET, EPIPE
+from hashlib import md5
 import urllib.parse
 
 from subvertpy import (
+    ERR_CHECKSUM_MISMATCH,
+    ERR_RA_SVN_CONNECTION_CLOSED,
     ERR_RA_SVN_UNKNOWN_CMD,
     ERR_UNSUPPORTED_FEATURE,
     NODE_DIR,
@@ -36,15 +47,16 @@ from subvertpy import (
     properties,
     )
 from subvertpy.delta import (
-    pack_svndiff0_window,
-    unpack_svndiff0,
-    SVNDIFF0_HEADER,
+    SVNDIFF_HEADERS,
+    SVNDIFF_VERSIONS,
+    SvndiffDecoder,
+    pack_svndiff_window,
     )
 from subvertpy.marshall import (
     NeedMoreData,
+    Unmarshaller,
     literal,
-    marshall,
-    unmarshall,
+    marshall_into,
     )
 from subvertpy._ra import (
     DIRENT_CREATED_REV,
@@ -73,6 +85,9 @@ class SSHSubprocess(object):
     def recv(self, count):
         return os.read(self.proc.stdout.fileno(), count)
 
+    def recv_into(self, buffer):
+        return os.readv(self.proc.stdout.fileno(), [buffer])
+
     def close(self):
         self.proc.stdin.close()
         self.proc.stdout.close()
@@ -84,45 +99,207 @@ class SSHSubprocess(object):
 
 class SSHVendor(object):
 
-    def connect_ssh(self, username, password, host, port, command):
+    def _ssh_args(self, username, host, port):
         args = ['ssh', '-x']
         if port is not None:
             args.extend(['-p', str(port)])
         if username is not None:
             host = "%s@%s" % (username, host)
         args.append(host)
-        proc = subprocess.Popen(args + command,
+        return args
+
+    def connect_ssh(self, username, password, host, port, command):
+        proc = subprocess.Popen(self._ssh_args(username, host, port) + command,
                                 stdin=subprocess.PIPE,
                                 stdout=subprocess.PIPE)
         return SSHSubprocess(proc)
 
 
+class MultiplexingSSHVendor(SSHVendor):
+    """SSH vendor that shares one master connection per host and user.
+
+    The first session to a host starts an OpenSSH master connection
+    (ControlMaster); later sessions to the same host, port and user are
+    multiplexed over it, skipping the key exchange and authentication.
+    The master stays around for persist seconds after its last session
+    has finished.
+
+    Since get_ssh_vendor is called for every connection, install a single
+    instance to share it between clients::
+
+        vendor = MultiplexingSSHVendor()
+        ra_svn.get_ssh_vendor = lambda: vendor
+    """
+
+    def __init__(self, control_dir=None, persist=300):
+        """Create a new vendor.
+
+        :param control_dir: Directory for the control sockets; a private
+            temporary directory is created if this is None
+        :param persist: Number of seconds to keep an unused master
+            connection open
+        """
+        if control_dir is None:
+            control_dir = tempfile.mkdtemp(prefix="subvertpy-ssh-")
+            self._remove_control_dir = True
+        else:
+            self._remove_control_dir = False
+        self.control_dir = control_dir
+        self.persist = persist
+        self._hosts = set()
+
+    def _control_args(self):
+        # %C is a hash of the local host, remote host, port and user,
+        # which keeps the socket path short.
+        return ['-o', 'ControlPath=%s' % os.path.join(self.control_dir, "%C")]
+
+    def _ssh_args(self, username, host, port):
+        args = super(MultiplexingSSHVendor, self)._ssh_args(
+            username, host, port)
+        return (args[:-1] + self._control_args() +
+                ['-o', 'ControlMaster=auto',
+                 '-o', 'ControlPersist=%d' % self.persist, args[-1]])
+
+    def connect_ssh(self, username, password, host, port, command):
+        self._hosts.add((username, host, port))
+        return super(MultiplexingSSHVendor, self).connect_ssh(
+            username, password, host, port, command)
+
+    def close(self):
+        """Shut down the master connections started by this vendor."""
+        for (username, host, port) in self._hosts:
+            args = SSHVendor._ssh_args(self, username, host, port)
+            subprocess.call(args[:-1] + self._control_args() +
+                            ['-O', 'exit', args[-1]],
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+        self._hosts.clear()
+        if self._remove_control_dir:
+            shutil.rmtree(self.control_dir, ignore_errors=True)
+
+
 # Can be overridden by users
 get_ssh_vendor = SSHVendor
 
 
-class SVNConnection(object):
+# Maximum number of bytes to read from the connection at once
+RECV_SIZE = 64 * 1024
+
+# Number of bytes of pipelined messages to buffer before sending them
+SEND_SIZE = 64 * 1024
 
-    def __init__(self, recv_fn, send_fn):
-        self.inbuffer = ""
+
+class SVNConnection(object):
+    """A connection speaking the svn_ra protocol.
+
+    Incoming data is read in blocks of up to recv_size bytes and handed to
+    an incremental decoder, which resumes parsing where it stopped when a
+    message spans multiple reads.
+
+    If pipelined is set, outgoing messages are buffered and sent together
+    once send_size bytes have been collected, when flush() is called or
+    before waiting for incoming data. Otherwise every message is sent
+    as soon as it has been marshalled.
+
+    :ivar bytes_received: Total number of bytes read from the connection
+    :ivar recv_calls: Number of calls made to the receive function
+    :ivar bytes_sent: Total number of bytes written to the connection
+    :ivar send_calls: Number of calls made to the send function
+    """
+
+    def __init__(self, recv_fn, send_fn, recv_size=RECV_SIZE,
+                 recv_into_fn=None, send_size=SEND_SIZE):
+        """Create a new connection.
+
+        :param recv_fn: Function that reads up to the specified number of
+            bytes, returning an empty string at end of file
+        :param send_fn: Function that writes bytes
+        :param recv_size: Maximum number of bytes to read at once
+        :param recv_into_fn: Optional function that reads into a writable
+            buffer and returns the number of bytes read, used instead of
+            recv_fn so that a single receive buffer can be reused
+        :param send_size: Number of bytes to buffer before sending when
+            pipelining
+        """
+        self._decoder = Unmarshaller()
+        self._outbuffer = bytearray()
         self.recv_fn = recv_fn
         self.send_fn = send_fn
+        self.recv_size = recv_size
+        self.recv_into_fn = recv_into_fn
+        if recv_into_fn is not None:
+            self._recv_buffer = bytearray(recv_size)
+        self.send_size = send_size
+        self.pipelined = False
+        self.svndiff_version = 0
+        self.bytes_received = 0
+        self.recv_calls = 0
+        self.bytes_sent = 0
+        self.send_calls = 0
+
+    def _recv_more(self):
+        # The other side may be waiting for pending messages before it
+        # sends anything.
+        self.flush()
+        self.recv_calls += 1
+        if self.recv_into_fn is not None:
+            n = self.recv_into_fn(self._recv_buffer)
+            with memoryview(self._recv_buffer) as view:
+                self._decoder.feed(view[:n])
+        else:
+            newdata = self.recv_fn(self.recv_size)
+            n = len(newdata)
+            self._decoder.feed(newdata)
+        if n == 0:
+            raise SubversionException("Connection closed",
+                                      ERR_RA_SVN_CONNECTION_CLOSED)
+        self.bytes_received += n
 
     def recv_msg(self):
         while True:
             try:
-                (self.inbuffer, ret) = unmarshall(self.inbuffer)
-                return ret
+                return self._decoder.read_item()
             except NeedMoreData:
-                newdata = self.recv_fn(1)
-                if newdata != "":
-                    #self.mutter("IN: %r" % newdata)
-                    self.inbuffer += newdata
+                self._recv_more()
+
+    def flush(self):
+        """Send any buffered messages."""
+        if not self._outbuffer:
+            return
+        try:
+            with memoryview(self._outbuffer) as view:
+                offset = 0
+                while offset < len(view):
+                    n = self.send_fn(view[offset:])
+                    self.send_calls += 1
+                    if n is None: # File-like objects may not return a count
+                        n = len(view) - offset
+                    offset += n
+                    self.bytes_sent += n
+        finally:
+            del self._outbuffer[:]
+
+    def _flush_if_full(self):
+        if not self.pipelined or len(self._outbuffer) >= self.send_size:
+            self.flush()
 
     def send_msg(self, data):
-        marshalled_data = marshall(data)
-        # self.mutter("OUT: %r" % marshalled_data)
-        self.send_fn(marshalled_data)
+        marshall_into(data, self._outbuffer)
+        # self.mutter("OUT: %r" % self._outbuffer)
+        self._flush_if_full()
+
+    def send_list_start(self):
+        """Start a list whose items are then sent one by one.
+
+        This allows sending long lists without building them in memory
+        first. Every call must be matched by a call to send_list_end().
+        """
+        self._outbuffer += b"( "
+
+    def send_list_end(self):
+        """End a list started with send_list_start()."""
+        self._outbuffer += b") "
+        self._flush_if_full()
 
     def send_success(self, *contents):
         self.send_msg([literal("success"), list(contents)])
@@ -130,6 +307,9 @@ class SVNConnection(object):
 
 SVN_PORT = 3690
 
+# Number of bytes of file contents to send per string for get-file
+GET_FILE_CHUNK_SIZE = 64 * 1024
+
 
 def feed_editor(conn, editor):
     tokens = {}
@@ -178,13 +358,17 @@ def feed_editor(conn, editor):
                 txdelta_handler[args[0]] = tokens[args[0]].apply_textdelta(None)
             else:
                 txdelta_handler[args[0]] = tokens[args[0]].apply_textdelta(args[1][0])
-            diff[args[0]] = ""
+            diff[args[0]] = SvndiffDecoder()
         elif command == "textdelta-chunk":
-            diff[args[0]] += args[1]
-        elif command == "textdelta-end":
-            for w in unpack_svndiff0(diff[args[0]]):
+            # Pass on windows as soon as they are complete, so only the
+            # window currently being received is kept in memory.
+            decoder = diff[args[0]]
+            decoder.feed(args[1])
+            for w in decoder:
                 txdelta_handler[args[0]](w)
-            txdelta_handler[args[0]](None)
+        elif command == "textdelta-end":
+            diff.pop(args[0]).close()
+            txdelta_handler.pop(args[0])(None)
         elif command == "change-file-prop":
             if len(args[2]) == 0:
                 tokens[args[0]].change_prop(args[1], None)
@@ -198,6 +382,9 @@ def feed_editor(conn, editor):
         elif command == "close-edit":
             editor.close()
             break
+        elif command == "finish-replay":
+            # Replays are not closed and don't get a response
+            return
         elif command == "abort-edit":
             editor.abort()
             break
@@ -249,6 +436,7 @@ class Reporter(object):
 
     def abort(self):
         self.conn.send_msg([literal("abort-report"), []])
+        self.conn.flush()
         self.conn.busy = False
 
 
@@ -368,13 +556,14 @@ class FileEditor(object):
             base_check = []
         else:
             base_check = [base_checksum]
+        version = self.conn.svndiff_version
         self.conn.send_msg([literal("apply-textdelta"), [self.id, base_check]])
-        self.conn.send_msg([literal("textdelta-chunk"), [self.id, SVNDIFF0_HEADER]])
+        self.conn.send_msg([literal("textdelta-chunk"), [self.id, SVNDIFF_HEADERS[version]]])
         def send_textdelta(delta):
             if delta is None:
                 self.conn.send_msg([literal("textdelta-end"), [self.id]])
             else:
-                self.conn.send_msg([literal("textdelta-chunk"), [self.id, pack_svndiff0_window(delta)]])
+                self.conn.send_msg([literal("textdelta-chunk"), [self.id, pack_svndiff_window(delta, version)]])
         return send_textdelta
 
     def change_prop(self, name, value):
@@ -386,6 +575,19 @@ class FileEditor(object):
         self.conn.send_msg([literal("change-file-prop"), [self.id, name, value]])
 
 
+def choose_svndiff_version(capabilities):
+    """Pick the svndiff version to send to a peer.
+
+    :param capabilities: Capabilities advertised by the peer
+    :return: Highest svndiff version supported by both sides
+    """
+    if "accepts-svndiff2" in capabilities and 2 in SVNDIFF_VERSIONS:
+        return 2
+    if "svndiff1" in capabilities:
+        return 1
+    return 0
+
+
 def mark_busy(unbound):
     
     def convert(self, *args, **kwargs):
@@ -400,6 +602,195 @@ def mark_busy(unbound):
     convert.__name__ = unbound.__name__
     return convert
 
+def unpack_response(msg):
+    """Check a command response and return its parameters.
+
+    :param msg: Unmarshalled response
+    :return: List with the parameters of a success response
+    :raises SubversionException: if the response is a failure
+    """
+    if msg[0] == "failure":
+        if isinstance(msg[1], str):
+            raise SubversionException(*msg[1])
+        num = msg[1][0][0]
+        msg = msg[1][0][1]
+        if num == ERR_RA_SVN_UNKNOWN_CMD:
+            raise NotImplementedError(msg)
+        raise SubversionException(msg, num)
+    assert msg[0] == "success", "Got: %r" % msg
+    assert len(msg) == 2
+    return msg[1]
+
+
+def _revision_arg(revision):
+    if revision is None or revision == -1:
+        return []
+    else:
+        return [revision]
+
+
+def _get_dir_args(path, revision, dirent_fields, want_props, want_contents):
+    args = [path, _revision_arg(revision), want_props, want_contents]
+
+    fields = []
+    if dirent_fields & DIRENT_KIND:
+        fields.append(literal("kind"))
+    if dirent_fields & DIRENT_SIZE:
+        fields.append(literal("size"))
+    if dirent_fields & DIRENT_HAS_PROPS:
+        fields.append(literal("has-props"))
+    if dirent_fields & DIRENT_CREATED_REV:
+        fields.append(literal("created-rev"))
+    if dirent_fields & DIRENT_TIME:
+        fields.append(literal("time"))
+    if dirent_fields & DIRENT_LAST_AUTHOR:
+        fields.append(literal("last-author"))
+    args.append(fields)
+    return args
+
+
+def _unpack_get_dir(ret):
+    fetch_rev = ret[0]
+    props = dict(ret[1])
+    dirents = {}
+    for d in ret[2]:
+        entry = unmarshall_dirent(d)
+        dirents[entry["name"]] = entry
+    return (dirents, fetch_rev, props)
+
+
+def _log_args(paths, start, end, limit, discover_changed_paths,
+              strict_node_history, include_merged_revisions, revprops):
+    args = [paths, _revision_arg(start), _revision_arg(end),
+            discover_changed_paths, strict_node_history, limit,
+            include_merged_revisions]
+    if revprops is None:
+        args.append(literal("all-revprops"))
+        args.append([])
+    else:
+        args.append(literal("revprops"))
+        args.append(revprops)
+    return args
+
+
+def _unpack_log_entry(msg):
+    paths = {}
+    for p, action, cfd in msg[0]:
+        if len(cfd) == 0:
+            paths[p] = (str(action), None, -1)
+        else:
+            paths[p] = (str(action), cfd[0], cfd[1])
+
+    if len(msg) > 5:
+        has_children = msg[5]
+    else:
+        has_children = None
+    revprops = {}
+    if len(msg[2]) != 0:
+        revprops[properties.PROP_REVISION_AUTHOR] = msg[2][0]
+    if len(msg[3]) != 0:
+        revprops[properties.PROP_REVISION_DATE] = msg[3][0]
+    if len(msg[4]) != 0:
+        revprops[properties.PROP_REVISION_LOG] = msg[4][0]
+    if len(msg) > 8:
+        revprops.update(dict(msg[8]))
+    return paths, msg[1], revprops, has_children
+
+
+def _unmarshall_bool(value):
+    # Subversion sends booleans as the words true and false, subvertpy
+    # itself as numbers.
+    if isinstance(value, str):
+        return value == "true"
+    return bool(value)
+
+
+def marshall_dirent(dirent):
+    """Convert a dirent dictionary to its wire representation.
+
+    :param dirent: Dictionary with name, kind, size, has-props,
+        created-rev and optionally created-date and last-author keys
+    :return: List as sent by the server
+    """
+    ret = [dirent["name"], dirent["kind"], dirent["size"],
+           dirent["has-props"], dirent["created-rev"]]
+    if "created-date" in dirent:
+        ret.append([dirent["created-date"]])
+    else:
+        ret.append([])
+    if "last-author" in dirent:
+        ret.append([dirent["last-author"]])
+    else:
+        ret.append([])
+    return ret
+
+
+def _optional(value):
+    if value is None:
+        return ()
+    return (value,)
+
+
+def marshall_log_entry(entry, out, changed_paths=True, revprops=None):
+    """Append the wire representation of a log entry to a buffer.
+
+    :param entry: LogEntry to encode
+    :param out: bytearray to append to
+    :param changed_paths: Whether to include the changed paths
+    :param revprops: Set with the names of the revision properties to
+        include, or None for all
+    """
+    out += b"( ( "
+    if changed_paths and entry.changed_paths:
+        for (path, (action, copyfrom_path, copyfrom_rev)) in (
+                entry.changed_paths.items()):
+            if copyfrom_path is None:
+                marshall_into((path, literal(action), ()), out)
+            else:
+                marshall_into((path, literal(action),
+                               (copyfrom_path, copyfrom_rev)), out)
+    out += b") "
+    if revprops is None:
+        author = entry.author
+        date = entry.date
+        message = entry.message
+        extra = entry.revprops
+    else:
+        author = date = message = None
+        if properties.PROP_REVISION_AUTHOR in revprops:
+            author = entry.author
+        if properties.PROP_REVISION_DATE in revprops:
+            date = entry.date
+        if properties.PROP_REVISION_LOG in revprops:
+            message = entry.message
+        if entry.revprops:
+            extra = dict((name, value)
+                         for (name, value) in entry.revprops.items()
+                         if _revprop_name(name) in revprops)
+        else:
+            extra = None
+    if extra:
+        # has-children and invalid-revnum come before the other revision
+        # properties.
+        fields = (entry.revnum, _optional(author), _optional(date),
+                  _optional(message), False, False, len(extra),
+                  tuple(extra.items()))
+    else:
+        fields = (entry.revnum, _optional(author), _optional(date),
+                  _optional(message))
+    # The fields continue the entry list, so leave out their opening
+    # bracket; the closing one ends the entry.
+    start = len(out)
+    marshall_into(fields, out)
+    del out[start:start+2]
+
+
+def _revprop_name(name):
+    if isinstance(name, bytes):
+        return name.decode("utf-8")
+    return name
+
+
 def unmarshall_dirent(d):
     ret = {
         "name": d[0],
@@ -409,9 +800,9 @@ def unmarshall_dirent(d):
         "created-rev": d[4],
         }
     if d[5] != []:
-        ret["created-date"] = d[5]
+        ret["created-date"] = d[5][0]
     if d[6] != []:
-        ret["last-author"] = d[6]
+        ret["last-author"] = d[6][0]
     return ret
 
 
@@ -419,6 +810,7 @@ class SVNClient(SVNConnection):
 
     def __init__(self, url, progress_cb=None, auth=None, config=None, 
                  client_string_func=None, open_tmp_file_func=None):
+        start_time = time.monotonic()
         self.url = url
         (type, opaque) = urllib.parse.splittype(url)
         assert type in ("svn", "svn+ssh")
@@ -428,37 +820,33 @@ class SVNClient(SVNConnection):
         self._config = config
         self._client_string_func = client_string_func
         # open_tmp_file_func is ignored, as it is not needed for svn://
+        self._socket = None
+        self._tunnel = None
         if type == "svn":
-            (recv_func, send_func) = self._connect(host)
+            (recv_func, send_func, recv_into_func) = self._connect(host)
         else:
-            (recv_func, send_func) = self._connect_ssh(host)
-        super(SVNClient, self).__init__(recv_func, send_func)
+            (recv_func, send_func, recv_into_func) = self._connect_ssh(host)
+        super(SVNClient, self).__init__(recv_func, send_func,
+                                        recv_into_fn=recv_into_func)
         (min_version, max_version, _, self._server_capabilities) = self._recv_greeting()
         self.send_msg([max_version, [literal(x) for x in CAPABILITIES if x in self._server_capabilities], self.url])
         (self._server_mechanisms, mech_arg) = self._unpack()
         if self._server_mechanisms != []:
             # FIXME: Support other mechanisms as well
-            self.send_msg([literal("ANONYMOUS"), [base64.b64encode("anonymous@%s" % socket.gethostname())]])
+            self.send_msg([literal("ANONYMOUS"), [base64.b64encode(("anonymous@%s" % socket.gethostname()).encode("utf-8"))]])
             self.recv_msg()
         msg = self._unpack()
         if len(msg) > 2:
             self._server_capabilities += msg[2]
         (self._uuid, self._root_url) = msg[0:2]
+        self.pipelined = self.has_capability("edit-pipeline")
+        self.svndiff_version = choose_svndiff_version(self._server_capabilities)
         self.busy = False
+        # Seconds spent connecting and performing the handshake
+        self.setup_time = time.monotonic() - start_time
 
     def _unpack(self):
-        msg = self.recv_msg()
-        if msg[0] == "failure":
-            if isinstance(msg[1], str):
-                raise SubversionException(*msg[1])
-            num = msg[1][0][0]
-            msg = msg[1][0][1]
-            if num == ERR_RA_SVN_UNKNOWN_CMD:
-                raise NotImplementedError(msg)
-            raise SubversionException(msg, num)
-        assert msg[0] == "success", "Got: %r" % msg
-        assert len(msg) == 2
-        return msg[1]
+        return unpack_response(self.recv_msg())
 
     def _recv_greeting(self):
         greeting = self._unpack()
@@ -472,6 +860,7 @@ class SVNClient(SVNConnection):
         sockaddrs = socket.getaddrinfo(host, port, socket.AF_UNSPEC,
                socket.SOCK_STREAM, 0, 0)
         
+        sockerr = None
         try:
             self._socket = None
             for (family, socktype, proto, canonname, sockaddr) in sockaddrs:
@@ -491,17 +880,50 @@ class SVNClient(SVNConnection):
             del sockerr  # Avoid reference cycle via traceback
         
         self._socket.setblocking(True)
-        return (self._socket.recv, self._socket.send)
+        return (self._socket.recv, self._socket.send, self._socket.recv_into)
 
     def _connect_ssh(self, host):
         (user, host) = urllib.parse.splituser(host)
         if user is not None:
-            (user, password) = urllib.splitpassword(user)
+            (user, password) = urllib.parse.splitpasswd(user)
         else:
             password = None
         (host, port) = urllib.parse.splitnport(host, 22)
         self._tunnel = get_ssh_vendor().connect_ssh(user, password, host, port, ["svnserve", "-t"])
-        return (self._tunnel.recv, self._tunnel.send)
+        return (self._tunnel.recv, self._tunnel.send,
+                getattr(self._tunnel, "recv_into", None))
+
+    def close(self):
+        """Close the connection to the server."""
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+        if self._tunnel is not None:
+            self._tunnel.close()
+            self._tunnel = None
+
+    def check_connection(self):
+        """Check whether this session can be used for a new command.
+
+        This does not talk to the server; it only verifies that the
+        connection is still open and that no unexpected data is waiting.
+
+        :return: True if the session is usable
+        """
+        if self.busy or self._decoder.unconsumed():
+            return False
+        if self._socket is not None:
+            fd = self._socket.fileno()
+        elif self._tunnel is not None:
+            fd = self._tunnel.get_filelike_channels()[0].fileno()
+        else:
+            return False
+        if fd < 0:
+            return False
+        # A connection that is idle on our side should not be readable;
+        # if it is, the server either closed it or is sending garbage.
+        (readable, _, _) = select.select([fd], [], [], 0)
+        return not readable
 
     def get_file_revs(self, path, start, end, file_rev_handler):
         raise NotImplementedError(self.get_file_revs)
@@ -584,49 +1006,15 @@ class SVNClient(SVNConnection):
 
     @mark_busy
     def get_dir(self, path, revision=-1, dirent_fields=0, want_props=True, want_contents=True):
-        args = [path]
-        if revision is None or revision == -1:
-            args.append([])
-        else:
-            args.append([revision])
-        
-        args += [want_props, want_contents]
-
-        fields = []
-        if dirent_fields & DIRENT_KIND:
-            fields.append(literal("kind"))
-        if dirent_fields & DIRENT_SIZE:
-            fields.append(literal("size"))
-        if dirent_fields & DIRENT_HAS_PROPS:
-            fields.append(literal("has-props"))
-        if dirent_fields & DIRENT_CREATED_REV:
-            fields.append(literal("created-rev"))
-        if dirent_fields & DIRENT_TIME:
-            fields.append(literal("time"))
-        if dirent_fields & DIRENT_LAST_AUTHOR:
-            fields.append(literal("last-author"))
-        args.append(fields)
-
+        args = _get_dir_args(path, revision, dirent_fields, want_props,
+                             want_contents)
         self.send_msg([literal("get-dir"), args])
         self._recv_ack()
-        ret = self._unpack()
-        fetch_rev = ret[0]
-        props = dict(ret[1])
-        dirents = {}
-        for d in ret[2]:
-            entry = unmarshall_dirent(d)
-            dirents[entry["name"]] = entry
-
-        return (dirents, fetch_rev, props)
+        return _unpack_get_dir(self._unpack())
 
     @mark_busy
     def stat(self, path, revision=-1):
-        args = [path]
-        if revision is None or revision == -1:
-            args.append([revision])
-        else:
-            args.append([])
-
+        args = [path, _revision_arg(revision)]
         self.send_msg([literal("stat"), args])
         self._recv_ack()
         ret = self._unpack()
@@ -636,7 +1024,25 @@ class SVNClient(SVNConnection):
 
     @mark_busy
     def get_file(self, path, stream, revision=-1):
-        raise NotImplementedError(self.get_file)
+        args = [path, _revision_arg(revision), True, True]
+        self.send_msg([literal("get-file"), args])
+        self._recv_ack()
+        ret = self._unpack()
+        checksum = ret[0]
+        fetch_rev = ret[1]
+        props = dict(ret[2])
+        hash = md5()
+        while True:
+            data = self.recv_msg()
+            if not data:
+                break
+            hash.update(data)
+            stream.write(data)
+        self._unpack()
+        if checksum and hash.hexdigest().encode("ascii") != checksum[0]:
+            raise SubversionException("Checksum mismatch for %s" % path,
+                                      ERR_CHECKSUM_MISMATCH)
+        return (fetch_rev, props)
 
     def change_rev_prop(self, rev, name, value):
         args = [rev, name]
@@ -781,63 +1187,41 @@ class SVNClient(SVNConnection):
     def get_uuid(self):
         return self._uuid
 
-    @mark_busy
     def log(self, paths, start, end, limit=0, 
                 discover_changed_paths=True, strict_node_history=True, 
                 include_merged_revisions=True, revprops=None):
-        args = [paths]
-        if start is None or start == -1:
-            args.append([])
-        else:
-            args.append([start])
-        if end is None or end == -1:
-            args.append([])
-        else:
-            args.append([end])
-        args.append(discover_changed_paths)
-        args.append(strict_node_history)
-        args.append(limit)
-        args.append(include_merged_revisions)
-        if revprops is None:
-            args.append(literal("all-revprops"))
-            args.append([])
-        else:
-            args.append(literal("revprops"))
-            args.append(revprops)
-
+        """Iterate over log entries.
+
+        The session is busy from the first entry until the iterator has
+        been exhausted. If the iterator is closed early the remaining
+        entries are read and discarded, so the session stays usable.
+        """
+        args = _log_args(paths, start, end, limit, discover_changed_paths,
+                         strict_node_history, include_merged_revisions,
+                         revprops)
+        self.busy = True
         self.send_msg([literal("log"), args])
-        self._recv_ack()
-        while True:
-            msg = self.recv_msg()
-            if msg == "done":
-                break
-            paths = {}
-            for p, action, cfd in msg[0]:
-                if len(cfd) == 0:
-                    paths[p] = (str(action), None, -1)
-                else:
-                    paths[p] = (str(action), cfd[0], cfd[1])
-
-            if len(msg) > 5:
-                has_children = msg[5]
-            else:
-                has_children = None
-            if len(msg) > 6 and msg[6]:
-                revno = None
-            else:
-                revno = msg[1]
-            revprops = {}
-            if len(msg[2]) != 0:
-                revprops[properties.PROP_REVISION_AUTHOR] = msg[2][0]
-            if len(msg[3]) != 0:
-                revprops[properties.PROP_REVISION_DATE] = msg[3][0]
-            if len(msg[4]) != 0:
-                revprops[properties.PROP_REVISION_LOG] = msg[4][0]
-            if len(msg) > 8:
-                revprops.update(dict(msg[8]))
-            yield paths, msg[1], revprops, has_children
-
-        self._unpack()
+        try:
+            self._recv_ack()
+        except SubversionException:
+            self.busy = False
+            raise
+        try:
+            while True:
+                msg = self.recv_msg()
+                if msg == "done":
+                    break
+                yield _unpack_log_entry(msg)
+        except GeneratorExit:
+            while self.recv_msg() != "done":
+                pass
+            self._unpack()
+            self.busy = False
+            raise
+        try:
+            self._unpack()
+        finally:
+            self.busy = False
 
     def get_log(self, callback, *args, **kwargs):
         for (paths, rev, props, has_children) in self.log(*args, **kwargs):
@@ -847,19 +1231,442 @@ class SVNClient(SVNConnection):
                 callback(paths, rev, props, has_children)
     
 
+def _url_in_root(url, root):
+    if isinstance(root, bytes):
+        root = root.decode("utf-8")
+    root = root.rstrip("/")
+    return url == root or url.startswith(root + "/")
+
+
+class SVNClientPool(object):
+    """Pool of open svn:// sessions.
+
+    Sessions are handed out by acquire() and given back with release(),
+    or used through the session() context manager. An idle session is
+    reused for any URL in the same repository root and is reparented to
+    the requested URL when necessary, which avoids a new connection and
+    handshake.
+
+    The pool is safe to use from multiple threads.
+
+    :ivar connects: Number of sessions opened by the pool
+    :ivar reuses: Number of times an idle session was handed out again
+    """
+
+    def __init__(self, max_size=10, idle_timeout=300,
+                 client_factory=SVNClient, clock=time.monotonic):
+        """Create a new pool.
+
+        :param max_size: Maximum number of open sessions, both in use and
+            idle
+        :param idle_timeout: Number of seconds after which an idle session
+            is closed, or None to keep idle sessions open
+        :param client_factory: Callable that opens a session for a URL
+        :param clock: Function returning the current time in seconds
+        """
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._client_factory = client_factory
+        self._clock = clock
+        self._cond = threading.Condition()
+        # (last_used, root, client) tuples, least recently used first
+        self._idle = []
+        self._size = 0
+        self.connects = 0
+        self.reuses = 0
+
+    def __len__(self):
+        """Return the number of open sessions."""
+        return self._size
+
+    @property
+    def idle_count(self):
+        """Number of idle sessions."""
+        return len(self._idle)
+
+    def _pop_expired(self):
+        if self.idle_timeout is None:
+            return []
+        cutoff = self._clock() - self.idle_timeout
+        expired = []
+        while self._idle and self._idle[0][0] <= cutoff:
+            expired.append(self._idle.pop(0)[2])
+            self._size -= 1
+        return expired
+
+    def _pop_idle(self, url):
+        for i in range(len(self._idle) - 1, -1, -1):
+            if _url_in_root(url, self._idle[i][1]):
+                return self._idle.pop(i)[2]
+        return None
+
+    def _discard(self, client):
+        close = getattr(client, "close", None)
+        if close is not None:
+            try:
+                close()
+            except (socket.error, OSError):
+                pass
+
+    def _retarget(self, client, url):
+        check_connection = getattr(client, "check_connection", None)
+        if check_connection is not None and not check_connection():
+            return False
+        if client.url != url:
+            try:
+                client.reparent(url)
+            except (SubversionException, socket.error, OSError):
+                return False
+        return True
+
+    def acquire(self, url, timeout=None):
+        """Get a session for a URL.
+
+        :param url: URL the session should be opened for
+        :param timeout: Maximum number of seconds to wait for a session
+            when the pool is full, or None to wait indefinitely
+        :return: A client object; hand it back with release()
+        :raises TimeoutError: if no session became available in time
+        """
+        if timeout is not None:
+            deadline = self._clock() + timeout
+        while True:
+            to_close = []
+            with self._cond:
+                while True:
+                    to_close.extend(self._pop_expired())
+                    client = self._pop_idle(url)
+                    if client is not None:
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    if self._idle:
+                        # Make room by closing the least recently used
+                        # session of another repository.
+                        to_close.append(self._idle.pop(0)[2])
+                        self._size -= 1
+                        continue
+                    if timeout is None:
+                        self._cond.wait()
+                    else:
+                        remaining = deadline - self._clock()
+                        if remaining <= 0 or not self._cond.wait(remaining):
+                            raise TimeoutError(
+                                "No session available for %s" % url)
+            for old in to_close:
+                self._discard(old)
+            if client is None:
+                break
+            if self._retarget(client, url):
+                with self._cond:
+                    self.reuses += 1
+                return client
+            # Stale session; replace it with a fresh one.
+            self._discard(client)
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+        try:
+            client = self._client_factory(url)
+        except BaseException:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.connects += 1
+        return client
+
+    def release(self, client):
+        """Give a session back to the pool.
+
+        Sessions that are still busy, for example because the iterator
+        returned by log() has not been exhausted or closed yet, can not be
+        reused and are closed.
+        """
+        if getattr(client, "busy", False):
+            self.discard(client)
+            return
+        with self._cond:
+            self._idle.append(
+                (self._clock(), client.get_repos_root(), client))
+            expired = self._pop_expired()
+            self._cond.notify()
+        for old in expired:
+            self._discard(old)
+
+    def discard(self, client):
+        """Close a session obtained from acquire() instead of releasing it.
+        """
+        self._discard(client)
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    @contextlib.contextmanager
+    def session(self, url, timeout=None):
+        """Context manager that acquires a session and releases it again.
+
+        If the body raises an exception other than SubversionException the
+        session is closed, as the connection may be left in an unknown
+        state.
+        """
+        client = self.acquire(url, timeout)
+        try:
+            yield client
+        except SubversionException:
+            self.release(client)
+            raise
+        except BaseException:
+            self.discard(client)
+            raise
+        else:
+            self.release(client)
+
+    def evict_idle(self):
+        """Close idle sessions that have exceeded the idle timeout."""
+        with self._cond:
+            expired = self._pop_expired()
+            self._cond.notify_all()
+        for client in expired:
+            self._discard(client)
+
+    def close(self):
+        """Close all idle sessions."""
+        with self._cond:
+            idle = [client for (_, _, client) in self._idle]
+            self._size -= len(idle)
+            self._idle = []
+            self._cond.notify_all()
+        for client in idle:
+            self._discard(client)
+
+
+class AsyncSVNClient(object):
+    """svn:// client for use with asyncio.
+
+    This speaks the same protocol as SVNClient, but uses asyncio streams
+    so that a single event loop can drive many repository sessions at
+    once. Commands on one client are serialized; use multiple clients to
+    run commands concurrently.
+
+    Usage::
+
+        async with AsyncSVNClient("svn://example.com/repos") as client:
+            revnum = await client.get_latest_revnum()
+            async for (paths, rev, props, has_children) in client.log(
+                    [""], 0, revnum):
+                ...
+
+    :ivar bytes_received: Total number of bytes read from the connection
+    :ivar recv_calls: Number of reads from the connection
+    :ivar bytes_sent: Total number of bytes written to the connection
+    :ivar send_calls: Number of writes to the connection
+    """
+
+    def __init__(self, url, recv_size=RECV_SIZE, send_size=SEND_SIZE):
+        """Create a new client; call connect() before issuing commands.
+
+        :param url: svn:// URL of the repository
+        :param recv_size: Maximum number of bytes to read at once
+        :param send_size: Number of bytes to buffer before sending
+        """
+        self.url = url
+        (type, opaque) = urllib.parse.splittype(url)
+        if type != "svn":
+            raise NotImplementedError(
+                "AsyncSVNClient only supports svn:// URLs")
+        (self._host, path) = urllib.parse.splithost(opaque)
+        self.recv_size = recv_size
+        self.send_size = send_size
+        self._decoder = Unmarshaller()
+        self._outbuffer = bytearray()
+        self._reader = None
+        self._writer = None
+        self._lock = None
+        self.svndiff_version = 0
+        self.bytes_received = 0
+        self.recv_calls = 0
+        self.bytes_sent = 0
+        self.send_calls = 0
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, tb):
+        await self.close()
+        return False
+
+    async def connect(self):
+        """Connect to the server and perform the handshake."""
+        start_time = time.monotonic()
+        (host, port) = urllib.parse.splitnport(self._host, SVN_PORT)
+        (self._reader, self._writer) = await asyncio.open_connection(
+            host, port)
+        self._lock = asyncio.Lock()
+        (min_version, max_version, _, self._server_capabilities) = (
+            await self._unpack())
+        self.send_msg([max_version, [literal(x) for x in CAPABILITIES if x in self._server_capabilities], self.url])
+        (self._server_mechanisms, mech_arg) = await self._unpack()
+        if self._server_mechanisms != []:
+            # FIXME: Support other mechanisms as well
+            self.send_msg([literal("ANONYMOUS"), [base64.b64encode(("anonymous@%s" % socket.gethostname()).encode("utf-8"))]])
+            await self.recv_msg()
+        msg = await self._unpack()
+        if len(msg) > 2:
+            self._server_capabilities += msg[2]
+        (self._uuid, self._root_url) = msg[0:2]
+        self.svndiff_version = choose_svndiff_version(self._server_capabilities)
+        # Seconds spent connecting and performing the handshake
+        self.setup_time = time.monotonic() - start_time
+
+    async def close(self):
+        """Close the connection to the server."""
+        if self._writer is None:
+            return
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+        self._reader = None
+        self._writer = None
+
+    async def _recv_more(self):
+        await self.flush()
+        self.recv_calls += 1
+        newdata = await self._reader.read(self.recv_size)
+        if not newdata:
+            raise SubversionException("Connection closed",
+                                      ERR_RA_SVN_CONNECTION_CLOSED)
+        self.bytes_received += len(newdata)
+        self._decoder.feed(newdata)
+
+    async def recv_msg(self):
+        while True:
+            try:
+                return self._decoder.read_item()
+            except NeedMoreData:
+                await self._recv_more()
+
+    async def flush(self):
+        """Send any buffered messages."""
+        if not self._outbuffer:
+            return
+        # The transport may hold on to the buffer, so hand it over rather
+        # than reusing it.
+        data = self._outbuffer
+        self._outbuffer = bytearray()
+        self._writer.write(data)
+        self.send_calls += 1
+        self.bytes_sent += len(data)
+        await self._writer.drain()
+
+    def send_msg(self, data):
+        """Queue a message; it is sent before the next read or on flush()."""
+        marshall_into(data, self._outbuffer)
+
+    async def _unpack(self):
+        return unpack_response(await self.recv_msg())
+
+    async def _command(self, name, args):
+        self.send_msg([literal(name), args])
+        await self._unpack()
+        return await self._unpack()
+
+    def has_capability(self, capability):
+        return capability in self._server_capabilities
+
+    def get_uuid(self):
+        return self._uuid
+
+    def get_repos_root(self):
+        return self._root_url
+
+    async def get_latest_revnum(self):
+        async with self._lock:
+            return (await self._command("get-latest-rev", []))[0]
+
+    async def get_dir(self, path, revision=-1, dirent_fields=0,
+                      want_props=True, want_contents=True):
+        args = _get_dir_args(path, revision, dirent_fields, want_props,
+                             want_contents)
+        async with self._lock:
+            return _unpack_get_dir(await self._command("get-dir", args))
+
+    async def stat(self, path, revision=-1):
+        async with self._lock:
+            ret = await self._command("stat", [path, _revision_arg(revision)])
+        if len(ret) == 0:
+            return None
+        return unmarshall_dirent(ret[0])
+
+    async def rev_proplist(self, revision):
+        async with self._lock:
+            return dict((await self._command("rev-proplist", [revision]))[0])
+
+    async def log(self, paths, start, end, limit=0,
+                  discover_changed_paths=True, strict_node_history=True,
+                  include_merged_revisions=True, revprops=None):
+        """Iterate over log entries.
+
+        Yields (paths, revnum, revprops, has_children) tuples, like
+        SVNClient.log(). If iteration is stopped early the remaining
+        entries are read and discarded, so the client stays usable.
+        """
+        args = _log_args(paths, start, end, limit, discover_changed_paths,
+                         strict_node_history, include_merged_revisions,
+                         revprops)
+        async with self._lock:
+            self.send_msg([literal("log"), args])
+            await self._unpack()
+            try:
+                while True:
+                    msg = await self.recv_msg()
+                    if msg == "done":
+                        break
+                    yield _unpack_log_entry(msg)
+            except GeneratorExit:
+                while (await self.recv_msg()) != "done":
+                    pass
+                await self._unpack()
+                raise
+            await self._unpack()
+
+
 MIN_VERSION = 2
 MAX_VERSION = 2
-CAPABILITIES = ["edit-pipeline", "bazaar", "log-revprops"]
+CAPABILITIES = ["edit-pipeline", "bazaar", "log-revprops", "svndiff1"]
+if 2 in SVNDIFF_VERSIONS:
+    CAPABILITIES.append("accepts-svndiff2")
 MECHANISMS = ["ANONYMOUS"]
 
 
 class SVNServer(SVNConnection):
+    """Server side of an svn_ra connection.
 
-    def __init__(self, backend, recv_fn, send_fn, logf=None):
+    Responses are always buffered: they are sent once send_size bytes are
+    pending or when the server starts waiting for the client, so each
+    response goes out in as few writes as possible.
+    """
+
+    def __init__(self, backend, recv_fn, send_fn, logf=None,
+                 recv_size=RECV_SIZE, send_size=SEND_SIZE,
+                 recv_into_fn=None):
         self.backend = backend
         self._stop = False
         self._logf = logf
-        super(SVNServer, self).__init__(recv_fn, send_fn)
+        # Whether the server is waiting for the client to send a command
+        self.waiting = False
+        super(SVNServer, self).__init__(recv_fn, send_fn,
+                                        recv_size=recv_size,
+                                        recv_into_fn=recv_into_fn,
+                                        send_size=send_size)
+        # Everything is flushed before reading, so the client always
+        # sees complete responses before it has to reply.
+        self.pipelined = True
 
     def send_greeting(self):
         self.send_success(
@@ -875,6 +1682,11 @@ class SVNServer(SVNConnection):
     def send_ack(self):
         self.send_success([], "")
 
+    def send_error(self, error):
+        """Send a SubversionException to the client as a failure."""
+        (msg, num) = error.args[:2]
+        self.send_failure([num, msg, "", 0])
+
     def send_unknown(self, cmd):
         self.send_failure([ERR_RA_SVN_UNKNOWN_CMD, 
             "Unknown command '%s'" % cmd, __file__, 52])
@@ -898,16 +1710,6 @@ class SVNServer(SVNConnection):
     def log(self, target_path, start_rev, end_rev, changed_paths, 
             strict_node, limit=None, include_merged_revisions=False, 
             all_revprops=None, revprops=None):
-        def send_revision(revno, author, date, message, changed_paths=None):
-            changes = []
-            if changed_paths is not None:
-                for p, (action, cf, cr) in changed_paths.items():
-                    if cf is not None:
-                        changes.append((p, literal(action), (cf, cr)))
-                    else:
-                        changes.append((p, literal(action), ()))
-            self.send_msg([changes, revno, [author], [date], [message]])
-        self.send_ack()
         if len(start_rev) == 0:
             start_revnum = None
         else:
@@ -916,12 +1718,34 @@ class SVNServer(SVNConnection):
             end_revnum = None
         else:
             end_revnum = end_rev[0]
-        self.repo_backend.log(send_revision, target_path, start_revnum, 
-                              end_revnum, changed_paths, strict_node, limit)
+        if all_revprops == "revprops":
+            wanted_revprops = set(_revprop_name(name) for name in revprops)
+        else:
+            wanted_revprops = None
+        changed_paths = _unmarshall_bool(changed_paths)
+        self.send_ack()
+        entries = self.repo_backend.iter_log(target_path, start_revnum,
+            end_revnum, changed_paths, strict_node, limit, wanted_revprops)
+        try:
+            count = 0
+            for entry in entries:
+                marshall_log_entry(entry, self._outbuffer, changed_paths,
+                                   wanted_revprops)
+                self._flush_if_full()
+                count += 1
+                if limit and count >= limit:
+                    break
+        finally:
+            # Let generators clean up when the limit was reached
+            close = getattr(entries, "close", None)
+            if close is not None:
+                close()
         self.send_msg(literal("done"))
         self.send_success()
 
     def open_backend(self, url):
+        if isinstance(url, bytes):
+            url = url.decode("utf-8")
         (rooturl, location) = urllib.parse.splithost(url)
         self.repo_backend, self.relpath = self.backend.open_repository(location)
 
@@ -938,19 +1762,77 @@ class SVNServer(SVNConnection):
         self.send_ack()
         dirent = self.repo_backend.stat(path, revnum)
         if dirent is None:
-            self.send_success([])
+            self.send_success()
         else:
-            args = [dirent["name"], dirent["kind"], dirent["size"],
-                          dirent["has-props"], dirent["created-rev"]]
-            if "created-date" in dirent:
-                args.append([dirent["created-date"]])
-            else:
-                args.append([])
-            if "last-author" in dirent:
-                args.append([dirent["last-author"]])
+            self.send_success(marshall_dirent(dirent))
+
+    def get_file(self, path, rev, want_props, want_contents, *args):
+        if len(rev) == 0:
+            revnum = None
+        else:
+            revnum = rev[0]
+        self.send_ack()
+        try:
+            (revnum, props, stream) = self.repo_backend.get_file(path, revnum)
+        except SubversionException as e:
+            self.send_error(e)
+            return
+        try:
+            if _unmarshall_bool(want_props):
+                proplist = list(props.items())
             else:
-                args.append([])
-            self.send_success([args])
+                proplist = []
+            self.send_success([], revnum, proplist)
+            if not _unmarshall_bool(want_contents):
+                return
+            # The contents follow as a series of strings, so only one
+            # chunk is kept in memory at a time.
+            while True:
+                data = stream.read(GET_FILE_CHUNK_SIZE)
+                if not data:
+                    break
+                self.send_msg(data)
+            self.send_msg(b"")
+            self.send_success()
+        finally:
+            stream.close()
+
+    def get_dir(self, path, rev, want_props, want_contents, *args):
+        if len(rev) == 0:
+            revnum = None
+        else:
+            revnum = rev[0]
+        self.send_ack()
+        try:
+            (revnum, props, entries) = self.repo_backend.get_dir(path, revnum)
+        except SubversionException as e:
+            self.send_error(e)
+            return
+        if _unmarshall_bool(want_props):
+            proplist = list(props.items())
+        else:
+            proplist = []
+        # Send the entries as they are produced rather than building the
+        # complete response first.
+        self.send_list_start()
+        self.send_msg(literal("success"))
+        self.send_list_start()
+        self.send_msg(revnum)
+        self.send_msg(proplist)
+        self.send_list_start()
+        if _unmarshall_bool(want_contents):
+            for dirent in entries:
+                self.send_msg(marshall_dirent(dirent))
+        self.send_list_end()
+        self.send_list_end()
+        self.send_list_end()
+
+    def replay(self, revnum, low_water_mark, send_deltas=True):
+        self.send_ack()
+        self.repo_backend.replay(Editor(self), revnum, low_water_mark,
+                                 _unmarshall_bool(send_deltas))
+        self.send_msg([literal("finish-replay"), []])
+        self.send_success()
 
     def commit(self, logmsg, locks, keep_locks=False, rev_props=None):
         self.send_failure([ERR_UNSUPPORTED_FEATURE, 
@@ -1012,15 +1894,15 @@ class SVNServer(SVNConnection):
             "rev-proplist": rev_proplist,
             "rev-prop": rev_prop,
             "get-locations": get_locations,
+            "get-file": get_file,
+            "get-dir": get_dir,
+            "replay": replay,
             # FIXME: get-dated-rev
-            # FIXME: get-file
-            # FIXME: get-dir
             # FIXME: check-path
             # FIXME: switch
             # FIXME: status
             # FIXME: diff
             # FIXME: get-file-revs
-            # FIXME: replay
     }
 
     def send_auth_request(self):
@@ -1037,6 +1919,7 @@ class SVNServer(SVNConnection):
         else:
             self.client_user_agent = None
         self.capabilities = capabilities
+        self.svndiff_version = choose_svndiff_version(capabilities)
         self.version = version
         self.url = url
         self.mutter("client supports:")
@@ -1053,13 +1936,26 @@ class SVNServer(SVNConnection):
 
         # Expect:
         while not self._stop:
-            ( cmd, args ) = self.recv_msg()
+            self.waiting = True
+            try:
+                ( cmd, args ) = self.recv_msg()
+            except SubversionException as e:
+                if e.args[1] == ERR_RA_SVN_CONNECTION_CLOSED:
+                    # The client disconnected between commands
+                    break
+                raise
+            finally:
+                self.waiting = False
             if cmd not in self.commands:
                 self.mutter("client used unknown command %r" % cmd)
                 self.send_unknown(cmd)
-                return
+                break
             else:
                 self.commands[cmd](self, *args)
+        self.flush()
+        self.mutter("received %d bytes in %d reads, sent %d bytes in %d writes" %
+            (self.bytes_received, self.recv_calls, self.bytes_sent,
+             self.send_calls))
 
     def close(self):
         self._stop = True
@@ -1069,31 +1965,321 @@ class SVNServer(SVNConnection):
             self._logf.write("%s\n" % text)
 
 
-class TCPSVNRequestHandler(socketserver.StreamRequestHandler):
+def _shutdown_socket(sock, how):
+    try:
+        sock.shutdown(how)
+    except (socket.error, OSError):
+        pass
+
+
+class _SessionRegistry(object):
+    """Keeps track of the active sessions of a server."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._sessions = {}
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def add(self, session, sock):
+        with self._cond:
+            self._sessions[session] = sock
+
+    def remove(self, session):
+        with self._cond:
+            del self._sessions[session]
+            self._cond.notify_all()
+
+    def drain(self, timeout=None, poll_interval=0.1):
+        """Stop all sessions once they have finished their current command.
+
+        Sessions that are waiting for a command are disconnected right
+        away; sessions that are still running after timeout seconds are
+        disconnected forcibly.
+
+        :param timeout: Number of seconds to wait, or None to wait until
+            all sessions have finished
+        :return: Number of sessions that were disconnected forcibly
+        """
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._sessions:
+                for (session, sock) in self._sessions.items():
+                    session.close()
+                    if session.waiting:
+                        _shutdown_socket(sock, socket.SHUT_RD)
+                if timeout is None:
+                    wait = poll_interval
+                else:
+                    wait = min(deadline - time.monotonic(), poll_interval)
+                    if wait <= 0:
+                        break
+                self._cond.wait(wait)
+            for sock in self._sessions.values():
+                _shutdown_socket(sock, socket.SHUT_RDWR)
+            return len(self._sessions)
+
+
+def _run_session(session, sock, registry):
+    registry.add(session, sock)
+    try:
+        session.serve()
+    except socket.error as e:
+        if e.args[0] in (EPIPE, ECONNRESET):
+            return
+        raise
+    finally:
+        registry.remove(session)
+
+
+def _serve_socket(sock, backend, logf, recv_size, send_size, registry):
+    # The connection does its own buffering, so talk to the socket
+    # directly rather than through file objects.
+    server = SVNServer(backend, sock.recv, sock.send, logf,
+                       recv_size=recv_size, send_size=send_size,
+                       recv_into_fn=sock.recv_into)
+    _run_session(server, sock, registry)
+
+
+class TCPSVNRequestHandler(socketserver.BaseRequestHandler):
 
     def __init__(self, request, client_address, server):
         self._server = server
-        socketserver.StreamRequestHandler.__init__(self, request, 
+        socketserver.BaseRequestHandler.__init__(self, request, 
             client_address, server)
 
     def handle(self):
-        server = SVNServer(self._server._backend, self.rfile.read, 
-            self.wfile.write, self._server._logf)
-        try:
-            server.serve()
-        except socket.error as e:
-            if e.args[0] == EPIPE:
-                return
-            raise
+        _serve_socket(self.request, self._server._backend,
+            self._server._logf, self._server.recv_size,
+            self._server.send_size, self._server._sessions)
 
 
 class TCPSVNServer(socketserver.TCPServer):
+    """svn:// server that serves one client at a time.
+
+    See ThreadingTCPSVNServer and AsyncSVNServer for servers that serve
+    multiple clients concurrently.
+    """
 
     allow_reuse_address = True
+    # Clients wait in the listen queue while all sessions are busy
+    request_queue_size = 128
     serve = socketserver.TCPServer.serve_forever
 
-    def __init__(self, backend, addr, logf=None):
+    def __init__(self, backend, addr, logf=None, recv_size=RECV_SIZE,
+                 send_size=SEND_SIZE):
+        """Create a new server.
+
+        :param backend: ServerBackend to serve repositories from
+        :param addr: Tuple with the host and port to listen on
+        :param logf: Optional file to write log messages to
+        :param recv_size: Maximum number of bytes to read at once for
+            each connection
+        :param send_size: Number of bytes to buffer for each connection
+            before sending
+        """
         self._logf = logf
         self._backend = backend
+        self.recv_size = recv_size
+        self.send_size = send_size
+        self._sessions = _SessionRegistry()
         socketserver.TCPServer.__init__(self, addr, TCPSVNRequestHandler)
 
+    @property
+    def active_sessions(self):
+        """Number of clients currently being served."""
+        return len(self._sessions)
+
+    def drain(self, timeout=None):
+        """Stop active sessions once their current command has finished.
+
+        :param timeout: Number of seconds to wait before disconnecting
+            sessions forcibly, or None to wait indefinitely
+        :return: Number of sessions that were disconnected forcibly
+        """
+        return self._sessions.drain(timeout)
+
+
+class ThreadingTCPSVNServer(socketserver.ThreadingMixIn, TCPSVNServer):
+    """svn:// server that serves each client in a separate thread.
+
+    At most max_sessions clients are served at once; further connections
+    are accepted once a session has finished.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, backend, addr, logf=None, max_sessions=None,
+                 **kwargs):
+        """Create a new server.
+
+        :param max_sessions: Maximum number of concurrent sessions, or
+            None for no limit
+        """
+        TCPSVNServer.__init__(self, backend, addr, logf, **kwargs)
+        self.max_sessions = max_sessions
+        if max_sessions is None:
+            self._slots = None
+        else:
+            self._slots = threading.BoundedSemaphore(max_sessions)
+        self._shutting_down = False
+
+    def process_request(self, request, client_address):
+        if self._slots is not None:
+            while not self._slots.acquire(timeout=0.5):
+                if self._shutting_down:
+                    self.shutdown_request(request)
+                    return
+        try:
+            socketserver.ThreadingMixIn.process_request(self, request,
+                client_address)
+        except BaseException:
+            if self._slots is not None:
+                self._slots.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            socketserver.ThreadingMixIn.process_request_thread(self,
+                request, client_address)
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+    def shutdown(self):
+        self._shutting_down = True
+        TCPSVNServer.shutdown(self)
+
+    def shutdown_gracefully(self, timeout=None):
+        """Stop accepting clients and wait for active sessions to finish.
+
+        Like shutdown(), this has to be called from a different thread
+        than the one running serve_forever().
+
+        :param timeout: Number of seconds to wait before disconnecting
+            sessions forcibly, or None to wait indefinitely
+        :return: Number of sessions that were disconnected forcibly
+        """
+        self.shutdown()
+        forced = self.drain(timeout)
+        self.server_close()
+        return forced
+
+
+class AsyncSVNServer(object):
+    """svn:// server that accepts clients on an asyncio event loop.
+
+    SVNServer and the repository backends are synchronous, so each session
+    runs in a worker thread. At most max_sessions clients are served at
+    once; further connections are accepted once a session has finished.
+
+    Usage::
+
+        server = AsyncSVNServer(backend, max_sessions=50)
+        await server.start("localhost", 3690)
+        ...
+        await server.shutdown(timeout=30)
+    """
+
+    def __init__(self, backend, logf=None, max_sessions=10,
+                 recv_size=RECV_SIZE, send_size=SEND_SIZE):
+        self._backend = backend
+        self._logf = logf
+        self.max_sessions = max_sessions
+        self.recv_size = recv_size
+        self.send_size = send_size
+        self.server_address = None
+        self._sessions = _SessionRegistry()
+        self._socket = None
+        self._accept_task = None
+        self._executor = None
+
+    @property
+    def active_sessions(self):
+        """Number of clients currently being served."""
+        return len(self._sessions)
+
+    async def start(self, host="localhost", port=SVN_PORT):
+        """Start listening for clients.
+
+        :param host: Host name or address to listen on
+        :param port: Port to listen on; 0 picks a free port, which can be
+            found in server_address
+        """
+        loop = asyncio.get_running_loop()
+        addrs = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM,
+                                       flags=socket.AI_PASSIVE)
+        (family, socktype, proto, canonname, sockaddr) = addrs[0]
+        sock = socket.socket(family, socktype, proto)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(sockaddr)
+            sock.listen()
+            sock.setblocking(False)
+        except BaseException:
+            sock.close()
+            raise
+        self._socket = sock
+        self.server_address = sock.getsockname()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            self.max_sessions)
+        self._accept_task = loop.create_task(self._accept_loop())
+
+    async def _accept_loop(self):
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.max_sessions)
+        def session_done(future):
+            slots.release()
+            if not future.cancelled() and future.exception() is not None:
+                loop.call_exception_handler({
+                    "message": "Exception in svn:// session",
+                    "exception": future.exception(),
+                    "future": future,
+                    })
+        while True:
+            await slots.acquire()
+            try:
+                (conn, addr) = await loop.sock_accept(self._socket)
+            except BaseException:
+                slots.release()
+                raise
+            conn.setblocking(True)
+            future = loop.run_in_executor(self._executor,
+                                          self._serve_connection, conn)
+            future.add_done_callback(session_done)
+
+    def _serve_connection(self, conn):
+        try:
+            _serve_socket(conn, self._backend, self._logf, self.recv_size,
+                          self.send_size, self._sessions)
+        finally:
+            conn.close()
+
+    async def serve_forever(self):
+        """Serve clients until shutdown() is called."""
+        try:
+            await asyncio.shield(self._accept_task)
+        except asyncio.CancelledError:
+            if not self._accept_task.cancelled():
+                raise
+
+    async def shutdown(self, timeout=None):
+        """Stop accepting clients and wait for active sessions to finish.
+
+        :param timeout: Number of seconds to wait before disconnecting
+            sessions forcibly, or None to wait indefinitely
+        :return: Number of sessions that were disconnected forcibly
+        """
+        loop = asyncio.get_running_loop()
+        self._accept_task.cancel()
+        try:
+            await self._accept_task
+        except asyncio.CancelledError:
+            pass
+        self._socket.close()
+        forced = await loop.run_in_executor(None, self._sessions.drain,
+                                            timeout)
+        await loop.run_in_executor(None, self._executor.shutdown)
+        return forced
@@ -838,7 +838,6 @@ static PyObject *fs_root_file_contents(FileSystemRootObject *self, PyObject *arg
 {
 	svn_stream_t *stream;
 	apr_pool_t *pool;
-	StreamObject *ret;
 	char *path;
 
 	if (!PyArg_ParseTuple(args, "s", &path))
@@ -850,15 +849,7 @@ static PyObject *fs_root_file_contents(FileSystemRootObject *self, PyObject *arg
 	RUN_SVN_WITH_POOL(pool, svn_fs_file_contents(&stream, self->root, 
 											   path, pool));
 
-	ret = PyObject_New(StreamObject, &Stream_Type);
-	if (ret == NULL)
-		return NULL;
-
-	ret->pool = pool;
-	ret->closed = FALSE;
-	ret->stream = stream;
-
-    return (PyObject *)ret;
+	return new_stream_object(stream, pool);
 }
 
 static PyMethodDef fs_root_methods[] = {
@@ -950,6 +941,9 @@ PyMODINIT_FUNC PyInit_repos(void)
 	if (PyType_Ready(&Stream_Type) < 0)
 		return mod;
 
+	if (PyType_Ready(&StreamChunks_Type) < 0)
+		return mod;
+
 	apr_initialize();
 	pool = Pool(NULL);
 	if (pool == NULL)
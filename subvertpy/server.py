@@ -16,6 +16,20 @@
 
 """Server backend base classes."""
 
+from collections import namedtuple
+
+LogEntry = namedtuple("LogEntry",
+    ["revnum", "author", "date", "message", "changed_paths", "revprops"],
+    defaults=(None, None, None, None, None))
+LogEntry.__doc__ = """A revision as reported by ServerRepositoryBackend.iter_log().
+
+author, date and message are the svn:author, svn:date and svn:log
+revision properties, or None if not set. changed_paths is None or a
+dictionary mapping paths to (action, copyfrom_path, copyfrom_rev)
+tuples. revprops is None or a dictionary with any other revision
+properties.
+"""
+
 class ServerBackend(object):
     """A server backend."""
 
@@ -41,6 +55,33 @@ class ServerRepositoryBackend(object):
             changed_paths, strict_node, limit):
         raise NotImplementedError(self.log)
 
+    def iter_log(self, target_path, start_rev, end_rev, changed_paths,
+                 strict_node, limit, revprops=None):
+        """Iterate over the history of a path.
+
+        The server encodes each entry as soon as it is produced, and stops
+        iterating once limit entries have been sent, so backends can
+        implement this as a generator. The default implementation
+        collects the revisions sent by log().
+
+        :param target_path: Paths to report history for
+        :param start_rev: First revision, or None for the latest
+        :param end_rev: Last revision, or None for the latest
+        :param changed_paths: Whether changed paths should be included
+        :param strict_node: Whether to stop at copies
+        :param limit: Maximum number of revisions to report, 0 for all
+        :param revprops: List of names of the revision properties the
+            client wants, or None for all of them
+        :return: Iterable over LogEntry objects
+        """
+        entries = []
+        def send_revision(revno, author, date, message, changed_paths=None):
+            entries.append(LogEntry(revno, author, date, message,
+                                    changed_paths))
+        self.log(send_revision, target_path, start_rev, end_rev,
+                 changed_paths, strict_node, limit)
+        return entries
+
     def update(self, editor, revnum, target_path, recurse=True):
         raise NotImplementedError(self.update)
 
@@ -58,6 +99,47 @@ class ServerRepositoryBackend(object):
     def rev_proplist(self, revnum):
         raise NotImplementedError(self.rev_proplist)
 
+    def get_file(self, path, revnum):
+        """Open a file.
+
+        :param path: Path of the file
+        :param revnum: Revision number, or None for the latest revision
+        :return: Tuple with the revision number, a dictionary with the
+            file properties and a file-like object with the file contents.
+            The contents are read in chunks and the stream is closed
+            afterwards.
+        """
+        raise NotImplementedError(self.get_file)
+
+    def get_dir(self, path, revnum):
+        """List a directory.
+
+        :param path: Path of the directory
+        :param revnum: Revision number, or None for the latest revision
+        :return: Tuple with the revision number, a dictionary with the
+            directory properties and an iterable over the entries, each a
+            dictionary like those returned by stat(). Entries are sent as
+            they are produced, so this can be a generator; errors should
+            be raised by this method rather than during iteration.
+        """
+        raise NotImplementedError(self.get_dir)
+
+    def replay(self, editor, revnum, low_water_mark, send_deltas):
+        """Replay the changes of a revision.
+
+        Should drive editor like update(), except that the edit is not
+        closed. File contents can be sent as a stream with
+        subvertpy.delta.send_stream() or send_delta(), which produce one
+        svndiff window at a time.
+
+        :param editor: Editor to drive
+        :param revnum: Revision to replay
+        :param low_water_mark: Changes to paths that were not copied from
+            a revision below this one may be sent as additions
+        :param send_deltas: Whether to send file contents
+        """
+        raise NotImplementedError(self.replay)
+
     def get_locations(self, path, peg_revnum, revnums):
         raise NotImplementedError(self.get_locations)
 
@@ -15,18 +15,31 @@
 
 """Tests for subvertpy.delta."""
 
+from hashlib import md5
 from io import BytesIO
 
+from subvertpy import SubversionException
 from subvertpy.delta import (
+    SVNDIFF_VERSIONS,
+    SvndiffDecoder,
     decode_length,
     encode_length,
+    pack_svndiff,
     pack_svndiff0,
+    pack_svndiff_window,
+    send_delta,
     send_stream,
+    unpack_svndiff,
     unpack_svndiff0,
     apply_txdelta_handler,
+    compute_delta_ops,
+    txdelta_apply_ops,
     TXDELTA_NEW, TXDELTA_SOURCE, TXDELTA_TARGET,
     )
-from subvertpy.tests import TestCase
+from subvertpy.tests import (
+    SkipTest,
+    TestCase,
+    )
 
 class DeltaTests(TestCase):
 
@@ -43,6 +56,71 @@ class DeltaTests(TestCase):
         self.assertEqual([(0, 0, 3, 0, [(2, 0, 3)], b'foo'), None], 
                           self.windows)
 
+    def test_send_delta(self):
+        source = b"".join(b"line %d\n" % i for i in range(2000))
+        target = source.replace(b"line 1000\n", b"changed\n")
+        digest = send_delta(BytesIO(source), BytesIO(target),
+                            self.storing_window_handler, block_size=4096)
+        self.assertEqual(md5(target).digest(), digest)
+        self.assertIs(None, self.windows[-1])
+        self.assertTrue(all(w[2] <= 4096 for w in self.windows[:-1]))
+        # Only the changed line should be sent as new data
+        self.assertTrue(sum(len(w[5]) for w in self.windows[:-1]) < 100)
+        stream = BytesIO()
+        handler = apply_txdelta_handler(source, stream)
+        for window in self.windows:
+            handler(window)
+        self.assertEqual(target, stream.getvalue())
+
+    def test_send_delta_svndiff_roundtrip(self):
+        source = b"".join(b"line %d\n" % i for i in range(2000))
+        target = (source.replace(b"line 1000\n", b"changed\n")
+                  .replace(b"line 1100\n", b"changed too\n"))
+        send_delta(BytesIO(source), BytesIO(target),
+                   self.storing_window_handler, block_size=4096)
+        windows = self.windows[:-1]
+        # Windows with several new data instructions have to survive
+        # the encoding used on the wire
+        self.assertTrue(any(
+            len([op for op in w[4] if op[0] == TXDELTA_NEW]) > 1
+            for w in windows))
+        for version in SVNDIFF_VERSIONS:
+            text = pack_svndiff(windows, version, min_compress_size=0)
+            stream = BytesIO()
+            handler = apply_txdelta_handler(source, stream)
+            for window in unpack_svndiff(text):
+                handler(window)
+            handler(None)
+            self.assertEqual(target, stream.getvalue())
+
+    def test_send_delta_shifted(self):
+        # Data that moved into another window is still found
+        source = b"".join(b"line %d\n" % i for i in range(2000))
+        inserted = b"".join(b"new %d\n" % i for i in range(500))
+        target = inserted + source
+        send_delta(BytesIO(source), BytesIO(target),
+                   self.storing_window_handler, block_size=4096)
+        self.assertTrue(
+            sum(len(w[5]) for w in self.windows[:-1]) < len(inserted) + 200)
+        stream = BytesIO()
+        handler = apply_txdelta_handler(source, stream)
+        for window in self.windows:
+            handler(window)
+        self.assertEqual(target, stream.getvalue())
+
+    def test_compute_delta_ops_unaligned(self):
+        sview = bytes(range(256)) * 2
+        tview = b"xyz" + sview[10:300]
+        (ops, new_data) = compute_delta_ops(sview, tview)
+        self.assertEqual([(TXDELTA_NEW, 0, 3), (TXDELTA_SOURCE, 10, 290)],
+                         ops)
+        self.assertEqual(b"xyz", new_data)
+
+    def test_send_delta_no_source(self):
+        send_delta(None, BytesIO(b"foo"), self.storing_window_handler)
+        self.assertEqual([(0, 0, 3, 0, [(2, 0, 3)], b'foo'), None],
+                          self.windows)
+
     def test_apply_delta(self):
         stream = BytesIO()
         source = b"(source)"
@@ -66,6 +144,22 @@ class DeltaTests(TestCase):
         self.assertEqual(result, stream.getvalue())
 
 
+    def test_apply_delta_run_length(self):
+        ops = [(TXDELTA_NEW, 0, 3), (TXDELTA_TARGET, 1, 1000)]
+        self.assertEqual(b"abc" + b"bc" * 500,
+            txdelta_apply_ops(0, ops, b"abc", b""))
+
+    def test_apply_delta_short_source(self):
+        ops = [(TXDELTA_SOURCE, 5, 8)]
+        self.assertRaises(SubversionException, txdelta_apply_ops, 0, ops,
+                          b"", b"0123456789")
+
+    def test_apply_delta_short_ops(self):
+        handler = apply_txdelta_handler(b"", BytesIO())
+        self.assertRaises(AssertionError, handler,
+                          (0, 0, 4, 1, [(TXDELTA_NEW, 0, 3)], b"abc"))
+
+
 class MarshallTests(TestCase):
 
     def test_encode_length(self):
@@ -78,3 +172,104 @@ class MarshallTests(TestCase):
     def test_roundtrip_window(self):
         mywindow = (0, 0, 3, 1, [(2, 0, 3)], b'foo')
         self.assertEqual([mywindow], list(unpack_svndiff0(pack_svndiff0([mywindow]))))
+
+    def test_unpack_svndiff0_bytes(self):
+        window = (0, 3, 6, 2, [(TXDELTA_SOURCE, 0, 3), (TXDELTA_NEW, 0, 3)],
+                  b'foo')
+        [unpacked] = unpack_svndiff0(pack_svndiff0([window]))
+        self.assertEqual(window, unpacked)
+        self.assertIsInstance(unpacked[5], bytes)
+
+    def test_unpack_svndiff0_other_version(self):
+        window = (0, 0, 3, 1, [(TXDELTA_NEW, 0, 3)], b'foo')
+        self.assertRaises(AssertionError, list,
+                          unpack_svndiff0(pack_svndiff([window], 1)))
+
+
+class SvndiffDecoderTests(TestCase):
+
+    windows = [
+        (0, 0, 3, 0, [(TXDELTA_NEW, 0, 3)], b'foo'),
+        (0, 3, 200, 1, [(TXDELTA_SOURCE, 0, 3), (TXDELTA_NEW, 0, 100),
+                        (TXDELTA_TARGET, 3, 97)], b'x' * 100),
+        ]
+
+    def test_bytewise(self):
+        text = pack_svndiff0(self.windows)
+        decoder = SvndiffDecoder()
+        windows = []
+        for i in range(len(text)):
+            decoder.feed(text[i:i+1])
+            windows.extend(decoder)
+            # Windows are returned as soon as they are complete
+            self.assertEqual(len(windows) == 2, i == len(text) - 1)
+        decoder.close()
+        self.assertEqual(self.windows, windows)
+
+    def test_invalid_header(self):
+        decoder = SvndiffDecoder()
+        self.assertRaises(SubversionException, decoder.feed, b"SVN\x09\x00")
+
+    def test_zero_copy(self):
+        text = bytes(pack_svndiff0(self.windows))
+        decoder = SvndiffDecoder()
+        decoder.feed(text)
+        windows = list(decoder)
+        self.assertEqual(self.windows, windows)
+        self.assertIs(text, windows[1][5].obj)
+
+    def test_svndiff1(self):
+        text = pack_svndiff(self.windows, 1, min_compress_size=50)
+        decoder = SvndiffDecoder()
+        windows = []
+        for i in range(0, len(text), 7):
+            decoder.feed(text[i:i+7])
+            windows.extend(decoder)
+        decoder.close()
+        self.assertEqual(self.windows, windows)
+
+    def test_svndiff1_compresses(self):
+        self.assertTrue(len(pack_svndiff(self.windows, 1, min_compress_size=50))
+                        < len(pack_svndiff(self.windows, 0)))
+
+    def test_svndiff1_threshold(self):
+        # Sections below the threshold are stored as is, prefixed by their
+        # length
+        window = (0, 0, 100, 0, [(TXDELTA_NEW, 0, 100)], b'x' * 100)
+        self.assertTrue(pack_svndiff_window(window, 1).endswith(
+            b'\x64' + b'x' * 100))
+
+    def test_svndiff2(self):
+        if 2 not in SVNDIFF_VERSIONS:
+            raise SkipTest("lz4 not available")
+        text = pack_svndiff(self.windows, 2, min_compress_size=50)
+        self.assertEqual(self.windows, list(unpack_svndiff(text)))
+
+    def test_svndiff1_corrupt(self):
+        text = bytearray(pack_svndiff(self.windows, 1, min_compress_size=50))
+        text[-3] ^= 0xff
+        self.assertRaises(SubversionException, SvndiffDecoder().feed, text)
+
+    def test_multiple_new_ops(self):
+        # The offsets of new data instructions are implied by their order
+        window = (0, 0, 6, 0, [(TXDELTA_NEW, 0, 3), (TXDELTA_NEW, 3, 3)],
+                  b"abcdef")
+        for version in SVNDIFF_VERSIONS:
+            text = pack_svndiff([window], version, min_compress_size=0)
+            decoder = SvndiffDecoder()
+            for i in range(len(text)):
+                decoder.feed(text[i:i+1])
+            windows = list(decoder)
+            decoder.close()
+            self.assertEqual([window], windows)
+            stream = BytesIO()
+            handler = apply_txdelta_handler(b"", stream)
+            handler(windows[0])
+            handler(None)
+            self.assertEqual(b"abcdef", stream.getvalue())
+
+    def test_truncated(self):
+        decoder = SvndiffDecoder()
+        decoder.feed(pack_svndiff0(self.windows)[:-1])
+        self.assertEqual(self.windows[:1], list(decoder))
+        self.assertRaises(SubversionException, decoder.close)
@@ -16,13 +16,25 @@
 
 """Tests for subvertpy.marshall."""
 
+import importlib
+import sys
+
+import subvertpy
+from subvertpy import marshall as marshall_module
 from subvertpy.marshall import (
     MarshallError,
+    NeedMoreData,
+    Unmarshaller,
     literal,
     marshall,
+    marshall_command,
+    marshall_into,
     unmarshall,
     )
-from subvertpy.tests import TestCase
+from subvertpy.tests import (
+    SkipTest,
+    TestCase,
+    )
 
 class TestMarshalling(TestCase):
 
@@ -66,6 +78,26 @@ class TestMarshalling(TestCase):
     def test_marshall_string_space(self):
         self.assertEqual(b"5:bla l ", marshall("bla l"))
 
+    def test_marshall_bytearray(self):
+        self.assertEqual(b"4:ab c ", marshall(bytearray(b"ab c")))
+
+    def test_marshall_memoryview(self):
+        self.assertEqual(b"( 2:bc ) ", marshall([memoryview(b"abcd")[1:3]]))
+
+    def test_marshall_bool(self):
+        self.assertEqual(b"( 1 0 ) ", marshall([True, False]))
+
+    def test_marshall_into(self):
+        out = bytearray(b"1 ")
+        marshall_into([2, b"x"], out)
+        self.assertEqual(b"1 ( 2 1:x ) ", out)
+
+    def test_marshall_command(self):
+        out = bytearray()
+        marshall_command("stat", ["", []], out)
+        self.assertEqual(b"( stat ( 0: ( ) ) ) ", out)
+        self.assertEqual(bytes(out), marshall([literal("stat"), ["", []]]))
+
     def test_unmarshall_string(self):
         self.assertEqual((b'', b"bla l"), unmarshall(b"5:bla l"))
 
@@ -93,3 +125,160 @@ class TestMarshalling(TestCase):
     def test_unmarshall_open_list(self):
         self.assertRaises(MarshallError, unmarshall, b"( 3 4 ")
 
+
+class TestUnmarshaller(TestCase):
+
+    def test_read_item(self):
+        u = Unmarshaller(b"( success ( 2 3:foo ) ) ")
+        self.assertEqual(["success", [2, b"foo"]], u.read_item())
+
+    def test_empty(self):
+        self.assertRaises(NeedMoreData, Unmarshaller().read_item)
+
+    def test_split_bytewise(self):
+        data = b"( success ( 1 2 ( 3:abc word ) 0: ) ) 42 "
+        u = Unmarshaller()
+        items = []
+        for i in range(len(data)):
+            u.feed(data[i:i+1])
+            items.extend(u)
+        self.assertEqual([["success", [1, 2, [b"abc", "word"], b""]], 42],
+                         items)
+
+    def test_string_with_whitespace(self):
+        u = Unmarshaller()
+        u.feed(b"11:( foo ) ba")
+        self.assertRaises(NeedMoreData, u.read_item)
+        u.feed(memoryview(b"r 5 "))
+        self.assertEqual([b"( foo ) bar", 5], list(u))
+
+    def test_multiple_items(self):
+        u = Unmarshaller(b"1 2 ( 3 ) 4")
+        self.assertEqual([1, 2, [3]], list(u))
+        self.assertEqual(b"4", u.unconsumed())
+
+    def test_invalid(self):
+        u = Unmarshaller(b"( 3 :bla ) ")
+        self.assertRaises(MarshallError, u.read_item)
+
+    def test_unexpected_list_end(self):
+        self.assertRaises(MarshallError, Unmarshaller(b") ").read_item)
+
+
+def load_pure_python_marshall():
+    """Import a separate copy of subvertpy.marshall without the C extension."""
+    saved = dict((name, sys.modules.get(name)) for name in
+                 ("subvertpy.marshall", "subvertpy._marshall"))
+    sys.modules["subvertpy._marshall"] = None
+    del sys.modules["subvertpy.marshall"]
+    try:
+        return importlib.import_module("subvertpy.marshall")
+    finally:
+        for name, mod in saved.items():
+            if mod is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = mod
+        subvertpy.marshall = saved["subvertpy.marshall"]
+
+
+class MarshallParityTests(TestCase):
+    """Check the C and pure-Python implementations behave identically."""
+
+    marshall_corpus = [
+        0, 1, -5, 2**70, True, False, "", "foo", "bla l", "\xfcn\xef",
+        b"", b"\x00\xff ( ) ", bytearray(b"ab c"), memoryview(b"xyz"),
+        memoryview(b"abcd").cast("i"), [], (), [1, [2, [3]], ()], (1, "a"),
+        ["success", [b"x", 3, [literal("word")]]],
+        [literal("stat"), ["", []]], [literal("open-root"), ([], "id")],
+        [literal("x")], [literal("a"), [], []],
+        {}, None, 1.5, [1, object()], literal("n\xf6t-ascii"),
+        ]
+
+    unmarshall_corpus = [
+        b"", b" ", b"2 ", b"-1 ", b"12345678901234567890123 ", b"5:bla l",
+        b"3:abc3:def ", b"0: ", b"foo ", b"foo-2\n", b"( ) ", b"( 1 2 ) x",
+        b"( success ( ( 1:a ) 2 word ( ) ) ) ",
+        b"( 3 4 ", b"nospace", b"43432432:bla", b":-3213", b"(x ", b") ",
+        b"( 1 )x", b"12x", b"a:b ", b"\xff ", b"( 1 ) ) ",
+        b"99999999999999999999999999:abc",
+        ]
+
+    def setUp(self):
+        super(MarshallParityTests, self).setUp()
+        if marshall_module.marshall.__module__ != "subvertpy._marshall":
+            raise SkipTest("C implementation of marshall not available")
+        self.pure = load_pure_python_marshall()
+        self.accelerated = marshall_module
+
+    def convert(self, mod, x):
+        """Convert literals in x to the literal class of mod."""
+        if isinstance(x, (list, tuple)):
+            return type(x)(self.convert(mod, i) for i in x)
+        if isinstance(x, (marshall_module.literal, self.pure.literal)):
+            return mod.literal(x.txt)
+        return x
+
+    def call(self, mod, fn, *args):
+        try:
+            return ("ok", fn(*args))
+        except Exception as e:
+            if isinstance(e, mod.NeedMoreData):
+                kind = "NeedMoreData"
+            elif isinstance(e, mod.MarshallError):
+                kind = "MarshallError"
+            else:
+                kind = type(e).__name__
+            return (kind, str(e))
+
+    def assertSameResult(self, fn_name, *args):
+        results = []
+        for mod in (self.pure, self.accelerated):
+            results.append(self.call(mod, getattr(mod, fn_name),
+                *[self.convert(mod, arg) for arg in args]))
+        self.assertEqual(results[0], results[1],
+                         "%s%r differs" % (fn_name, args))
+
+    def test_marshall(self):
+        for x in self.marshall_corpus:
+            self.assertSameResult("marshall", x)
+
+    def test_marshall_into(self):
+        for x in self.marshall_corpus:
+            results = []
+            for mod in (self.pure, self.accelerated):
+                out = bytearray(b"prefix ")
+                results.append((self.call(mod, mod.marshall_into,
+                    self.convert(mod, x), out)[0], out))
+            self.assertEqual(results[0], results[1])
+
+    def test_marshall_command(self):
+        for args in self.marshall_corpus:
+            if not isinstance(args, (list, tuple)):
+                continue
+            for mod in (self.pure, self.accelerated):
+                args = self.convert(mod, args)
+                expected = self.call(mod, mod.marshall,
+                                     [mod.literal("cmd"), list(args)])
+                out = bytearray()
+                result = self.call(mod, mod.marshall_command, "cmd", args, out)
+                if result[0] == "ok":
+                    result = ("ok", bytes(out))
+                self.assertEqual(expected, result)
+
+    def test_unmarshall(self):
+        for data in self.unmarshall_corpus:
+            self.assertSameResult("unmarshall", data)
+            self.assertSameResult("unmarshall", bytearray(data))
+
+    def test_unmarshaller_bytewise(self):
+        for data in self.unmarshall_corpus:
+            results = []
+            for mod in (self.pure, self.accelerated):
+                u = mod.Unmarshaller()
+                items = []
+                for i in range(len(data)):
+                    u.feed(data[i:i+1])
+                    items.append(self.call(mod, list, u))
+                results.append(items)
+            self.assertEqual(results[0], results[1])
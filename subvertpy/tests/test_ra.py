@@ -16,6 +16,7 @@
 """Subversion ra library tests."""
 
 from io import BytesIO
+import os
 
 from subvertpy import (
     NODE_DIR, NODE_NONE, NODE_UNKNOWN,
@@ -112,6 +113,20 @@ class TestRemoteAccess(SubversionTestCase):
         self.assertEqual(1, fetch_rev)
         self.assertEqual(NODE_DIR, dirents["foo"]["kind"])
 
+    def test_get_dirs(self):
+        self.do_commit()
+        ret = self.ra.get_dirs(["", "/foo", "nonexistent"], 1,
+            fields=ra.DIRENT_KIND)
+        self.assertEqual(3, len(ret))
+        (dirents, fetch_rev, props) = ret[0]
+        self.assertEqual(1, fetch_rev)
+        self.assertEqual(NODE_DIR, dirents["foo"]["kind"])
+        self.assertEqual({}, ret[1][0])
+        self.assertIsInstance(ret[2], SubversionException)
+
+    def test_get_dirs_empty(self):
+        self.assertEqual([], self.ra.get_dirs([], 0))
+
     def test_change_rev_prop(self):
         self.do_commit()
         self.ra.change_rev_prop(1, "foo", "bar")
@@ -179,6 +194,88 @@ class TestRemoteAccess(SubversionTestCase):
             strict_node_history=False, revprops=["svn:date", "svn:author", "svn:log"]))
         check_results(returned)
 
+    def test_iter_log_bounded_queue(self):
+        for i in range(5):
+            dc = self.get_commit_editor(self.repos_url)
+            dc.add_dir("foo%d" % i)
+            dc.close()
+        it = self.ra.iter_log([""], 0, 5, max_queue_size=1,
+            revprops=["svn:date"])
+        self.assertEqual(1, it.max_queue_size)
+        returned = list(it)
+        self.assertEqual(list(range(6)), [r[1] for r in returned])
+        self.assertEqual(0, it.queue_size)
+        self.assertTrue(it.producer_stall_time >= 0.0)
+        self.assertTrue(it.consumer_stall_time >= 0.0)
+        self.assertTrue(it.producer_stalls >= 0)
+        self.assertTrue(it.consumer_stalls >= 0)
+
+    def test_iter_log_close(self):
+        for i in range(5):
+            dc = self.get_commit_editor(self.repos_url)
+            dc.add_dir("foo%d" % i)
+            dc.close()
+        it = self.ra.iter_log([""], 0, 5, max_queue_size=1)
+        self.assertEqual(0, next(it)[1])
+        it.close()
+        self.assertEqual([], list(it))
+        # The session is usable again straight away
+        self.assertEqual(5, self.ra.get_latest_revnum())
+        it.close()
+
+    def test_iter_log_context_manager(self):
+        self.do_commit()
+        with self.ra.iter_log([""], 0, 1) as it:
+            self.assertEqual(0, next(it)[1])
+        self.assertEqual(1, self.ra.get_latest_revnum())
+
+    def test_iter_log_dropped(self):
+        self.do_commit()
+        it = self.ra.iter_log([""], 0, 1, max_queue_size=1)
+        next(it)
+        del it
+        self.assertEqual(1, self.ra.get_latest_revnum())
+
+    def test_iter_log_entry_type(self):
+        self.do_commit()
+        returned = list(self.ra.iter_log(None, 0, 1,
+            discover_changed_paths=True, entry_type=ra.LogEntry,
+            revprops=["svn:date", "svn:author", "svn:log"]))
+        self.assertEqual(2, len(returned))
+        entry = returned[1]
+        self.assertIsInstance(entry, ra.LogEntry)
+        self.assertEqual(1, entry.revnum)
+        self.assertEqual(entry.revprops["svn:author"], entry.author)
+        self.assertEqual(entry.revprops["svn:log"], entry.message)
+        self.assertEqual(entry.revprops["svn:date"], entry.date)
+        self.assertEqual({'/foo': ('A', None, -1, NODE_DIR)},
+            entry.changed_paths)
+        self.assertIs(entry.changed_paths, entry.changed_paths)
+        (paths, revnum, props, has_children) = entry
+        self.assertEqual(1, revnum)
+        self.assertIs(entry.changed_paths, paths)
+        self.assertFalse(has_children)
+        self.assertIs(None, returned[0].changed_paths)
+
+    def test_iter_log_invalid_entry_type(self):
+        self.assertRaises(TypeError, self.ra.iter_log, [""], 0, 0,
+            entry_type=dict)
+
+    def test_iter_log_negative_queue_size(self):
+        self.assertRaises(ValueError, self.ra.iter_log, [""], 0, 0,
+            max_queue_size=-1)
+
+    def test_get_log_entry_type(self):
+        returned = []
+        self.do_commit()
+        self.ra.get_log(returned.append, None, 0, 1,
+            discover_changed_paths=True, entry_type=ra.LogEntry,
+            revprops=["svn:author"])
+        self.assertEqual([0, 1], [e.revnum for e in returned])
+        self.assertEqual(["svn:author"], list(returned[1].revprops.keys()))
+        self.assertEqual(None, returned[1].message)
+        self.assertEqual(['/foo'], list(returned[1].changed_paths.keys()))
+
     def test_get_log(self):
         returned = []
         def cb(*args):
@@ -336,6 +433,81 @@ class TestRemoteAccess(SubversionTestCase):
         stream.seek(0)
         self.assertEqual(b"a", stream.read())
 
+    def test_get_file_path(self):
+        cb = self.commit_editor()
+        cb.add_file("bar").modify(b"contents")
+        cb.close()
+
+        path = os.path.join(self.test_dir, "bar-out")
+        (fetched_rev, props) = self.ra.get_file("bar", path, 1)
+        self.assertEqual(1, fetched_rev)
+        with open(path, "rb") as f:
+            self.assertEqual(b"contents", f.read())
+
+    def test_get_file_fd(self):
+        cb = self.commit_editor()
+        cb.add_file("bar").modify(b"contents")
+        cb.close()
+
+        path = os.path.join(self.test_dir, "bar-out")
+        with open(path, "wb") as f:
+            f.write(b"header ")
+            f.flush()
+            self.assertEqual(1, self.ra.get_file("bar", f.fileno(), 1)[0])
+        with open(path, "rb") as f:
+            self.assertEqual(b"header contents", f.read())
+
+    def test_get_file_into(self):
+        cb = self.commit_editor()
+        cb.add_file("bar").modify(b"contents")
+        cb.close()
+
+        buf = bytearray(20)
+        (fetched_rev, props, size) = self.ra.get_file_into("bar", buf, 1)
+        self.assertEqual(1, fetched_rev)
+        self.assertEqual(8, size)
+        self.assertEqual(b"contents", buf[:size])
+
+    def test_get_file_into_too_small(self):
+        cb = self.commit_editor()
+        cb.add_file("bar").modify(b"contents")
+        cb.close()
+
+        self.assertRaises(OSError, self.ra.get_file_into, "bar",
+                          bytearray(4), 1)
+
+    def test_get_file_into_readonly(self):
+        self.assertRaises(BufferError, self.ra.get_file_into, "bar",
+                          b"readonly", 1)
+
+    def test_get_file_busy_keeps_destination(self):
+        path = os.path.join(self.test_dir, "bar-out")
+        with open(path, "wb") as f:
+            f.write(b"existing")
+
+        editor = self.ra.get_commit_editor({"svn:log": "foo"})
+        self.assertRaises(ra.BusyException, self.ra.get_file, "bar", path)
+        editor.abort()
+        with open(path, "rb") as f:
+            self.assertEqual(b"existing", f.read())
+
+    def test_get_file_invalid_destination(self):
+        self.assertRaises(TypeError, self.ra.get_file, "bar", 4.5, 1)
+        self.assertRaises(TypeError, self.ra.get_file, "bar", bytearray(8), 1)
+
+    def test_get_file_progress(self):
+        cb = self.commit_editor()
+        cb.add_file("bar").modify(b"contents")
+        cb.close()
+
+        reports = []
+        stream = BytesIO()
+        self.ra.get_file("bar", stream, 1,
+                         progress_cb=lambda *args: reports.append(args))
+        self.assertEqual(b"contents", stream.getvalue())
+        self.assertEqual(8, reports[-1][0])
+        self.assertTrue(reports[-1][1] >= 0)
+
     def test_get_locations_root(self):
         self.assertEqual({0: "/"}, self.ra.get_locations("", 0, [0]))
 
@@ -363,6 +535,41 @@ class TestRemoteAccess(SubversionTestCase):
         ret = self.ra.stat("bar", 1)
         self.assertEqual(set(['last_author', 'kind', 'created_rev', 'has_props', 'time', 'size']), set(ret.keys()))
 
+    def test_stat_many(self):
+        cb = self.commit_editor()
+        cb.add_dir("bar")
+        cb.close()
+
+        ret = self.ra.stat_many(["bar", "nonexistent", ""], 1)
+        self.assertEqual(3, len(ret))
+        self.assertEqual(NODE_DIR, ret[0]["kind"])
+        self.assertIs(None, ret[1])
+        self.assertEqual(NODE_DIR, ret[2]["kind"])
+        self.assertRaises(ValueError, self.ra.stat_many, ["/bar"], 1)
+        # The session is released again
+        self.assertEqual(1, self.ra.get_latest_revnum())
+
+    def test_replay_range_parallel(self):
+        for i in range(4):
+            cb = self.commit_editor()
+            cb.add_dir("dir%d" % i)
+            cb.close()
+        sessions = [self.ra, ra.RemoteAccess(self.repos_url,
+                auth=ra.Auth([ra.get_username_provider()]))]
+        recorders = {}
+        def start_rev_cb(revnum, revprops):
+            recorders[revnum] = ra.EditorRecorder()
+            return recorders[revnum].editor()
+        finished = []
+        def finish_rev_cb(revnum, revprops, editor):
+            finished.append(revnum)
+        ra.replay_range_parallel(sessions, 1, 4, 0,
+            (start_rev_cb, finish_rev_cb), chunk_size=1)
+        self.assertEqual([1, 2, 3, 4], finished)
+        for i in range(4):
+            self.assertIn("add_directory",
+                [op[1] for op in recorders[i + 1].ops])
+
     def test_get_locations_dir(self):
         cb = self.commit_editor()
         cb.add_dir("bar")
@@ -463,3 +670,101 @@ class AuthTests(TestCase):
 
     def test_platform_auth_providers(self):
         ra.Auth(ra.get_platform_specific_client_providers())
+
+
+class FakeReplaySession(object):
+    """Session that replays each revision as an edit of one file."""
+
+    def __init__(self, fail_at=None):
+        self.fail_at = fail_at
+        self.replayed = []
+
+    def replay_range(self, start, end, low_water_mark, cbs, send_deltas=True):
+        (start_rev_cb, finish_rev_cb) = cbs
+        for revnum in range(start, end + 1):
+            if revnum == self.fail_at:
+                raise SubversionException("Replay failed", 1)
+            revprops = {"svn:log": "Revision %d" % revnum}
+            editor = start_rev_cb(revnum, revprops)
+            editor.set_target_revision(revnum)
+            root = editor.open_root(revnum - 1)
+            f = root.open_file("file", revnum - 1)
+            handler = f.apply_textdelta(None)
+            handler((0, 0, 1, 0, [(2, 0, 1)], b"%d" % revnum))
+            handler(None)
+            f.close()
+            root.close()
+            editor.close()
+            finish_rev_cb(revnum, revprops, editor)
+            self.replayed.append(revnum)
+
+
+class ReplayRangeParallelTests(TestCase):
+
+    def replay(self, sessions, start, end, **kwargs):
+        self.delivered = delivered = []
+
+        class Editor(object):
+
+            def __init__(self, revnum):
+                self.revnum = revnum
+
+            def set_target_revision(self, revnum):
+                delivered.append(("target", revnum))
+
+            def open_root(self, base_revnum):
+                return self
+
+            def open_file(self, path, base_revnum):
+                return self
+
+            def apply_textdelta(self, base_checksum):
+                return lambda window: delivered.append(("window", window))
+
+            def close(self):
+                pass
+
+        def start_rev_cb(revnum, revprops):
+            delivered.append(("start", revnum, revprops["svn:log"]))
+            return Editor(revnum)
+
+        def finish_rev_cb(revnum, revprops, editor):
+            delivered.append(("finish", revnum))
+
+        ra.replay_range_parallel(sessions, start, end, 0,
+            (start_rev_cb, finish_rev_cb), **kwargs)
+        return delivered
+
+    def test_order(self):
+        sessions = [FakeReplaySession() for i in range(3)]
+        delivered = self.replay(sessions, 1, 50, chunk_size=4, window=10)
+        self.assertEqual(list(range(1, 51)),
+            [d[1] for d in delivered if d[0] == "start"])
+        self.assertEqual([
+            ("start", 1, "Revision 1"),
+            ("target", 1),
+            ("window", (0, 0, 1, 0, [(2, 0, 1)], b"1")),
+            ("window", None),
+            ("finish", 1)], delivered[:5])
+        self.assertEqual(list(range(1, 51)),
+            sorted(sum([s.replayed for s in sessions], [])))
+
+    def test_window_one(self):
+        sessions = [FakeReplaySession() for i in range(2)]
+        delivered = self.replay(sessions, 0, 9, chunk_size=3, window=1)
+        self.assertEqual(list(range(10)),
+            [d[1] for d in delivered if d[0] == "finish"])
+
+    def test_error(self):
+        sessions = [FakeReplaySession(fail_at=7), FakeReplaySession(fail_at=7)]
+        self.assertRaises(SubversionException, self.replay, sessions, 1, 20,
+            chunk_size=2)
+        # Revisions before the failing one are still delivered
+        self.assertEqual(list(range(1, 7)),
+            [d[1] for d in self.delivered if d[0] == "finish"])
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, ra.replay_range_parallel, [], 1, 2, 0,
+            (None, None))
+        self.assertRaises(ValueError, ra.replay_range_parallel,
+            [FakeReplaySession()], 1, 2, 0, (None, None), window=0)
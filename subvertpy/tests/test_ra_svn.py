@@ -0,0 +1,679 @@
+# Copyright (C) 2006-2008 Jelmer Vernooij <jelmer@samba.org>
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2.1 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for subvertpy.ra_svn."""
+
+import asyncio
+from io import BytesIO
+import os
+import threading
+
+from subvertpy import (
+    ERR_FS_NOT_FOUND,
+    ERR_RA_SVN_CONNECTION_CLOSED,
+    SubversionException,
+    )
+from subvertpy.marshall import (
+    Unmarshaller,
+    literal,
+    )
+from subvertpy.delta import (
+    SVNDIFF_VERSIONS,
+    apply_txdelta_handler,
+    send_stream,
+    )
+from subvertpy.ra_svn import (
+    AsyncSVNClient,
+    AsyncSVNServer,
+    MultiplexingSSHVendor,
+    SSHVendor,
+    SVNClient,
+    SVNClientPool,
+    SVNConnection,
+    SVNServer,
+    ThreadingTCPSVNServer,
+    choose_svndiff_version,
+    )
+from subvertpy.server import (
+    LogEntry,
+    ServerBackend,
+    ServerRepositoryBackend,
+    )
+from subvertpy.tests import TestCase
+
+
+class SVNConnectionTests(TestCase):
+
+    def test_recv_msg_chunked(self):
+        data = b"( success ( 1:a ) ) ( success ( ) ) "
+        conn = SVNConnection(BytesIO(data).read1, None, recv_size=4)
+        self.assertEqual(["success", [b"a"]], conn.recv_msg())
+        self.assertEqual(["success", []], conn.recv_msg())
+        self.assertEqual(len(data), conn.bytes_received)
+        self.assertEqual(9, conn.recv_calls)
+
+    def test_recv_msg_single_read(self):
+        data = b"( success ( 1:a ) ) ( success ( ) ) "
+        conn = SVNConnection(BytesIO(data).read1, None)
+        conn.recv_msg()
+        conn.recv_msg()
+        self.assertEqual(1, conn.recv_calls)
+
+    def test_recv_msg_into(self):
+        data = b"( success ( 5:abcde ) ) 42 "
+        conn = SVNConnection(None, None, recv_size=8,
+                             recv_into_fn=BytesIO(data).readinto)
+        self.assertEqual(["success", [b"abcde"]], conn.recv_msg())
+        self.assertEqual(42, conn.recv_msg())
+        self.assertEqual(len(data), conn.bytes_received)
+
+    def test_recv_msg_closed(self):
+        conn = SVNConnection(BytesIO(b"( success ").read1, None)
+        with self.assertRaises(SubversionException) as cm:
+            conn.recv_msg()
+        self.assertEqual(ERR_RA_SVN_CONNECTION_CLOSED, cm.exception.args[1])
+
+    def test_send_msg(self):
+        sent = []
+        conn = SVNConnection(None, lambda data: sent.append(bytes(data)))
+        conn.send_msg([1, b"a"])
+        conn.send_msg([2])
+        self.assertEqual([b"( 1 1:a ) ", b"( 2 ) "], sent)
+        self.assertEqual(2, conn.send_calls)
+        self.assertEqual(16, conn.bytes_sent)
+
+    def test_send_msg_partial(self):
+        out = BytesIO()
+        def send(data):
+            return out.write(data[:3])
+        conn = SVNConnection(None, send)
+        conn.send_msg([literal("success"), []])
+        self.assertEqual(b"( success ( ) ) ", out.getvalue())
+        self.assertEqual(6, conn.send_calls)
+
+    def test_send_msg_pipelined(self):
+        out = BytesIO()
+        conn = SVNConnection(BytesIO(b"( success ( ) ) ").read1, out.write,
+                             send_size=40)
+        conn.pipelined = True
+        conn.send_msg([literal("target-rev"), [1]])
+        self.assertEqual(b"", out.getvalue())
+        conn.send_msg([literal("open-root"), [[], b"d"]])
+        self.assertEqual(b"( target-rev ( 1 ) ) ( open-root ( ( ) 1:d ) ) ",
+                         out.getvalue())
+        conn.send_msg([literal("close-edit"), []])
+        self.assertEqual(1, conn.send_calls)
+        # Pending messages are sent before waiting for a response
+        self.assertEqual(["success", []], conn.recv_msg())
+        self.assertEqual(2, conn.send_calls)
+        self.assertTrue(out.getvalue().endswith(b"( close-edit ( ) ) "))
+
+
+class SSHVendorTests(TestCase):
+
+    def test_args(self):
+        self.assertEqual(["ssh", "-x", "-p", "2222", "bob@example.com"],
+            SSHVendor()._ssh_args("bob", "example.com", 2222))
+
+    def test_multiplexing_args(self):
+        vendor = MultiplexingSSHVendor(control_dir="/tmp/ctl", persist=60)
+        self.assertEqual(["ssh", "-x", "-o", "ControlPath=/tmp/ctl/%C",
+                          "-o", "ControlMaster=auto",
+                          "-o", "ControlPersist=60", "example.com"],
+            vendor._ssh_args(None, "example.com", None))
+
+    def test_multiplexing_control_dir(self):
+        vendor = MultiplexingSSHVendor()
+        self.assertTrue(os.path.isdir(vendor.control_dir))
+        vendor.close()
+        self.assertFalse(os.path.exists(vendor.control_dir))
+
+
+class ChooseSvndiffVersionTests(TestCase):
+
+    def test_none(self):
+        self.assertEqual(0, choose_svndiff_version(["edit-pipeline"]))
+
+    def test_svndiff1(self):
+        self.assertEqual(1, choose_svndiff_version(["svndiff1"]))
+
+    def test_svndiff2(self):
+        self.assertEqual(max(SVNDIFF_VERSIONS), choose_svndiff_version(
+            ["svndiff1", "accepts-svndiff2"]))
+
+
+class ScriptedServer(object):
+    """svn:// server that answers each command with canned responses."""
+
+    greeting = [
+        b"( success ( 2 2 ( ) ( edit-pipeline svndiff1 ) ) ) ",
+        b"( success ( ( ANONYMOUS ) 0: ) ) ",
+        b"( success ( ) ) ( success ( 4:uuid 12:svn://h/repo ) ) ",
+        ]
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.received = []
+
+    async def handle(self, reader, writer):
+        decoder = Unmarshaller()
+        greeting = list(self.greeting)
+        writer.write(greeting.pop(0))
+        while True:
+            data = await reader.read(1024)
+            if not data:
+                break
+            decoder.feed(data)
+            for msg in decoder:
+                if greeting:
+                    writer.write(greeting.pop(0))
+                else:
+                    self.received.append(msg)
+                    writer.write(self.responses[msg[0]])
+        writer.close()
+
+    def run(self, fn):
+        """Run a coroutine function with a client connected to the server."""
+        async def main():
+            server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                async with AsyncSVNClient(
+                        "svn://127.0.0.1:%d/repo" % port) as client:
+                    return await fn(client)
+            finally:
+                server.close()
+                await server.wait_closed()
+        return asyncio.run(main())
+
+
+class AsyncSVNClientTests(TestCase):
+
+    def test_handshake(self):
+        server = ScriptedServer({})
+        async def check(client):
+            self.assertTrue(client.setup_time >= 0)
+            return (client.get_uuid(), client.get_repos_root(),
+                    client.svndiff_version)
+        self.assertEqual((b"uuid", b"svn://h/repo", 1), server.run(check))
+
+    def test_unsupported_scheme(self):
+        self.assertRaises(NotImplementedError, AsyncSVNClient,
+                          "svn+ssh://example.com/repo")
+
+    def test_get_latest_revnum(self):
+        server = ScriptedServer({
+            "get-latest-rev": b"( success ( ( ) 0: ) ) ( success ( 42 ) ) "})
+        async def check(client):
+            return await client.get_latest_revnum()
+        self.assertEqual(42, server.run(check))
+        self.assertEqual([["get-latest-rev", []]], server.received)
+
+    def test_stat(self):
+        server = ScriptedServer({
+            "stat": b"( success ( ( ) 0: ) ) "
+                    b"( success ( ( 3:foo 4:file 12 0 3 ( ) ( ) ) ) ) "})
+        async def check(client):
+            return await client.stat(b"foo", 5)
+        self.assertEqual({"name": b"foo", "kind": b"file", "size": 12,
+                          "has-props": False, "created-rev": 3},
+                         server.run(check))
+        self.assertEqual([["stat", [b"foo", [5]]]], server.received)
+
+    def test_stat_missing(self):
+        server = ScriptedServer({
+            "stat": b"( success ( ( ) 0: ) ) ( success ( ) ) "})
+        async def check(client):
+            return await client.stat(b"foo")
+        self.assertIs(None, server.run(check))
+
+    def test_get_dir(self):
+        server = ScriptedServer({
+            "get-dir": b"( success ( ( ) 0: ) ) ( success ( 4 "
+                       b"( ( 7:svn:foo 3:bar ) ) "
+                       b"( ( 1:a 3:dir 0 0 2 ( ) ( ) ) ) ) ) "})
+        async def check(client):
+            return await client.get_dir(b"")
+        (dirents, fetch_rev, props) = server.run(check)
+        self.assertEqual(4, fetch_rev)
+        self.assertEqual({b"svn:foo": b"bar"}, props)
+        self.assertEqual([b"a"], list(dirents))
+
+    def test_rev_proplist(self):
+        server = ScriptedServer({
+            "rev-proplist": b"( success ( ( ) 0: ) ) "
+                            b"( success ( ( ( 7:svn:log 3:msg ) ) ) ) "})
+        async def check(client):
+            return await client.rev_proplist(1)
+        self.assertEqual({b"svn:log": b"msg"}, server.run(check))
+
+    def test_failure(self):
+        server = ScriptedServer({
+            "get-latest-rev": b"( success ( ( ) 0: ) ) "
+                              b"( failure ( ( 160006 3:bad 0: 0 ) ) ) "})
+        async def check(client):
+            try:
+                await client.get_latest_revnum()
+            except SubversionException as e:
+                return e.args
+        self.assertEqual((b"bad", 160006), server.run(check))
+
+    def test_log(self):
+        server = ScriptedServer({
+            "log": b"( success ( ( ) 0: ) ) "
+                   b"( ( ) 1 ( 3:bob ) ( ) ( 3:one ) ) "
+                   b"( ( ) 2 ( ) ( ) ( 3:two ) ) done ( success ( ) ) ",
+            "get-latest-rev": b"( success ( ( ) 0: ) ) ( success ( 2 ) ) "})
+        async def check(client):
+            entries = []
+            async for (paths, rev, props, has_children) in client.log(
+                    [b""], 1, 2):
+                entries.append((rev, props))
+            return entries, await client.get_latest_revnum()
+        (entries, revnum) = server.run(check)
+        self.assertEqual([
+            (1, {"svn:author": b"bob", "svn:log": b"one"}),
+            (2, {"svn:log": b"two"})], entries)
+        self.assertEqual(2, revnum)
+
+    def test_log_break(self):
+        server = ScriptedServer({
+            "log": b"( success ( ( ) 0: ) ) "
+                   b"( ( ) 1 ( ) ( ) ( ) ) ( ( ) 2 ( ) ( ) ( ) ) "
+                   b"done ( success ( ) ) ",
+            "get-latest-rev": b"( success ( ( ) 0: ) ) ( success ( 2 ) ) "})
+        async def check(client):
+            entries = client.log([b""], 1, 2)
+            async for (paths, rev, props, has_children) in entries:
+                break
+            await entries.aclose()
+            # The remaining entries have been consumed
+            return await client.get_latest_revnum()
+        self.assertEqual(2, server.run(check))
+
+
+class FakeClient(object):
+
+    def __init__(self, url, root="svn://example.com/repo"):
+        self.url = url
+        self.root = root
+        self.busy = False
+        self.healthy = True
+        self.closed = False
+
+    def get_repos_root(self):
+        return self.root
+
+    def check_connection(self):
+        return self.healthy
+
+    def reparent(self, url):
+        self.url = url
+
+    def close(self):
+        self.closed = True
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class SVNClientPoolTests(TestCase):
+
+    def setUp(self):
+        super(SVNClientPoolTests, self).setUp()
+        self.clock = FakeClock()
+
+    def make_pool(self, **kwargs):
+        return SVNClientPool(client_factory=FakeClient, clock=self.clock,
+                             **kwargs)
+
+    def test_reuse(self):
+        pool = self.make_pool()
+        client = pool.acquire("svn://example.com/repo/trunk")
+        pool.release(client)
+        self.assertIs(client, pool.acquire("svn://example.com/repo/branches"))
+        self.assertEqual("svn://example.com/repo/branches", client.url)
+        self.assertEqual(1, pool.connects)
+        self.assertEqual(1, pool.reuses)
+
+    def test_other_root(self):
+        pool = self.make_pool()
+        client = pool.acquire("svn://example.com/repo")
+        pool.release(client)
+        other = pool.acquire("svn://example.com/repo2")
+        self.assertIsNot(client, other)
+        self.assertEqual(2, len(pool))
+        self.assertEqual(1, pool.idle_count)
+
+    def test_unhealthy(self):
+        pool = self.make_pool()
+        client = pool.acquire("svn://example.com/repo")
+        pool.release(client)
+        client.healthy = False
+        self.assertIsNot(client, pool.acquire("svn://example.com/repo"))
+        self.assertTrue(client.closed)
+        self.assertEqual(1, len(pool))
+
+    def test_release_busy(self):
+        pool = self.make_pool()
+        client = pool.acquire("svn://example.com/repo")
+        client.busy = True
+        pool.release(client)
+        self.assertTrue(client.closed)
+        self.assertEqual(0, len(pool))
+
+    def test_idle_timeout(self):
+        pool = self.make_pool(idle_timeout=10)
+        client = pool.acquire("svn://example.com/repo")
+        pool.release(client)
+        self.clock.now = 11
+        pool.evict_idle()
+        self.assertTrue(client.closed)
+        self.assertEqual(0, len(pool))
+
+    def test_full_evicts_idle(self):
+        pool = self.make_pool(max_size=1)
+        client = pool.acquire("svn://example.com/repo")
+        pool.release(client)
+        other = pool.acquire("svn://example.com/repo2")
+        self.assertTrue(client.closed)
+        self.assertEqual(1, len(pool))
+        pool.release(other)
+
+    def test_full_timeout(self):
+        pool = SVNClientPool(max_size=1, client_factory=FakeClient)
+        pool.acquire("svn://example.com/repo")
+        self.assertRaises(TimeoutError, pool.acquire,
+                          "svn://example.com/repo", timeout=0.01)
+
+    def test_session_discards_on_error(self):
+        pool = self.make_pool()
+        try:
+            with pool.session("svn://example.com/repo") as client:
+                raise KeyError("x")
+        except KeyError:
+            pass
+        self.assertTrue(client.closed)
+        self.assertEqual(0, len(pool))
+
+    def test_close(self):
+        pool = self.make_pool()
+        with pool.session("svn://example.com/repo") as client:
+            pass
+        pool.close()
+        self.assertTrue(client.closed)
+        self.assertEqual(0, len(pool))
+
+
+class MemoryRepositoryBackend(ServerRepositoryBackend):
+
+    def __init__(self, latest_revnum=3):
+        self.latest_revnum = latest_revnum
+
+    def get_uuid(self):
+        return "6987ef2d-cd6b-461f-9991-6f1abef3bd59"
+
+    def get_latest_revnum(self):
+        return self.latest_revnum
+
+    contents = b"".join([b"line %d\n" % i for i in range(20000)])
+
+    def get_file(self, path, revnum):
+        if path != b"file":
+            raise SubversionException("Not found", ERR_FS_NOT_FOUND)
+        return (self.latest_revnum, {b"svn:eol-style": b"native"},
+                BytesIO(self.contents))
+
+    def get_dir(self, path, revnum):
+        def entries():
+            for i in range(3):
+                yield {"name": b"f%d" % i, "kind": "file", "size": i,
+                       "has-props": False, "created-rev": 2,
+                       "last-author": b"jelmer"}
+        return (self.latest_revnum, {b"svn:ignore": b"*.o"}, entries())
+
+    def iter_log(self, target_path, start_rev, end_rev, changed_paths,
+                 strict_node, limit, revprops=None):
+        self.log_produced = 0
+        for revnum in range(start_rev, end_rev + 1):
+            self.log_produced += 1
+            yield LogEntry(revnum, b"jelmer", None, b"Revision %d" % revnum,
+                           {b"/trunk": ("M", None, -1)},
+                           {"bzr:revision-id": b"rev%d" % revnum})
+
+    def replay(self, editor, revnum, low_water_mark, send_deltas):
+        root = editor.open_root(revnum - 1)
+        f = root.add_file(b"file")
+        if send_deltas:
+            send_stream(BytesIO(self.contents), f.apply_textdelta())
+        f.close()
+        root.close()
+
+
+class RecordingEditor(object):
+
+    def __init__(self, log, path=None):
+        self.log = log
+        self.path = path
+
+    def open_root(self, base_revnum=None):
+        self.log.append(("open-root", base_revnum))
+        return self
+
+    def add_file(self, path, copyfrom_path=None, copyfrom_rev=-1):
+        self.log.append(("add-file", path))
+        return RecordingEditor(self.log, path)
+
+    def apply_textdelta(self, base_checksum=None):
+        out = BytesIO()
+        apply_window = apply_txdelta_handler(b"", out)
+        def handler(window):
+            apply_window(window)
+            if window is None:
+                self.log.append(("contents", self.path, out.getvalue()))
+        return handler
+
+    def close(self, checksum=None):
+        self.log.append(("close", self.path))
+
+
+class MemoryBackend(ServerBackend):
+
+    def __init__(self):
+        self.repository = MemoryRepositoryBackend()
+
+    def open_repository(self, location):
+        return self.repository, ""
+
+
+class SVNServerTests(TestCase):
+
+    def test_batched_responses(self):
+        data = (b"( 2 ( edit-pipeline ) 10:svn://h/r ) "
+                b"( ANONYMOUS ( 0: ) ) "
+                b"( get-latest-rev ( ) ) ( get-latest-rev ( ) ) ")
+        sent = []
+        server = SVNServer(MemoryBackend(), None,
+                           lambda data: sent.append(bytes(data)),
+                           recv_into_fn=BytesIO(data).readinto)
+        server.serve()
+        # The greeting is sent before the first read; since the client's
+        # messages arrive in a single read, all other responses are sent
+        # together before the server waits for more.
+        self.assertEqual(2, server.send_calls)
+        self.assertTrue(sent[-1].endswith(
+            b"( success ( ( ) 0: ) ) ( success ( 3 ) ) " * 2))
+        self.assertEqual(2, server.recv_calls)
+
+
+class ThreadingTCPSVNServerTests(TestCase):
+
+    def setUp(self):
+        super(ThreadingTCPSVNServerTests, self).setUp()
+        self.server = ThreadingTCPSVNServer(MemoryBackend(),
+            ("127.0.0.1", 0), max_sessions=2)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.shutdown_gracefully, 5)
+        self.url = "svn://127.0.0.1:%d/" % self.server.server_address[1]
+
+    def connect(self):
+        client = SVNClient(self.url)
+        self.addCleanup(client.close)
+        return client
+
+    def test_concurrent(self):
+        clients = [self.connect() for i in range(2)]
+        self.assertEqual([3, 3], [c.get_latest_revnum() for c in clients])
+        self.assertEqual(2, self.server.active_sessions)
+
+    def test_max_sessions(self):
+        clients = [self.connect() for i in range(2)]
+        results = []
+        thread = threading.Thread(
+            target=lambda: results.append(self.connect().get_latest_revnum()))
+        thread.start()
+        thread.join(0.2)
+        self.assertEqual([], results)
+        clients[0].close()
+        thread.join(5)
+        self.assertEqual([3], results)
+
+    def test_get_file(self):
+        client = self.connect()
+        out = BytesIO()
+        self.assertEqual((3, {b"svn:eol-style": b"native"}),
+                         client.get_file(b"file", out))
+        self.assertEqual(MemoryRepositoryBackend.contents, out.getvalue())
+        # The connection is still usable
+        self.assertEqual(3, client.get_latest_revnum())
+
+    def test_get_file_missing(self):
+        client = self.connect()
+        try:
+            client.get_file(b"missing", BytesIO())
+        except SubversionException as e:
+            self.assertEqual(ERR_FS_NOT_FOUND, e.args[1])
+        else:
+            self.fail("Expected SubversionException")
+        self.assertEqual(3, client.get_latest_revnum())
+
+    def test_get_dir(self):
+        client = self.connect()
+        (dirents, fetch_rev, props) = client.get_dir(b"")
+        self.assertEqual(3, fetch_rev)
+        self.assertEqual({b"svn:ignore": b"*.o"}, props)
+        self.assertEqual([b"f0", b"f1", b"f2"], sorted(dirents))
+        self.assertEqual(2, dirents[b"f2"]["size"])
+        self.assertEqual(b"jelmer", dirents[b"f2"]["last-author"])
+
+    def test_replay(self):
+        client = self.connect()
+        log = []
+        client.replay(3, 0, RecordingEditor(log))
+        self.assertEqual([
+            ("open-root", 2),
+            ("add-file", b"file"),
+            ("contents", b"file", MemoryRepositoryBackend.contents),
+            ("close", b"file"),
+            ("close", None)], log)
+        self.assertEqual(3, client.get_latest_revnum())
+
+    def test_log(self):
+        client = self.connect()
+        entries = list(client.log([b""], 1, 3))
+        self.assertEqual([1, 2, 3], [rev for (paths, rev, props, hc)
+                                     in entries])
+        (paths, rev, props, has_children) = entries[0]
+        self.assertEqual({b"/trunk": ("M", None, -1)}, paths)
+        self.assertEqual({"svn:author": b"jelmer", "svn:log": b"Revision 1",
+                          b"bzr:revision-id": b"rev1"}, props)
+
+    def test_log_busy(self):
+        client = self.connect()
+        entries = client.log([b""], 1, 3)
+        next(entries)
+        self.assertTrue(client.busy)
+        self.assertFalse(client.check_connection())
+        list(entries)
+        self.assertFalse(client.busy)
+
+    def test_log_close(self):
+        client = self.connect()
+        entries = client.log([b""], 1, 3)
+        next(entries)
+        entries.close()
+        # The remaining entries have been consumed
+        self.assertFalse(client.busy)
+        self.assertEqual(3, client.get_latest_revnum())
+
+    def test_log_limit(self):
+        client = self.connect()
+        entries = list(client.log([b""], 1, 3, limit=2))
+        self.assertEqual([1, 2], [rev for (paths, rev, props, hc)
+                                  in entries])
+        self.assertEqual(2, self.server._backend.repository.log_produced)
+
+    def test_log_revprops(self):
+        client = self.connect()
+        entries = list(client.log([b""], 1, 1, discover_changed_paths=False,
+                                  revprops=[b"svn:log"]))
+        self.assertEqual([({}, 1, {"svn:log": b"Revision 1"}, None)],
+                         entries)
+
+    def test_log_callback_backend(self):
+        class CallbackRepositoryBackend(MemoryRepositoryBackend):
+            iter_log = ServerRepositoryBackend.iter_log
+            def log(self, send_revision, target_path, start_rev, end_rev,
+                    changed_paths, strict_node, limit):
+                for revnum in range(start_rev, end_rev + 1):
+                    send_revision(revnum, b"jelmer", None, b"msg")
+        self.server._backend.repository = CallbackRepositoryBackend()
+        client = self.connect()
+        self.assertEqual([({}, 1, {"svn:author": b"jelmer", "svn:log": b"msg"},
+                           None)], list(client.log([b""], 1, 1)))
+
+    def test_shutdown_gracefully(self):
+        client = self.connect()
+        client.get_latest_revnum()
+        self.assertEqual(0, self.server.shutdown_gracefully(5))
+        self.assertEqual(0, self.server.active_sessions)
+        self.assertRaises(SubversionException, client.get_latest_revnum)
+
+
+class AsyncSVNServerTests(TestCase):
+
+    def test_serve(self):
+        async def main():
+            server = AsyncSVNServer(MemoryBackend(), max_sessions=4)
+            await server.start("127.0.0.1", 0)
+            url = "svn://127.0.0.1:%d/" % server.server_address[1]
+            clients = [AsyncSVNClient(url) for i in range(4)]
+            await asyncio.gather(*[c.connect() for c in clients])
+            revnums = await asyncio.gather(
+                *[c.get_latest_revnum() for c in clients])
+            active = server.active_sessions
+            forced = await server.shutdown(5)
+            for c in clients:
+                await c.close()
+            return (revnums, active, forced, server.active_sessions)
+        self.assertEqual(([3, 3, 3, 3], 4, 0, 0), asyncio.run(main()))
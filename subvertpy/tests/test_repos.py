@@ -20,7 +20,11 @@ import os
 import textwrap
 
 from subvertpy import repos, SubversionException
-from subvertpy.tests import TestCaseInTempDir, TestCase
+from subvertpy.tests import (
+    SubversionTestCase,
+    TestCaseInTempDir,
+    TestCase,
+    )
 
 
 class VersionTest(TestCase):
@@ -146,3 +150,85 @@ class StreamTests(TestCase):
         self.assertEqual(0, s.write(b""))
         self.assertEqual(2, s.write(b"ab"))
         s.close()
+
+    def test_readinto_empty(self):
+        s = repos.Stream()
+        self.assertEqual(0, s.readinto(bytearray(10)))
+        s.close()
+
+    def test_iter_empty(self):
+        s = repos.Stream()
+        self.assertEqual([], list(s))
+        self.assertEqual([], list(s.chunks(10)))
+        s.close()
+
+    def test_chunks_invalid_size(self):
+        s = repos.Stream()
+        self.assertRaises(ValueError, s.chunks, 0)
+        s.close()
+
+
+class FileContentTests(SubversionTestCase):
+
+    def setUp(self):
+        super(FileContentTests, self).setUp()
+        repos_url = self.make_repository("d")
+        dc = self.get_commit_editor(repos_url)
+        dc.add_file("bar").modify(b"0123456789" * 10)
+        dc.close()
+        self.root = self.open_fs("d").revision_root(1)
+
+    def test_read(self):
+        s = self.root.file_content("bar")
+        self.assertEqual(b"0123", s.read(4))
+        self.assertEqual(b"456789" + b"0123456789" * 9, s.read(200))
+        self.assertEqual(b"", s.read(10))
+
+    def test_readinto(self):
+        s = self.root.file_content("bar")
+        buf = bytearray(64)
+        self.assertEqual(64, s.readinto(buf))
+        self.assertEqual((b"0123456789" * 10)[:64], bytes(buf))
+        self.assertEqual(36, s.readinto(memoryview(buf)[:50]))
+        self.assertEqual((b"0123456789" * 10)[64:], bytes(buf[:36]))
+        self.assertEqual(0, s.readinto(buf))
+
+    def read_chunks(self, chunks):
+        ret = []
+        for chunk in chunks:
+            with chunk:
+                ret.append(bytes(chunk))
+        return ret
+
+    def test_chunks(self):
+        s = self.root.file_content("bar")
+        chunks = self.read_chunks(s.chunks(30))
+        self.assertEqual([30, 30, 30, 10], [len(c) for c in chunks])
+        self.assertEqual(b"0123456789" * 10, b"".join(chunks))
+
+    def test_chunks_size_not_kept(self):
+        s = self.root.file_content("bar")
+        self.assertEqual([b"0123456789"], self.read_chunks(
+            [next(s.chunks(10))]))
+        chunks = self.read_chunks(s)
+        self.assertEqual(1, len(chunks))
+        self.assertEqual(b"0123456789" * 9, chunks[0])
+
+    def test_iter(self):
+        s = self.root.file_content("bar")
+        chunk = next(iter(s))
+        self.assertIsInstance(chunk, memoryview)
+        self.assertEqual(b"0123456789" * 10, chunk.tobytes())
+
+    def test_chunk_in_use(self):
+        s = self.root.file_content("bar")
+        chunks = s.chunks(30)
+        chunk = next(chunks)
+        self.assertRaises(BufferError, next, chunks)
+        self.assertEqual((b"0123456789" * 10)[:30], chunk.tobytes())
+        chunk.release()
+        self.assertEqual((b"0123456789" * 10)[30:60], next(chunks).tobytes())
+
+    def test_list_raises(self):
+        s = self.root.file_content("bar")
+        self.assertRaises(BufferError, list, s.chunks(30))
@@ -909,36 +909,58 @@ apr_file_t *apr_file_from_object(PyObject *object, apr_pool_t *pool)
 	return fp;
 }
 
+/* Default size of the chunks returned when iterating over a stream */
+#define DEFAULT_STREAM_CHUNK_SIZE (64 * 1024)
+
 static void stream_dealloc(PyObject *self)
 {
 	StreamObject *streamself = (StreamObject *)self;
 
 	apr_pool_destroy(streamself->pool);
+	PyMem_Free(streamself->buf);
 
 	PyObject_Del(self);
 }
 
-static PyObject *stream_init(PyTypeObject *type, PyObject *args, PyObject *kwargs)
+/**
+ * Create a new Stream object. Takes ownership of pool.
+ */
+PyObject *new_stream_object(svn_stream_t *stream, apr_pool_t *pool)
 {
-	char *kwnames[] = { NULL };
 	StreamObject *ret;
 
-	if (!PyArg_ParseTupleAndKeywords(args, kwargs, "", kwnames))
-		return NULL;
-
 	ret = PyObject_New(StreamObject, &Stream_Type);
-	if (ret == NULL)
+	if (ret == NULL) {
+		apr_pool_destroy(pool);
 		return NULL;
+	}
 
-	ret->pool = Pool(NULL);
-	if (ret->pool == NULL)
-		return NULL;
-	ret->stream = svn_stream_empty(ret->pool);
+	ret->pool = pool;
+	ret->stream = stream;
 	ret->closed = FALSE;
+	ret->buf = NULL;
+	ret->buf_size = 0;
+	ret->buf_len = 0;
+	ret->exports = 0;
 
 	return (PyObject *)ret;
 }
 
+static PyObject *stream_init(PyTypeObject *type, PyObject *args, PyObject *kwargs)
+{
+	char *kwnames[] = { NULL };
+	apr_pool_t *pool;
+
+	if (!PyArg_ParseTupleAndKeywords(args, kwargs, "", kwnames))
+		return NULL;
+
+	pool = Pool(NULL);
+	if (pool == NULL)
+		return NULL;
+
+	return new_stream_object(svn_stream_empty(pool), pool);
+}
+
 static PyObject *stream_close(StreamObject *self)
 {
 	if (!self->closed) {
@@ -980,25 +1002,37 @@ static PyObject *stream_read(StreamObject *self, PyObject *args)
 		return PyBytes_FromString("");
 	}
 
-	temp_pool = Pool(NULL);
-	if (temp_pool == NULL) 
-		return NULL;
 	if (len != -1) {
-		char *buffer;
 		apr_size_t size = len;
-		buffer = apr_palloc(temp_pool, len);
-		if (buffer == NULL) {
-			PyErr_NoMemory();
-			apr_pool_destroy(temp_pool);
+		svn_error_t *err;
+
+		if (len < 0) {
+			PyErr_SetString(PyExc_ValueError, "Invalid read size");
 			return NULL;
 		}
-		RUN_SVN_WITH_POOL(temp_pool, svn_stream_read(self->stream, buffer, &size));
-		ret = PyBytes_FromStringAndSize(buffer, size);
-		apr_pool_destroy(temp_pool);
+
+		/* Read straight into the bytes object that is returned */
+		ret = PyBytes_FromStringAndSize(NULL, len);
+		if (ret == NULL)
+			return NULL;
+		Py_BEGIN_ALLOW_THREADS
+		err = svn_stream_read(self->stream, PyBytes_AS_STRING(ret), &size);
+		Py_END_ALLOW_THREADS
+		if (err != NULL) {
+			Py_DECREF(ret);
+			handle_svn_error(err);
+			svn_error_clear(err);
+			return NULL;
+		}
+		if (size != (apr_size_t)len && _PyBytes_Resize(&ret, size) != 0)
+			return NULL;
 		return ret;
 	} else {
 #if ONLY_SINCE_SVN(1, 6)
 		svn_string_t *result;
+		temp_pool = Pool(NULL);
+		if (temp_pool == NULL) 
+			return NULL;
 		RUN_SVN_WITH_POOL(temp_pool, svn_string_from_stream(&result, 
 							   self->stream,
 							   temp_pool,
@@ -1015,10 +1049,219 @@ static PyObject *stream_read(StreamObject *self, PyObject *args)
 	}
 }
 
+static PyObject *stream_readinto(StreamObject *self, PyObject *args)
+{
+	Py_buffer view;
+	apr_size_t size;
+	svn_error_t *err;
+
+	if (!PyArg_ParseTuple(args, "w*", &view))
+		return NULL;
+
+	if (self->closed) {
+		PyBuffer_Release(&view);
+		return PyLong_FromLong(0);
+	}
+
+	size = view.len;
+	Py_BEGIN_ALLOW_THREADS
+	err = svn_stream_read(self->stream, view.buf, &size);
+	Py_END_ALLOW_THREADS
+	PyBuffer_Release(&view);
+	if (err != NULL) {
+		handle_svn_error(err);
+		svn_error_clear(err);
+		return NULL;
+	}
+
+	return PyLong_FromSize_t(size);
+}
+
+typedef struct {
+	PyObject_HEAD
+	StreamObject *stream;
+	Py_ssize_t chunk_size;
+} StreamChunksObject;
+
+static PyObject *new_stream_chunks(StreamObject *stream, Py_ssize_t size)
+{
+	StreamChunksObject *ret;
+
+	ret = PyObject_New(StreamChunksObject, &StreamChunks_Type);
+	if (ret == NULL)
+		return NULL;
+
+	Py_INCREF(stream);
+	ret->stream = stream;
+	ret->chunk_size = size;
+
+	return (PyObject *)ret;
+}
+
+static void stream_chunks_dealloc(PyObject *self)
+{
+	StreamChunksObject *chunks = (StreamChunksObject *)self;
+
+	Py_DECREF(chunks->stream);
+
+	PyObject_Del(self);
+}
+
+static PyObject *stream_chunks_next(StreamChunksObject *chunks)
+{
+	StreamObject *self = chunks->stream;
+	apr_size_t size;
+	svn_error_t *err;
+
+	if (self->closed)
+		return NULL;
+
+	/* Never overwrite data that is still referenced by a chunk */
+	if (self->exports > 0) {
+		PyErr_SetString(PyExc_BufferError,
+			"Previous chunk has to be released before reading the next one");
+		return NULL;
+	}
+
+	if (self->buf_size < chunks->chunk_size) {
+		char *buf = PyMem_Realloc(self->buf, chunks->chunk_size);
+		if (buf == NULL) {
+			PyErr_NoMemory();
+			return NULL;
+		}
+		self->buf = buf;
+		self->buf_size = chunks->chunk_size;
+	}
+
+	size = chunks->chunk_size;
+	Py_BEGIN_ALLOW_THREADS
+	err = svn_stream_read(self->stream, self->buf, &size);
+	Py_END_ALLOW_THREADS
+	if (err != NULL) {
+		self->buf_len = 0;
+		handle_svn_error(err);
+		svn_error_clear(err);
+		return NULL;
+	}
+
+	self->buf_len = size;
+	if (size == 0)
+		return NULL;
+
+	return PyMemoryView_FromObject((PyObject *)self);
+}
+
+PyTypeObject StreamChunks_Type = {
+	PyVarObject_HEAD_INIT(NULL, 0)
+	"repos.StreamChunks", /*	const char *tp_name;  For printing, in format "<module>.<name>" */
+	sizeof(StreamChunksObject), 
+	0,/*	Py_ssize_t tp_basicsize, tp_itemsize;  For allocation */
+	
+	/* Methods to implement standard operations */
+	
+	stream_chunks_dealloc, /*	destructor tp_dealloc;	*/
+	NULL, /*	printfunc tp_print;	*/
+	NULL, /*	getattrfunc tp_getattr;	*/
+	NULL, /*	setattrfunc tp_setattr;	*/
+	NULL, /*	cmpfunc tp_compare;	*/
+	NULL, /*	reprfunc tp_repr;	*/
+	
+	/* Method suites for standard classes */
+	
+	NULL, /*	PyNumberMethods *tp_as_number;	*/
+	NULL, /*	PySequenceMethods *tp_as_sequence;	*/
+	NULL, /*	PyMappingMethods *tp_as_mapping;	*/
+	
+	/* More standard operations (here for binary compatibility) */
+	
+	NULL, /*	hashfunc tp_hash;	*/
+	NULL, /*	ternaryfunc tp_call;	*/
+	NULL, /*	reprfunc tp_str;	*/
+	NULL, /*	getattrofunc tp_getattro;	*/
+	NULL, /*	setattrofunc tp_setattro;	*/
+	
+	/* Functions to access object as input/output buffer */
+	NULL, /*	PyBufferProcs *tp_as_buffer;	*/
+	
+	/* Flags to define presence of optional/expanded features */
+	0, /*	long tp_flags;	*/
+	
+	"Iterator over the chunks of a stream", /*	const char *tp_doc;  Documentation string */
+	
+	/* Assigned meaning in release 2.0 */
+	/* call function for all accessible objects */
+	NULL, /*	traverseproc tp_traverse;	*/
+	
+	/* delete references to contained objects */
+	NULL, /*	inquiry tp_clear;	*/
+	
+	/* Assigned meaning in release 2.1 */
+	/* rich comparisons */
+	NULL, /*	richcmpfunc tp_richcompare;	*/
+	
+	/* weak reference enabler */
+	0, /*	Py_ssize_t tp_weaklistoffset;	*/
+	
+	/* Added in release 2.2 */
+	/* Iterators */
+	PyObject_SelfIter, /*	getiterfunc tp_iter;	*/
+	(iternextfunc)stream_chunks_next, /*	iternextfunc tp_iternext;	*/
+};
+
+static PyObject *stream_chunks(StreamObject *self, PyObject *args, PyObject *kwargs)
+{
+	char *kwnames[] = { "size", NULL };
+	Py_ssize_t size = DEFAULT_STREAM_CHUNK_SIZE;
+
+	if (!PyArg_ParseTupleAndKeywords(args, kwargs, "|n", kwnames, &size))
+		return NULL;
+
+	if (size <= 0) {
+		PyErr_SetString(PyExc_ValueError, "Chunk size must be positive");
+		return NULL;
+	}
+
+	return new_stream_chunks(self, size);
+}
+
+static PyObject *stream_iter(PyObject *self)
+{
+	return new_stream_chunks((StreamObject *)self, DEFAULT_STREAM_CHUNK_SIZE);
+}
+
+static int stream_getbuffer(StreamObject *self, Py_buffer *view, int flags)
+{
+	if (PyBuffer_FillInfo(view, (PyObject *)self, self->buf, self->buf_len,
+						  1, flags) != 0)
+		return -1;
+	self->exports++;
+	return 0;
+}
+
+static void stream_releasebuffer(StreamObject *self, Py_buffer *view)
+{
+	self->exports--;
+}
+
+static PyBufferProcs stream_as_buffer = {
+	(getbufferproc)stream_getbuffer,
+	(releasebufferproc)stream_releasebuffer,
+};
+
 static PyMethodDef stream_methods[] = {
 	{ "read", (PyCFunction)stream_read, METH_VARARGS, NULL },
+	{ "readinto", (PyCFunction)stream_readinto, METH_VARARGS,
+		"S.readinto(buffer) -> int\n"
+		"Read into a writable buffer. Returns the number of bytes read." },
 	{ "write", (PyCFunction)stream_write, METH_VARARGS, NULL },
 	{ "close", (PyCFunction)stream_close, METH_NOARGS, NULL },
+	{ "chunks", (PyCFunction)stream_chunks, METH_VARARGS|METH_KEYWORDS,
+		"S.chunks(size=65536) -> iterator\n"
+		"Iterate over the stream in chunks of at most size bytes.\n"
+		"Chunks are memoryviews of a buffer that is reused, so each chunk\n"
+		"has to be released (for example with a with statement) before\n"
+		"the next one is read; otherwise BufferError is raised.\n"
+		"Iterating over the stream itself uses 64 KiB chunks." },
 	{ NULL, }
 };
 
@@ -1052,7 +1295,7 @@ PyTypeObject Stream_Type = {
 	NULL, /*	setattrofunc tp_setattro;	*/
 	
 	/* Functions to access object as input/output buffer */
-	NULL, /*	PyBufferProcs *tp_as_buffer;	*/
+	&stream_as_buffer, /*	PyBufferProcs *tp_as_buffer;	*/
 	
 	/* Flags to define presence of optional/expanded features */
 	0, /*	long tp_flags;	*/
@@ -1075,7 +1318,7 @@ PyTypeObject Stream_Type = {
 	
 	/* Added in release 2.2 */
 	/* Iterators */
-	NULL, /*	getiterfunc tp_iter;	*/
+	stream_iter, /*	getiterfunc tp_iter;	*/
 	NULL, /*	iternextfunc tp_iternext;	*/
 	
 	/* Attribute descriptor and subclassing stuff */
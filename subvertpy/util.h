@@ -144,8 +144,15 @@ typedef struct {
 	svn_stream_t *stream;
 	apr_pool_t *pool;
 	svn_boolean_t closed;
+	/* Buffer reused for chunks returned when iterating */
+	char *buf;
+	Py_ssize_t buf_size;
+	Py_ssize_t buf_len;
+	Py_ssize_t exports;
 } StreamObject;
 
 extern PyTypeObject Stream_Type;
+extern PyTypeObject StreamChunks_Type;
+PyObject *new_stream_object(svn_stream_t *stream, apr_pool_t *pool);
 
 #endif /* _SUBVERTPY_UTIL_H_ */
@@ -1548,7 +1548,6 @@ static PyObject *crop_tree(PyObject *self, PyObject *args)
 static PyObject *translated_stream(PyObject *self, PyObject *args)
 {
 	char *path, *versioned_file;
-	StreamObject *ret;
 	svn_stream_t *stream;
 	AdmObject *admobj = (AdmObject *)self;
 	apr_pool_t *stream_pool;
@@ -1568,15 +1567,7 @@ static PyObject *translated_stream(PyObject *self, PyObject *args)
 		svn_wc_translated_stream(&stream, path, versioned_file, admobj->adm, 
 			flags, stream_pool));
 
-	ret = PyObject_New(StreamObject, &Stream_Type);
-	if (ret == NULL)
-		return NULL;
-
-	ret->pool = stream_pool;
-	ret->closed = FALSE;
-	ret->stream = stream;
-
-	return (PyObject *)ret;
+	return new_stream_object(stream, stream_pool);
 #else
 	PyErr_SetString(PyExc_NotImplementedError,
 		"translated_stream() is only available on Subversion >= 1.5");
@@ -2483,7 +2474,6 @@ static PyObject *get_pristine_contents(PyObject *self, PyObject *args)
 	apr_pool_t *temp_pool;
 #if ONLY_SINCE_SVN(1, 6)
 	apr_pool_t *stream_pool;
-	StreamObject *ret;
 	svn_stream_t *stream;
 #else
 	PyObject *ret;
@@ -2512,15 +2502,7 @@ static PyObject *get_pristine_contents(PyObject *self, PyObject *args)
 		Py_RETURN_NONE;
 	}
 
-	ret = PyObject_New(StreamObject, &Stream_Type);
-	if (ret == NULL)
-		return NULL;
-
-	ret->pool = stream_pool;
-	ret->closed = FALSE;
-	ret->stream = stream;
-
-	return (PyObject *)ret;
+	return new_stream_object(stream, stream_pool);
 #else
 	temp_pool = Pool(NULL);
 	if (temp_pool == NULL)
@@ -2707,6 +2689,9 @@ PyMODINIT_FUNC PyInit_wc(void)
 	if (PyType_Ready(&Stream_Type) < 0)
 		return mod;
 
+	if (PyType_Ready(&StreamChunks_Type) < 0)
+		return mod;
+
 	if (PyType_Ready(&CommittedQueue_Type) < 0)
 		return mod;
 